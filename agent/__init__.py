@@ -1,3 +1,12 @@
-from .agent import agent
+import importlib
 
-__all__ = ["agent"]
\ No newline at end of file
+__all__ = ["agent", "answer_batch", "use_database"]
+
+def __getattr__(name: str):
+    # The graph is compiled on first use, so that importing a submodule (e.g. `agent.utils.batch`) stays cheap.
+    if name not in __all__:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(".agent", __name__)
+    for exported in __all__:
+        globals()[exported] = getattr(module, exported)
+    return globals()[name]
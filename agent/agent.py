@@ -1,21 +1,44 @@
+import sys
+import json
+import asyncio
+from typing import AsyncIterator
 from dotenv import load_dotenv
 from langgraph.graph import StateGraph, START
-from utils import *
+if __package__:
+    from .utils import *
+else:
+    # Run as a script (`python agent/agent.py`), with the agent directory on sys.path.
+    from utils import *
 
 load_dotenv()
 
 builder = StateGraph(State, config_schema=Configuration)
 
 ## Adding nodes to the graph
-builder.add_node(list_tables)
-builder.add_node(call_get_schema)
-builder.add_node(get_schema_node, "get_schema")
-builder.add_node(generate_query)
-builder.add_node(check_query)
-builder.add_node(run_query_node, "run_query")
+# Every node is traced: its wall time, LLM tokens and queries are sent as a span on the run's custom stream.
+builder.add_node(traced_node(compact_context))
+builder.add_node(traced_node(lookup_cached_query))
+builder.add_node(traced_node(select_tables))
+builder.add_node(traced_node(list_tables))
+builder.add_node(traced_node(call_get_schema))
+builder.add_node("get_schema", traced_node(get_schema_node, "get_schema"))
+builder.add_node(traced_node(generate_query))
+builder.add_node(traced_node(check_query))
+builder.add_node(traced_node(reject_query))
+builder.add_node("run_query", traced_node(run_query_node, "run_query"))
+builder.add_node(traced_node(remember_query))
 
 ## Adding edges to the graph
-builder.add_edge(START, "list_tables")
+builder.add_edge(START, "compact_context")
+builder.add_edge("compact_context", "lookup_cached_query")
+builder.add_conditional_edges(
+    "lookup_cached_query",
+    route_cached_query,
+)
+builder.add_conditional_edges(
+    "select_tables",
+    route_selected_tables,
+)
 builder.add_edge("list_tables", "call_get_schema")
 builder.add_edge("call_get_schema", "get_schema")
 builder.add_edge("get_schema", "generate_query")
@@ -24,13 +47,37 @@ builder.add_conditional_edges(
     should_continue,
 )
 builder.add_edge("check_query", "run_query")
-builder.add_edge("run_query", "generate_query")
+builder.add_edge("reject_query", "generate_query")
+builder.add_edge("run_query", "remember_query")
+builder.add_edge("remember_query", "generate_query")
 
 agent = builder.compile()
 
-agent.get_graph().draw_mermaid_png(output_file_path="./assets/agent_graph.png")
+def answer_batch(questions: list[str], settings: BatchSettings | None = None) -> AsyncIterator[BatchAnswer]:
+    """Answers a batch of questions with the compiled graph, yielding each answer as it completes.
+    See `answer_questions` for the limits, which come from the BATCH_* environment variables by default."""
+    return answer_questions(agent, questions, settings)
+
+async def _print_batch(questions: list[str]) -> None:
+    async for answer in answer_batch(questions):
+        print(json.dumps(answer.to_dict()), flush=True)
+
+def draw_graph(output_file_path: str = "./assets/agent_graph.png") -> None:
+    """Renders the graph diagram to a PNG file. Rendering goes through the Mermaid web service,
+    so it only runs on request: `python agent/agent.py --draw-graph`."""
+    agent.get_graph().draw_mermaid_png(output_file_path=output_file_path)
 
 if __name__ == "__main__":
+    if "--draw-graph" in sys.argv:
+        draw_graph()
+        sys.exit(0)
+
+    # `python agent/agent.py --batch questions.txt`: one question per line, answers printed as JSON lines.
+    if "--batch" in sys.argv:
+        with open(sys.argv[sys.argv.index("--batch") + 1], encoding="utf-8") as f:
+            asyncio.run(_print_batch([line.strip() for line in f if line.strip()]))
+        sys.exit(0)
+
     question = "What is the total number of deaths due to rainy conditions?"
 
     for step in agent.stream(
@@ -1,7 +1,19 @@
-from .state import State
-from .tools import *
-from .config import Configuration
-from .db_conn import DBConnection
+"""
+The graph's state, nodes and tools. Names are imported from their submodule on first use, so that importing
+one light submodule (e.g. `agent.utils.batch` for `BatchSettings`) does not load LangGraph.
+"""
+import importlib
+
+# The submodule of each name; the graph's nodes come from `tools`.
+_SUBMODULES = {
+    "State": ".state",
+    "Configuration": ".config",
+    "DBConnection": ".db_conn",
+    "traced_node": ".tracing",
+    "BatchSettings": ".batch",
+    "BatchAnswer": ".batch",
+    "answer_questions": ".batch",
+}
 
 __all__ = [
     "State", 
@@ -13,5 +25,24 @@ __all__ = [
     "generate_query", 
     "check_query", 
     "should_continue",
-    "DBConnection"
-]
\ No newline at end of file
+    "reject_query",
+    "compact_context",
+    "lookup_cached_query",
+    "route_cached_query",
+    "remember_query",
+    "select_tables",
+    "route_selected_tables",
+    "use_database",
+    "DBConnection",
+    "traced_node",
+    "BatchSettings",
+    "BatchAnswer",
+    "answer_questions"
+]
+
+def __getattr__(name: str):
+    if name not in __all__:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_SUBMODULES.get(name, ".tools"), __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,131 @@
+"""
+Answers a batch of independent questions with the compiled graph, a bounded number at a time.
+
+Each question runs as its own graph run, without a thread, under a time limit; answers are yielded as the
+runs complete, so a caller can stream them. Schema lookups are shared by the runs of a batch
+(see `shared_schema_lookups`), and its questions share the question and query result caches as any runs do.
+
+The graph's modules are only imported once a batch runs, so the web app can import `BatchSettings` at startup.
+"""
+import asyncio
+import os
+import time
+from dataclasses import asdict, dataclass, fields
+from typing import TYPE_CHECKING, AsyncIterator
+
+if TYPE_CHECKING:
+    from langchain_core.messages import BaseMessage
+
+@dataclass(kw_only=True)
+class BatchSettings:
+    """How a batch of questions runs. Every field can be overridden by an environment variable named after
+    it, prefixed with 'BATCH_' (e.g. BATCH_CONCURRENCY)."""
+    concurrency: int = 4          # questions answered at once
+    timeout: float = 120.0        # seconds a question may take before its run is cancelled
+    max_questions: int = 500      # questions accepted in one batch
+
+    @classmethod
+    def from_env(cls, **overrides) -> "BatchSettings":
+        """Create settings from the environment, with explicit overrides taking precedence."""
+        values = {}
+        for f in fields(cls):
+            env_value = os.environ.get(f"BATCH_{f.name.upper()}")
+            if env_value is not None:
+                values[f.name] = float(env_value) if f.type in (float, "float") else int(env_value)
+        values.update(overrides)
+        return cls(**values)
+
+@dataclass
+class BatchAnswer:
+    """The outcome of one question of a batch. `index` is the question's position in the batch."""
+    index: int
+    question: str
+    answer: str | None = None
+    query: str | None = None      # the last query run for the answer
+    error: str | None = None
+    elapsed: float = 0.0
+
+    def to_dict(self) -> dict:
+        return {field.name: getattr(self, field.name) for field in fields(self)}
+
+def _message_text(message: "BaseMessage") -> str:
+    if isinstance(message.content, str):
+        return message.content
+    return "".join(
+        block.get("text", "") if isinstance(block, dict) else str(block)
+        for block in message.content
+    )
+
+def _batch_answer(index: int, question: str, messages: list["BaseMessage"], elapsed: float) -> BatchAnswer:
+    from .tools import run_query_tool
+
+    answer = BatchAnswer(index, question, elapsed=round(elapsed, 3))
+    for message in reversed(messages):
+        if message.type == "ai" and answer.query is None:
+            for tool_call in reversed(message.tool_calls):
+                if tool_call["name"] == run_query_tool.name:
+                    answer.query = tool_call["args"].get("query")
+                    break
+        if message.type == "ai" and not message.tool_calls and answer.answer is None:
+            answer.answer = _message_text(message)
+    return answer
+
+async def answer_questions(
+    graph,
+    questions: list[str],
+    settings: BatchSettings | None = None,
+    config: dict | None = None,
+) -> AsyncIterator[BatchAnswer]:
+    """
+    Answers questions with a compiled graph, at most `settings.concurrency` at a time.
+
+    Args:
+        graph: The compiled agent graph.
+        questions (list[str]): The questions, each answered on its own.
+        settings (BatchSettings | None): Concurrency and time limit; read from the environment if omitted.
+        config (dict | None): The runs' config. Its "configurable" values are added to the defaults of
+                              `Configuration`, which hold the prompts.
+
+    Yields:
+        BatchAnswer: One per question, in the order they complete. A question that fails or exceeds the
+                     time limit yields an answer with `error` set; the others carry on. If the caller stops
+                     iterating, the runs still going are cancelled.
+
+    Raises:
+        ValueError: If the batch holds more than `settings.max_questions` questions.
+    """
+    from .config import Configuration
+    from .tools import shared_schema_lookups
+
+    settings = settings or BatchSettings.from_env()
+    if len(questions) > settings.max_questions:
+        raise ValueError(f"A batch holds at most {settings.max_questions} questions, got {len(questions)}.")
+    config = dict(config or {})
+    config["configurable"] = {**asdict(Configuration()), **config.get("configurable", {})}
+    semaphore = asyncio.Semaphore(max(1, settings.concurrency))
+
+    async def answer(index: int, question: str) -> BatchAnswer:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                state = await asyncio.wait_for(
+                    graph.ainvoke({"messages": [{"role": "user", "content": question}]}, config=config),
+                    timeout=settings.timeout,
+                )
+            except asyncio.TimeoutError:
+                error = f"No answer within {settings.timeout:g} seconds."
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            else:
+                return _batch_answer(index, question, state["messages"], time.perf_counter() - started)
+            return BatchAnswer(index, question, error=error, elapsed=round(time.perf_counter() - started, 3))
+
+    with shared_schema_lookups():
+        # The tasks copy the current context, and with it the batch's schema lookups.
+        tasks = [asyncio.create_task(answer(index, question)) for index, question in enumerate(questions)]
+    try:
+        for next_answer in asyncio.as_completed(tasks):
+            yield await next_answer
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,164 @@
+"""
+Keeps the conversation history sent to the LLM bounded as a thread grows.
+
+Every question of a thread appends its table listing, schema, queries and their results to the thread's
+messages, and each LLM call used to be sent all of them. Two steps keep that bounded:
+
+- `compact_history`, run at the start of each question, rewrites the messages of the questions already
+  answered: their table listings are removed, schemas other than the latest one are reduced to the names of
+  their tables, and long query results to their row count and first rows. The queries themselves and the
+  answers are kept, so follow-up questions can refer to them. Messages keep their ids, so the `add_messages`
+  reducer replaces them in the thread's state, and the work is never done twice.
+- `context_window` picks the messages sent with an LLM call: the current question's, the latest schema and
+  as many of the previous questions as fit `ContextSettings.max_tokens`, newest first. If the current question
+  alone is over the limit, its older query results are summarized as well.
+"""
+import os
+from dataclasses import dataclass, fields
+
+from langchain_core.messages import AIMessage, BaseMessage, RemoveMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+SCHEMA_TOOL = "sql_db_schema"
+LIST_TABLES_TOOL = "sql_db_list_tables"
+# Marks the messages `compact_history` rewrote, in their additional_kwargs.
+COMPACTED_KEY = "compacted"
+
+@dataclass(kw_only=True)
+class ContextSettings:
+    """How much conversation history is sent to the LLM. Every field can be overridden by an environment
+    variable named after it, prefixed with 'CONTEXT_' (e.g. CONTEXT_MAX_TOKENS)."""
+    max_tokens: int = 8000            # approximate tokens of history sent per LLM call, besides the system prompt
+    preview_chars: int = 300          # longer tool results of answered questions are summarized to this many
+
+    @classmethod
+    def from_env(cls, **overrides) -> "ContextSettings":
+        """Create settings from the environment, with explicit overrides taking precedence."""
+        values = {}
+        for f in fields(cls):
+            env_value = os.environ.get(f"CONTEXT_{f.name.upper()}")
+            if env_value is not None:
+                values[f.name] = int(env_value)
+        values.update(overrides)
+        return cls(**values)
+
+def _turns(messages: list[BaseMessage]) -> list[list[BaseMessage]]:
+    """Splits a thread into questions: each starts with a user message and ends before the next one."""
+    turns: list[list[BaseMessage]] = []
+    for message in messages:
+        if message.type == "human" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+def _latest_schema_id(messages: list[BaseMessage]) -> str | None:
+    for message in reversed(messages):
+        if message.type == "tool" and message.name == SCHEMA_TOOL and not str(message.content).startswith("Error"):
+            return message.id
+    return None
+
+def _summarize_result(message: ToolMessage, tool_call: dict | None, preview_chars: int) -> str:
+    """The text a long tool result is replaced with: what it was, and the start of it."""
+    content = str(message.content)
+    if message.name == SCHEMA_TOOL:
+        tables = (tool_call or {}).get("args", {}).get("table_names", "")
+        return f"Schema of {tables or 'the tables'}, omitted: a later message holds the latest schema."
+    artifact = message.artifact if isinstance(message.artifact, dict) else {}
+    row_count = artifact.get("row_count")
+    size = f"{row_count} rows" if row_count is not None else f"{len(content)} characters"
+    return f"Result of {size}, summarized; it began: {content[:preview_chars]}..."
+
+def _compacted(message: ToolMessage, text: str) -> ToolMessage:
+    return ToolMessage(
+        text,
+        name=message.name,
+        tool_call_id=message.tool_call_id,
+        id=message.id,
+        status=message.status,
+        additional_kwargs={**message.additional_kwargs, COMPACTED_KEY: True},
+    )
+
+def _tool_calls_by_id(messages: list[BaseMessage]) -> dict[str, dict]:
+    return {
+        tool_call["id"]: tool_call
+        for message in messages if message.type == "ai"
+        for tool_call in message.tool_calls
+    }
+
+def compact_history(messages: list[BaseMessage], settings: ContextSettings) -> list[BaseMessage]:
+    """
+    Rewrites the stale messages of the questions already answered (all but the last one).
+
+    Returns:
+        list[BaseMessage]: Replacements for the messages to shorten, with their ids, and `RemoveMessage`s for
+                           the table listings; empty if nothing is stale.
+    """
+    turns = _turns(messages)
+    if len(turns) < 2:
+        return []
+    latest_schema = _latest_schema_id(messages)
+    tool_calls = _tool_calls_by_id(messages)
+    updates: list[BaseMessage] = []
+    for turn in turns[:-1]:
+        listed = False
+        for message in turn:
+            if message.type == "ai" and message.tool_calls and all(c["name"] == LIST_TABLES_TOOL for c in message.tool_calls):
+                updates.append(RemoveMessage(id=message.id))
+            elif message.type == "tool" and message.name == LIST_TABLES_TOOL:
+                updates.append(RemoveMessage(id=message.id))
+                listed = True
+            elif listed and message.type == "ai" and not message.tool_calls:
+                # The "Available tables: ..." message the listing node adds after the listing.
+                updates.append(RemoveMessage(id=message.id))
+                listed = False
+            elif (
+                message.type == "tool"
+                and message.id != latest_schema
+                and not message.additional_kwargs.get(COMPACTED_KEY)
+                and len(str(message.content)) > settings.preview_chars
+            ):
+                summary = _summarize_result(message, tool_calls.get(message.tool_call_id), settings.preview_chars)
+                updates.append(_compacted(message, summary))
+    return updates
+
+def context_window(messages: list[BaseMessage], settings: ContextSettings) -> list[BaseMessage]:
+    """
+    The messages to send with an LLM call: the current question with everything since, the question holding
+    the latest schema, and the previous questions that fit `settings.max_tokens`, newest first. Older
+    questions are left out whole, so no tool call is ever sent without its result.
+    """
+    turns = _turns(messages)
+    latest_schema = _latest_schema_id(messages)
+    budget = settings.max_tokens
+    kept = set()
+    # Questions are left out oldest first: once one does not fit, no older one is sent.
+    full = False
+    for position in range(len(turns) - 1, -1, -1):
+        turn = turns[position]
+        required = position == len(turns) - 1 or any(message.id == latest_schema for message in turn)
+        if not required and full:
+            continue
+        tokens = count_tokens_approximately(turn)
+        if required or tokens <= budget:
+            kept.add(position)
+            budget -= tokens
+        else:
+            full = True
+    window = [message for position in sorted(kept) for message in turns[position]]
+    if budget >= 0 or not turns:
+        return window
+
+    # What must be sent is over the limit: summarize the query results sent, oldest first, all but the last.
+    tool_calls = _tool_calls_by_id(window)
+    results = [
+        position for position, message in enumerate(window)
+        if message.type == "tool" and message.id != latest_schema and len(str(message.content)) > settings.preview_chars
+    ][:-1]
+    for position in results:
+        message = window[position]
+        summary = _summarize_result(message, tool_calls.get(message.tool_call_id), settings.preview_chars)
+        budget += count_tokens_approximately([message]) - count_tokens_approximately([AIMessage(summary)])
+        window[position] = _compacted(message, summary)
+        if budget >= 0:
+            break
+    return window
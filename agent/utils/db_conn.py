@@ -1,21 +1,54 @@
 import os
+import threading
 from dotenv import load_dotenv
-from langchain_community.utilities import SQLDatabase
+
+from data_handler import ColumnarSettings, get_columnar_copies
 
 load_dotenv()
 
 class DBConnection:
-    def __init__(self):
-        self.DATABASE_PATH = os.getenv("DB_PATH")
+    def __init__(self, database_path: str | None = None):
+        self.DATABASE_PATH = database_path or os.getenv("DB_PATH")
+        self._db = None
+        self._lock = threading.Lock()
+
+    def use_database(self, database_path: str) -> None:
+        """Points the connection at another database file; its SQLDatabase is created on next use."""
+        with self._lock:
+            self.DATABASE_PATH = database_path
+            self._db = None
 
     def get_db(self):
-        return SQLDatabase.from_uri(f"sqlite:///{self.DATABASE_PATH}")
+        """Returns the SQLDatabase for DB_PATH, creating it on first use.
+        Tables are reflected lazily, only when the SQLDatabase itself needs their metadata."""
+        if self._db is None:
+            with self._lock:
+                if self._db is None:
+                    from langchain_community.utilities import SQLDatabase
+                    self._db = SQLDatabase.from_uri(
+                        f"sqlite:///{self.DATABASE_PATH}",
+                        lazy_table_reflection=True,
+                    )
+        return self._db
+
+    def columnar_tables(self) -> set[str]:
+        """The tables with a current columnar copy, which queries over them run on with DuckDB."""
+        return set(get_columnar_copies(self.DATABASE_PATH)) if ColumnarSettings.from_env().active else set()
+
+    def backend_for(self, table_names) -> str:
+        """The engine that runs queries over `table_names`: 'duckdb' if every one of them has a current
+        columnar copy, 'sqlite' otherwise."""
+        table_names = set(table_names or ())
+        return "duckdb" if table_names and table_names <= self.columnar_tables() else "sqlite"
 
-    def get_dialect(self):
+    def get_dialect(self, table_names=None):
+        """The SQL dialect of queries over `table_names`, or of the database itself if None."""
+        if self.backend_for(table_names) == "duckdb":
+            return "duckdb"
         return self.get_db().dialect
 
 
 if __name__ == "__main__":
     db = DBConnection().get_db()
     print(db.dialect)
-    print(db.get_usable_table_names())
\ No newline at end of file
+    print(db.get_usable_table_names())
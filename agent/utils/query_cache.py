@@ -0,0 +1,94 @@
+import threading
+from collections import OrderedDict
+
+from .sql_inspect import normalize_sql
+
+class QueryResultCache:
+    """
+    LRU cache of query results, bounded by the total size of the cached results in bytes.
+
+    Entries are keyed by the normalized SQL text together with the catalog version of every table the
+    query reads, so a result can never be served after one of its tables was rewritten, whichever
+    process did the write. `invalidate_table` additionally frees the entries of a rewritten table at once.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple, tuple[object, int]] = OrderedDict()
+        self._keys_by_table: dict[str, set[tuple]] = {}
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(sql: str, versions: dict[str, int]) -> tuple:
+        return normalize_sql(sql), tuple(sorted(versions.items()))
+
+    def get(self, sql: str, versions: dict[str, int]):
+        """Returns the cached result of a query at the given table versions, or None on a miss."""
+        key = self.make_key(sql, versions)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, sql: str, versions: dict[str, int], result, size: int | None = None) -> None:
+        """
+        Caches a query result, evicting the least recently used entries to stay within the byte budget.
+        `size` is the result's size in bytes; it defaults to the UTF-8 length of a text result.
+        """
+        key = self.make_key(sql, versions)
+        if size is None:
+            size = len(result.encode("utf-8"))
+        size += len(key[0])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (result, size)
+            self.current_bytes += size
+            for table_name in versions:
+                self._keys_by_table.setdefault(table_name, set()).add(key)
+            while self.current_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: tuple) -> None:
+        _, size = self._entries.pop(key)
+        self.current_bytes -= size
+        for table_name, _ in key[1]:
+            keys = self._keys_by_table.get(table_name)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_table[table_name]
+
+    def invalidate_table(self, table_name: str) -> None:
+        """Drops every cached result that reads the given table."""
+        with self._lock:
+            for key in list(self._keys_by_table.get(table_name, ())):
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_table.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,224 @@
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, fields
+
+# Seconds between two budget checks of a query running on DuckDB.
+_WATCH_INTERVAL = 0.05
+
+@dataclass(kw_only=True)
+class QueryBudget:
+    """The resources one agent query may use. Every field can be overridden by an environment variable
+    named after it, prefixed with 'QUERY_' (e.g. QUERY_TIMEOUT)."""
+    timeout: float = 10.0                # seconds of execution before SQLite interrupts the query
+    max_rows: int = 200                  # rows returned to the model
+    max_bytes: int = 16384               # size of the serialized result returned to the model
+    max_string_length: int = 300         # longer text values are truncated, as SQLDatabase does
+    progress_interval: int = 1000        # SQLite VM instructions between two budget checks
+
+    @classmethod
+    def from_env(cls, **overrides) -> "QueryBudget":
+        """Create a budget from the environment, with explicit overrides taking precedence."""
+        values = {}
+        for f in fields(cls):
+            env_value = os.environ.get(f"QUERY_{f.name.upper()}")
+            if env_value is not None:
+                values[f.name] = float(env_value) if f.type in (float, "float") else int(env_value)
+        values.update(overrides)
+        return cls(**values)
+
+@dataclass
+class QueryResult:
+    """The outcome of a query run under a budget. `text` is what the model sees."""
+    text: str
+    row_count: int | None = None
+    truncated: bool = False
+    error: str | None = None
+    elapsed: float = 0.0
+    vm_steps: int = 0       # SQLite VM instructions executed, counted in steps of the progress interval (0 on DuckDB)
+
+    @property
+    def artifact(self) -> dict:
+        """Describes the result for progress reporting; the artifact is not sent to the model."""
+        return {"row_count": self.row_count, "truncated": self.truncated, "error": self.error is not None}
+
+def _truncate_value(value, length: int, suffix: str = "..."):
+    """Shortens long text on a word boundary, like `truncate_word` in langchain's SQLDatabase."""
+    if not isinstance(value, str) or length <= 0 or len(value) <= length:
+        return value
+    return value[: length - len(suffix)].rsplit(" ", 1)[0] + suffix
+
+def execute_query(
+    conn: sqlite3.Connection,
+    sql: str,
+    budget: QueryBudget,
+    cancel_event: threading.Event | None = None,
+) -> QueryResult:
+    """
+    Runs a query under an execution budget and serializes its rows the way `SQLDatabase.run` does
+    (a Python list of tuples), without ever materializing more than the budget allows.
+
+    A SQLite progress handler interrupts the statement once it runs past `budget.timeout` or when
+    `cancel_event` is set. Rows are fetched in batches and serialized as they arrive; fetching stops at
+    `budget.max_rows` rows or `budget.max_bytes` bytes of text, and the text then says it was truncated.
+
+    Args:
+        conn (sqlite3.Connection): The (query-only) connection to run the query on.
+        sql (str): The query.
+        budget (QueryBudget): The limits to enforce.
+        cancel_event (threading.Event | None): Set from another thread to interrupt the query.
+
+    Returns:
+        QueryResult: The serialized result, or the error message returned to the model.
+    """
+    started = time.monotonic()
+    deadline = started + budget.timeout
+    timed_out = False
+    progress_calls = 0
+
+    def check_budget() -> int:
+        nonlocal timed_out, progress_calls
+        progress_calls += 1
+        if cancel_event is not None and cancel_event.is_set():
+            return 1
+        if time.monotonic() > deadline:
+            timed_out = True
+            return 1
+        return 0
+
+    conn.set_progress_handler(check_budget, budget.progress_interval)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql)
+        parts, row_count, truncated_by = _serialize_rows(cursor, budget)
+    except sqlite3.Error as e:
+        elapsed = time.monotonic() - started
+        vm_steps = progress_calls * budget.progress_interval
+        if cancel_event is not None and cancel_event.is_set():
+            return QueryResult(text="Error: the query was cancelled.", error="cancelled", elapsed=elapsed, vm_steps=vm_steps)
+        if timed_out:
+            return QueryResult(text=_timeout_message(budget), error="timeout", elapsed=elapsed, vm_steps=vm_steps)
+        return QueryResult(text=f"Error: {e}", error=str(e), elapsed=elapsed, vm_steps=vm_steps)
+    finally:
+        cursor.close()
+        conn.set_progress_handler(None, 0)
+        if conn.in_transaction:
+            conn.rollback()
+
+    return _query_result(parts, row_count, truncated_by, budget, time.monotonic() - started, progress_calls * budget.progress_interval)
+
+def execute_columnar_query(
+    cursor,
+    sql: str,
+    budget: QueryBudget,
+    cancel_event: threading.Event | None = None,
+) -> QueryResult:
+    """
+    Runs a query on a DuckDB cursor under an execution budget, serializing its rows like `execute_query`.
+
+    Only a single SELECT statement is run. DuckDB has no progress handler, so a watcher thread interrupts
+    the query once it runs past `budget.timeout` or when `cancel_event` is set.
+
+    Args:
+        cursor (duckdb.DuckDBPyConnection): A cursor of the columnar engine, used for this query only.
+        sql (str): The query.
+        budget (QueryBudget): The limits to enforce.
+        cancel_event (threading.Event | None): Set from another thread to interrupt the query.
+
+    Returns:
+        QueryResult: The serialized result, or the error message returned to the model.
+    """
+    import duckdb
+
+    started = time.monotonic()
+    try:
+        statements = cursor.extract_statements(sql)
+    except duckdb.Error as e:
+        return QueryResult(text=f"Error: {e}", error=str(e))
+    if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+        message = "Only a single read-only SELECT query is allowed."
+        return QueryResult(text=f"Error: {message}", error=message)
+
+    done = threading.Event()
+    timed_out = False
+
+    def watch() -> None:
+        nonlocal timed_out
+        deadline = started + budget.timeout
+        while not done.wait(_WATCH_INTERVAL):
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            if time.monotonic() > deadline:
+                timed_out = True
+                break
+        else:
+            return
+        cursor.interrupt()
+
+    watcher = threading.Thread(target=watch, name="columnar-query-watch", daemon=True)
+    watcher.start()
+    try:
+        cursor.execute(sql)
+        parts, row_count, truncated_by = _serialize_rows(cursor, budget)
+    except duckdb.Error as e:
+        elapsed = time.monotonic() - started
+        if cancel_event is not None and cancel_event.is_set():
+            return QueryResult(text="Error: the query was cancelled.", error="cancelled", elapsed=elapsed)
+        if timed_out:
+            return QueryResult(text=_timeout_message(budget), error="timeout", elapsed=elapsed)
+        return QueryResult(text=f"Error: {e}", error=str(e), elapsed=elapsed)
+    finally:
+        done.set()
+        watcher.join()
+        cursor.close()
+
+    return _query_result(parts, row_count, truncated_by, budget, time.monotonic() - started, 0)
+
+def _serialize_rows(cursor, budget: QueryBudget) -> tuple[list[str], int, str | None]:
+    """
+    Fetches an executed cursor's rows in batches and serializes them as they arrive, stopping at
+    `budget.max_rows` rows or `budget.max_bytes` bytes of text. Returns the serialized rows, their number,
+    and what the result was truncated by ('rows', 'bytes' or None).
+    """
+    parts: list[str] = []
+    size = 2  # the enclosing brackets
+    row_count = 0
+    while True:
+        rows = cursor.fetchmany(256)
+        if not rows:
+            return parts, row_count, None
+        for row in rows:
+            if row_count >= budget.max_rows:
+                return parts, row_count, "rows"
+            text = repr(tuple(_truncate_value(value, budget.max_string_length) for value in row))
+            added = len(text.encode("utf-8")) + (2 if parts else 0)
+            if size + added > budget.max_bytes:
+                return parts, row_count, "bytes"
+            parts.append(text)
+            size += added
+            row_count += 1
+
+def _timeout_message(budget: QueryBudget) -> str:
+    return (
+        f"Error: the query was interrupted after exceeding its time budget of {budget.timeout:g} seconds. "
+        "Rewrite it to do less work, e.g. avoid cross joins, filter earlier or aggregate, and try again."
+    )
+
+def _query_result(parts: list[str], row_count: int, truncated_by: str | None, budget: QueryBudget, elapsed: float, vm_steps: int) -> QueryResult:
+    if not parts and truncated_by is None:
+        return QueryResult(text="", row_count=0, elapsed=elapsed, vm_steps=vm_steps)
+    text = "[" + ", ".join(parts) + "]"
+    if truncated_by == "rows":
+        text += (
+            f"\n\n(Result truncated: only the first {row_count} rows are shown, the query returned more. "
+            "Aggregate, filter or add a LIMIT if the remaining rows matter.)"
+        )
+    elif truncated_by == "bytes":
+        text += (
+            f"\n\n(Result truncated: only the first {row_count} rows are shown, the result exceeded "
+            f"{budget.max_bytes} bytes. Select fewer columns, aggregate or add a LIMIT if the remaining rows matter.)"
+        )
+    return QueryResult(
+        text=text, row_count=row_count, truncated=truncated_by is not None, elapsed=elapsed, vm_steps=vm_steps
+    )
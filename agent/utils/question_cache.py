@@ -0,0 +1,96 @@
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+
+_WORD = re.compile(r"[a-z0-9_]+(?:\.[0-9]+)?")
+_NUMBER = re.compile(r"^[0-9]+(?:\.[0-9]+)?$")
+_STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "for", "to", "by", "and", "or", "is", "are", "was", "were",
+    "what", "which", "who", "how", "me", "show", "tell", "give", "list", "please", "can", "you", "i",
+    "do", "does", "there", "with", "from", "all", "each", "per",
+}
+
+def normalize_question(question: str) -> str:
+    """Normalizes a question for exact matching: lower-cased, punctuation dropped, whitespace collapsed."""
+    return " ".join(_WORD.findall(question.lower()))
+
+def _terms(normalized_question: str) -> Counter:
+    return Counter(word for word in normalized_question.split() if word not in _STOPWORDS)
+
+def _cosine(left: Counter, right: Counter) -> float:
+    dot = sum(count * right[word] for word, count in left.items())
+    if not dot:
+        return 0.0
+    norm = math.sqrt(sum(c * c for c in left.values())) * math.sqrt(sum(c * c for c in right.values()))
+    return dot / norm
+
+class QuestionQueryCache:
+    """
+    Remembers the validated SQL that answered a question, per schema (catalog) version.
+
+    Lookups first try the normalized question text. When `similarity_threshold` is below 1, questions
+    that are only re-worded are matched through a bag-of-words cosine similarity over the questions cached
+    for the same schema version; candidates must contain exactly the same numbers, so that e.g. '2023'
+    never matches '2024'. Bounded by `max_entries`, evicting the least recently used question.
+    """
+
+    def __init__(self, max_entries: int = 1000, similarity_threshold: float = 1.0):
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self._entries: OrderedDict[tuple[str, int], str] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, question: str, schema_version: int) -> str | None:
+        """Returns the SQL cached for a question (or a close re-wording of it) at a schema version."""
+        normalized = normalize_question(question)
+        with self._lock:
+            key = (normalized, schema_version)
+            query = self._entries.get(key)
+            if query is None and self.similarity_threshold < 1.0:
+                key, query = self._most_similar(normalized, schema_version)
+            if query is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return query
+
+    def _most_similar(self, normalized: str, schema_version: int) -> tuple[tuple | None, str | None]:
+        terms = _terms(normalized)
+        numbers = {word for word in terms if _NUMBER.match(word)}
+        best_key, best_query, best_score = None, None, self.similarity_threshold
+        for key, query in self._entries.items():
+            if key[1] != schema_version:
+                continue
+            candidate = _terms(key[0])
+            if {word for word in candidate if _NUMBER.match(word)} != numbers:
+                continue
+            score = _cosine(terms, candidate)
+            if score >= best_score:
+                best_key, best_query, best_score = key, query, score
+        return best_key, best_query
+
+    def put(self, question: str, schema_version: int, query: str) -> None:
+        """Remembers the SQL that answered a question at a schema version."""
+        key = (normalize_question(question), schema_version)
+        with self._lock:
+            self._entries[key] = query
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, question: str, schema_version: int) -> None:
+        """Forgets the SQL cached for a question at a schema version, if any."""
+        with self._lock:
+            self._entries.pop((normalize_question(question), schema_version), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,118 @@
+"""
+Rewrites aggregate queries over a table to read one of its rollups (see `data_handler.rollups`) instead.
+
+A rollup holds one row per group of its dimensions, with the row count and the sum, non-null count,
+minimum and maximum of each measure. A query can read it instead of the table when it only groups, filters
+and orders on dimensions and only aggregates with COUNT, SUM, TOTAL, AVG, MIN and MAX of a plain column:
+each aggregate is replaced by its re-aggregation over the rollup's groups, e.g. COUNT(*) by the sum of the
+row counts and AVG(x) by the sum of the sums over the sum of the counts. Anything else (joins, subqueries,
+window functions, HAVING, expressions inside aggregates, columns other than dimensions outside of an
+aggregate, e.g. in a filter) is left alone. A measure the rollup does not hold makes the rewritten query
+fail to prepare, so callers prepare it before running it.
+"""
+import re
+
+from data_handler.rollups import ROWS_COLUMN, Rollup, measure_column
+
+from .sql_inspect import normalize_sql
+
+_STRING_LITERAL = re.compile(r"('(?:[^']|'')*')")
+_UNSUPPORTED = re.compile(r"\b(?:join|union|intersect|except|over|window|with|values|having)\b|\bselect\b.*\bselect\b")
+_ANY_AGGREGATE = re.compile(r"\b(?:count|sum|total|avg|min|max|group_concat|string_agg)\s*\(")
+_AGGREGATE = re.compile(
+    r'\b(count|sum|total|avg|min|max)\s*\(\s*(distinct\s+)?(?:(\*)|((?:"?[a-z_][a-z0-9_]*"?\.)?)"?([a-z_][a-z0-9_]*)"?)\s*\)'
+)
+# Identifiers that are not function names; outside of aggregates, every one must be a dimension, an alias or a keyword.
+_IDENTIFIER = re.compile(r'\b([a-z_][a-z0-9_]*)\b(?!\s*\()')
+_ALIAS = re.compile(r'\bas\s+"?([a-z_][a-z0-9_]*)')
+_KEYWORDS = frozenset(
+    "select distinct all from where group by order limit offset asc desc nulls first last and or not is null "
+    "in like glob escape as case when then else end true false collate nocase".split()
+)
+_FROM_END = r"(?=\s+(?:where|group|order|limit|having)\b|\s*$)"
+
+def _from_clause(table_name: str) -> re.Pattern:
+    name = re.escape(table_name.lower())
+    return re.compile(rf'\bfrom\s+(?:"{name}"|`{name}`|\[{name}\]|{name})(?![a-z0-9_"`\]])(\s+as\s+[a-z_][a-z0-9_]*|{_FROM_END})?')
+
+def _reaggregate(match: re.Match, dimensions: dict[str, str], measures: dict[str, str]) -> str | None:
+    """The re-aggregation over a rollup of one aggregate call, or None if the rollup cannot answer it."""
+    function, distinct, star, qualifier, column = match.groups()
+    qualifier = qualifier or ""
+    rows = f'{qualifier}"{ROWS_COLUMN}"'
+    if star:
+        return f"COALESCE(SUM({rows}), 0)" if function == "count" and not distinct else None
+    if column in dimensions:
+        value = f'{qualifier}"{dimensions[column]}"'
+        # The distinct values of a dimension, and its extremes, are the same in every rollup of it.
+        if distinct or function in ("min", "max"):
+            return match.group(0)
+        non_null_rows = f"SUM(CASE WHEN {value} IS NOT NULL THEN {rows} END)"
+        return {
+            "count": f"COALESCE({non_null_rows}, 0)",
+            "sum": f"SUM({value} * {rows})",
+            "total": f"TOTAL({value} * {rows})",
+            "avg": f"(TOTAL({value} * {rows}) / {non_null_rows})",
+        }[function]
+    if column in measures and not distinct:
+        column = measures[column]
+        aggregated = {aggregate: f'{qualifier}"{measure_column(column, aggregate)}"' for aggregate in ("sum", "count", "min", "max")}
+        return {
+            "count": f"COALESCE(SUM({aggregated['count']}), 0)",
+            "sum": f"SUM({aggregated['sum']})",
+            "total": f"TOTAL({aggregated['sum']})",
+            "avg": f"(TOTAL({aggregated['sum']}) / SUM({aggregated['count']}))",
+            "min": f"MIN({aggregated['min']})",
+            "max": f"MAX({aggregated['max']})",
+        }[function]
+    return None
+
+def rewrite_for_rollup(sql: str, table_name: str, rollup: Rollup) -> str | None:
+    """
+    Rewrites a query over `table_name` to read `rollup` instead.
+
+    Returns:
+        str | None: The rewritten query, or None if the query is not an aggregate over the table alone
+                    whose aggregates the rollup can answer.
+    """
+    parts = _STRING_LITERAL.split(normalize_sql(sql))
+    # Even indices are SQL, odd ones the string literals captured by the split.
+    code = " ".join(parts[0::2])
+    if not code.startswith("select ") or _UNSUPPORTED.search(code) or len(_from_clause(table_name).findall(code)) != 1:
+        return None
+    # A comma in the FROM clause joins tables.
+    if "," in re.split(r"\b(?:where|group|order|limit|having)\b", code.split(" from ", 1)[-1], maxsplit=1)[0]:
+        return None
+    # Without grouping, DISTINCT or an aggregate, the query reads rows, which a rollup no longer has.
+    if not (re.search(r"\bgroup\s+by\b|^select\s+distinct\b", code) or _ANY_AGGREGATE.search(code)):
+        return None
+    if len(_ANY_AGGREGATE.findall(code)) != len(_AGGREGATE.findall(code)) or "*" in _AGGREGATE.sub("", code):
+        return None
+
+    dimensions = {name.lower(): name for name in rollup.dimensions}
+    measures = {name.lower(): name for name in rollup.measures}
+    # A column read outside of an aggregate, e.g. filtered on, must be a dimension: the rollup has no other.
+    allowed = _KEYWORDS | set(dimensions) | set(_ALIAS.findall(code)) | {table_name.lower()}
+    if any(identifier not in allowed for identifier in _IDENTIFIER.findall(_AGGREGATE.sub("", code))):
+        return None
+    unsupported = False
+
+    def replace(match: re.Match) -> str:
+        nonlocal unsupported
+        replacement = _reaggregate(match, dimensions, measures)
+        if replacement is None:
+            unsupported = True
+            return match.group(0)
+        return replacement
+
+    def replace_from(match: re.Match) -> str:
+        # Without an alias, the table's name becomes the rollup's alias, for columns qualified with it.
+        alias = match.group(1)
+        return f'from "{rollup.name}"' + (f' as "{table_name}"' if alias == "" else alias or "")
+
+    rewritten = []
+    for index, part in enumerate(parts):
+        if index % 2 == 0:
+            part = _from_clause(table_name).sub(replace_from, _AGGREGATE.sub(replace, part))
+        rewritten.append(part)
+    return None if unsupported else "".join(rewritten)
@@ -0,0 +1,116 @@
+import re
+import sqlite3
+from dataclasses import dataclass, field
+
+from data_handler.catalog import is_internal_table
+
+# Authorizer actions a read-only query may perform; anything else means the statement writes.
+_READ_ONLY_ACTIONS = {sqlite3.SQLITE_READ, sqlite3.SQLITE_SELECT, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+_NON_DETERMINISTIC_FUNCTIONS = {"random", "randomblob", "changes", "total_changes", "last_insert_rowid"}
+_STRING_LITERAL = re.compile(r"('(?:[^']|'')*')")
+_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+
+@dataclass
+class StatementInfo:
+    """What a SQL statement touches, as reported by SQLite while preparing it."""
+    tables: set[str] = field(default_factory=set)
+    columns: dict[str, set[str]] = field(default_factory=dict)
+    functions: set[str] = field(default_factory=set)
+    read_only: bool = True
+    plan: list[str] = field(default_factory=list)
+
+    @property
+    def deterministic(self) -> bool:
+        return not (self.functions & _NON_DETERMINISTIC_FUNCTIONS)
+
+def inspect_statement(conn: sqlite3.Connection, sql: str) -> StatementInfo:
+    """
+    Resolves the tables, columns and functions a single SQL statement uses, and its query plan, without running it.
+    The statement is only prepared (through EXPLAIN QUERY PLAN) while an authorizer records every access,
+    so names are resolved exactly as SQLite resolves them, including through views and CTEs.
+
+    Raises:
+        sqlite3.Error: If the statement does not prepare, e.g. it references unknown tables or columns
+                       or contains more than one statement.
+    """
+    info = StatementInfo()
+    # The authorizer reports a view's name alongside the reads it makes, and a CTE's name the same way.
+    views = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'view'")}
+
+    def authorizer(action, arg1, arg2, db_name, trigger_or_view):
+        if action == sqlite3.SQLITE_READ:
+            if trigger_or_view in views or is_internal_table(arg1):
+                # Queries name the view, not the tables behind it (e.g. the internal tables of a
+                # dictionary-encoded upload, which SQLite reports even when it drops them from a join).
+                return sqlite3.SQLITE_OK
+            info.tables.add(arg1)
+            if arg2:
+                info.columns.setdefault(arg1, set()).add(arg2)
+        elif action == sqlite3.SQLITE_SELECT and trigger_or_view in views:
+            info.tables.add(trigger_or_view)
+        elif action == sqlite3.SQLITE_FUNCTION:
+            info.functions.add(arg2.lower())
+        elif action not in _READ_ONLY_ACTIONS:
+            info.read_only = False
+        return sqlite3.SQLITE_OK
+
+    conn.set_authorizer(authorizer)
+    try:
+        info.plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()]
+    finally:
+        conn.set_authorizer(None)
+    return info
+
+def normalize_sql(sql: str) -> str:
+    """
+    Normalizes SQL text so that trivially different spellings of a query compare equal:
+    comments are removed, whitespace is collapsed, trailing semicolons are dropped and everything
+    outside string literals is lower-cased.
+    """
+    sql = _COMMENT.sub(" ", sql)
+    parts = _STRING_LITERAL.split(sql)
+    normalized = []
+    for index, part in enumerate(parts):
+        # Odd indices are the string literals captured by the split.
+        normalized.append(part if index % 2 else re.sub(r"\s+", " ", part.lower()))
+    return "".join(normalized).strip().rstrip(";").strip()
+
+def is_time_dependent(sql: str) -> bool:
+    """Whether the statement reads the current date or time, so its result changes without any write."""
+    lowered = _COMMENT.sub(" ", sql).lower()
+    return "'now'" in lowered or re.search(r"\bcurrent_(date|time|timestamp)\b", lowered) is not None
+
+# Clauses whose columns an index can serve, and the keywords that end a clause.
+_CLAUSE_KINDS = {"where": "filter", "on": "join", "using": "join", "group by": "group"}
+_CLAUSE_KEYWORD = re.compile(
+    r"\b(where|on|using|group by|having|order by|limit|select|from|join|union|except|intersect|window)\b"
+)
+_QUALIFIED_NAME = re.compile(r'(?:"?([a-z_][a-z0-9_]*)"?\s*\.\s*)?"?([a-z_][a-z0-9_]*)"?')
+
+def clause_columns(sql: str, info: StatementInfo) -> list[tuple[str, str, str]]:
+    """
+    Finds the columns a query filters (WHERE), joins (ON, USING) and groups (GROUP BY) on, as
+    (table, column, kind) with kind 'filter', 'join' or 'group'. Names found in those clauses are matched
+    against the columns SQLite reported reading (`info.columns`); an unqualified name shared by several
+    tables is attributed to each. Clauses are found in the SQL text, so complex queries are read best-effort.
+    """
+    by_name: dict[str, list[tuple[str, str]]] = {}
+    for table, columns in info.columns.items():
+        for column in columns:
+            by_name.setdefault(column.lower(), []).append((table, column))
+    table_names = {table.lower() for table in info.columns}
+    # String literals are blanked out so their contents cannot look like names.
+    code = re.sub(r"'(?:[^']|'')*'", "''", normalize_sql(sql))
+    parts = _CLAUSE_KEYWORD.split(code)
+    uses: dict[tuple[str, str, str], None] = {}
+    for keyword, body in zip(parts[1::2], parts[2::2]):
+        kind = _CLAUSE_KINDS.get(keyword)
+        if kind is None:
+            continue
+        for qualifier, name in _QUALIFIED_NAME.findall(body):
+            for table, column in by_name.get(name, []):
+                # A qualifier that names a table picks it; other qualifiers are aliases, matched by column only.
+                if qualifier in table_names and qualifier != table.lower():
+                    continue
+                uses[(table, column, kind)] = None
+    return list(uses)
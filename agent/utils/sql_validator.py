@@ -0,0 +1,108 @@
+import re
+import sqlite3
+from dataclasses import dataclass
+from typing import Literal
+
+from .sql_inspect import inspect_statement, normalize_sql
+
+# Constructs the LLM checker is asked to look out for; a query using any of them is left to it.
+_CHECKER_CONSTRUCTS = re.compile(
+    r"\bnot\s+in\b|\bunion\b|\bintersect\b|\bexcept\b|\bbetween\b|\bcast\s*\(|\bjoin\b|\bexists\b"
+)
+_PLAN_MARKERS = ("SUBQUERY", "COMPOUND", "CORRELATED", "MULTI-INDEX", "CO-ROUTINE", "MATERIALIZE")
+_COMPARISON = re.compile(
+    r'"?([a-z_][a-z0-9_]*)"?\s*(?:=|==|!=|<>|<=|>=|<|>|\blike\b)\s*(\'(?:[^\']|\'\')*\'|-?\d+(?:\.\d+)?)'
+)
+# A comparison with the NULL literal, on either side, which is never true: it needs IS NULL / IS NOT NULL.
+_NULL_COMPARISON = re.compile(
+    r"(?:==?|!=|<>|<=|>=|<|>|\blike\b)\s*\bnull\b|\bnull\s*(?:==?|!=|<>|<=|>=|<|>|\blike\b)"
+)
+_NUMERIC_TYPES = ("INT", "REAL", "FLOA", "DOUB", "NUM", "DEC")
+
+@dataclass
+class Validation:
+    """The local validator's verdict on one query."""
+    verdict: Literal["safe", "ambiguous", "rejected"]
+    reason: str = ""
+
+def _is_numeric_type(declared_type: str) -> bool:
+    declared_type = declared_type.upper()
+    return any(marker in declared_type for marker in _NUMERIC_TYPES)
+
+def validate_query(conn: sqlite3.Connection, sql: str, column_types: dict[str, dict[str, str]]) -> Validation:
+    """
+    Statically validates a generated query against the live schema without running it.
+
+    A query is 'rejected' if SQLite cannot prepare it or if it would modify the database. It is 'safe'
+    when it is a single read-only SELECT over one known table whose plan has no subqueries or compound
+    parts, uses none of the constructs the LLM checker looks for (NOT IN, UNION, BETWEEN, CAST, joins,
+    ...), and compares no column with a literal of a different type. Anything else is 'ambiguous'.
+    Queries comparing a value with NULL using `=`, `!=`, `<` or the like are also 'rejected', since the
+    comparison is never true.
+
+    Args:
+        conn (sqlite3.Connection): A connection to the database the query will run against.
+        sql (str): The query to validate.
+        column_types (dict[str, dict[str, str]]): Declared column types per known table, by lower-cased column name.
+    """
+    try:
+        info = inspect_statement(conn, sql)
+    except sqlite3.Error as e:
+        return Validation("rejected", f"Error: {e}")
+    if not info.read_only:
+        return Validation("rejected", "Error: Only read-only SELECT queries are allowed. DML and DDL statements are not permitted.")
+
+    normalized = normalize_sql(sql)
+    # String literals are blanked out so their contents cannot look like SQL.
+    code = re.sub(r"'(?:[^']|'')*'", "''", normalized)
+    null_comparison = _NULL_COMPARISON.search(code)
+    if null_comparison:
+        return Validation(
+            "rejected",
+            f"Error: '{null_comparison.group(0).strip()}' compares with NULL, which is never true. "
+            "Use IS NULL or IS NOT NULL instead.",
+        )
+    if not (normalized.startswith("select") or normalized.startswith("with")):
+        return Validation("ambiguous", "not a plain SELECT")
+    if len(info.tables) != 1:
+        return Validation("ambiguous", "reads more than one table")
+    table_name = next(iter(info.tables))
+    if table_name not in column_types:
+        return Validation("ambiguous", f"'{table_name}' is not an uploaded table")
+    if any(marker in detail for detail in info.plan for marker in _PLAN_MARKERS):
+        return Validation("ambiguous", "plan has subqueries or compound parts")
+    if _CHECKER_CONSTRUCTS.search(code):
+        return Validation("ambiguous", "uses a construct the checker reviews")
+
+    columns = column_types[table_name]
+    for column, literal in _COMPARISON.findall(normalized):
+        declared_type = columns.get(column)
+        if declared_type is None:
+            continue
+        if _is_numeric_type(declared_type) == literal.startswith("'"):
+            return Validation("ambiguous", f"compares {column} ({declared_type or 'untyped'}) with {literal}")
+    return Validation("safe")
+
+def validate_columnar_query(cursor, sql: str) -> Validation:
+    """
+    Validates a query that runs on the columnar engine (DuckDB) without running it.
+
+    A query is 'rejected' if it is not a single SELECT statement or DuckDB cannot plan it. Anything else is
+    'ambiguous': the checks that prove SQLite queries safe read SQLite's query plans.
+
+    Args:
+        cursor (duckdb.DuckDBPyConnection): A cursor of the columnar engine, used for this validation only.
+        sql (str): The query to validate.
+    """
+    import duckdb
+
+    try:
+        statements = cursor.extract_statements(sql)
+        if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+            return Validation("rejected", "Error: Only read-only SELECT queries are allowed. DML and DDL statements are not permitted.")
+        cursor.execute(f"EXPLAIN {sql}")
+    except duckdb.Error as e:
+        return Validation("rejected", f"Error: {e}")
+    finally:
+        cursor.close()
+    return Validation("ambiguous", "runs on the columnar engine")
@@ -0,0 +1,73 @@
+import math
+import re
+from collections import Counter
+
+# How much a term found in each part of a table's description counts.
+_FIELD_WEIGHTS = {"table": 3, "column": 2, "value": 1}
+_TOKEN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+_STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "for", "to", "by", "and", "or", "is", "are", "was", "were",
+    "what", "which", "who", "how", "many", "much", "me", "show", "tell", "give", "list", "please",
+    "can", "you", "i", "do", "does", "there", "with", "from", "all", "each", "per", "table", "data",
+}
+
+def tokenize(text: str) -> list[str]:
+    """Splits text, snake_case and camelCase identifiers into lower-cased, crudely singularized terms."""
+    terms = []
+    for token in _TOKEN.findall(str(text)):
+        token = token.lower()
+        if token in _STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        terms.append(token)
+    return terms
+
+class TableIndex:
+    """
+    A local BM25 index over the uploaded tables, used to pick the tables relevant to a question
+    without asking the LLM. Each table is described by its name, its column names and its sample
+    values from the catalog, weighted in that order.
+    """
+
+    def __init__(self, entries: dict, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.documents: dict[str, Counter] = {}
+        for name, entry in entries.items():
+            terms = Counter()
+            for term in tokenize(name):
+                terms[term] += _FIELD_WEIGHTS["table"]
+            for column in entry.column_names:
+                for term in tokenize(column):
+                    terms[term] += _FIELD_WEIGHTS["column"]
+            for row in entry.sample_rows:
+                for value in row:
+                    if isinstance(value, str):
+                        for term in tokenize(value):
+                            terms[term] += _FIELD_WEIGHTS["value"]
+            self.documents[name] = terms
+        self.lengths = {name: sum(terms.values()) for name, terms in self.documents.items()}
+        self.average_length = (sum(self.lengths.values()) / len(self.lengths)) if self.lengths else 0.0
+        document_frequency = Counter(term for terms in self.documents.values() for term in terms)
+        count = len(self.documents)
+        self.idf = {
+            term: math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequency.items()
+        }
+
+    def search(self, question: str, top_k: int) -> list[tuple[str, float]]:
+        """Returns up to `top_k` (table, score) pairs for the tables matching the question, best first."""
+        query_terms = set(tokenize(question))
+        scores = []
+        for name, terms in self.documents.items():
+            length_norm = self.k1 * (1 - self.b + self.b * self.lengths[name] / (self.average_length or 1))
+            score = sum(
+                self.idf[term] * terms[term] * (self.k1 + 1) / (terms[term] + length_norm)
+                for term in query_terms
+                if term in terms
+            )
+            if score > 0:
+                scores.append((name, score))
+        scores.sort(key=lambda item: (-item[1], item[0]))
+        return scores[:top_k]
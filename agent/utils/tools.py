@@ -1,40 +1,383 @@
 import os
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from uuid import uuid4
 from typing import Literal
-from langchain_anthropic import ChatAnthropic
-from langchain_core.messages import AIMessage
+from langchain_core.messages import AIMessage, ToolMessage
 from langchain_core.runnables import RunnableConfig
-from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
+from langchain_core.tools import StructuredTool, tool
 from langgraph.prebuilt import ToolNode
 
+from data_handler import (
+    catalog_table_names,
+    get_catalog,
+    get_table_entries,
+    get_table_versions,
+    get_catalog_version,
+    get_connection_manager,
+    add_table_write_listener,
+    record_query,
+    IndexSettings,
+    record_index_usage,
+    columnar_query_tables,
+    get_columnar_engine,
+    get_table_rollups,
+)
+
 from .state import State
+from .context import ContextSettings, compact_history, context_window
 from .db_conn import DBConnection
+from .query_cache import QueryResultCache
+from .query_runner import QueryBudget, QueryResult, execute_query, execute_columnar_query
+from .question_cache import QuestionQueryCache
+from .rollup_rewrite import rewrite_for_rollup
+from .sql_inspect import StatementInfo, clause_columns, inspect_statement, is_time_dependent
+from .sql_validator import Validation, validate_query, validate_columnar_query
+from .table_index import TableIndex
+from .tracing import record_llm_usage
 
 load_dotenv()
 
-llm = ChatAnthropic(
-    model_name="claude-3-7-sonnet-latest",
-    api_key=os.getenv("ANTHROPIC_API_KEY", ""),
-    temperature=0.0,
-    max_tokens=4096,
-)
+# The LLM client and the SQLDatabase are created on first use, so importing the graph (e.g. when the
+# LangGraph server starts a worker) neither imports the Anthropic SDK nor connects to and reflects the database.
+db_connection = DBConnection()
 
-db = DBConnection().get_db()
-db_dialect = DBConnection().get_dialect()
+@lru_cache(maxsize=None)
+def get_llm():
+    """Returns the chat model used by the graph's LLM nodes, creating it on first use."""
+    from langchain_anthropic import ChatAnthropic
 
-toolkit = SQLDatabaseToolkit(
-    db=db,
-    llm=llm,
-)
-tools = toolkit.get_tools()
+    return ChatAnthropic(
+        model_name="claude-3-7-sonnet-latest",
+        api_key=os.getenv("ANTHROPIC_API_KEY", ""),
+        temperature=0.0,
+        max_tokens=4096,
+    )
+
+def get_db_dialect(table_names=None) -> str:
+    """Returns the SQL dialect named in the agent's prompts, for queries over `table_names` if given."""
+    return db_connection.get_dialect(table_names)
+
+# The schema lookups shared by the runs of a batch of questions, keyed by catalog version and tables.
+_shared_schemas: ContextVar[dict | None] = ContextVar("shared_schemas", default=None)
+
+@contextmanager
+def shared_schema_lookups():
+    """Shares the schema lookups of the graph runs started within the block, e.g. the questions of a batch:
+    a schema already looked up for the same tables, at the same catalog version, is reused."""
+    token = _shared_schemas.set({})
+    try:
+        yield
+    finally:
+        _shared_schemas.reset(token)
+
+@tool("sql_db_schema")
+def get_schema_tool(table_names: str) -> str:
+    """Input to this tool is a comma-separated list of tables, output is the schema and sample rows for those tables. Be sure that the tables actually exist by calling sql_db_list_tables first! Example Input: table1, table2, table3"""
+    # Served from the table catalog, so no schema reflection or sample queries run per call.
+    names = [name.strip() for name in table_names.split(",") if name.strip()]
+    shared = _shared_schemas.get()
+    if shared is not None:
+        key = (get_catalog_version(db_connection.DATABASE_PATH), tuple(names))
+        if key in shared:
+            return shared[key]
+    entries = get_table_entries(names, db_connection.DATABASE_PATH)
+    missing = [name for name in names if name not in entries]
+    if missing:
+        return f"Error: table_names {set(missing)} not found in database"
+    schema = "\n\n".join(entries[name].table_info() for name in names)
+    if shared is not None:
+        shared[key] = schema
+    return schema
 
-get_schema_tool = next(tool for tool in tools if tool.name == "sql_db_schema")
 get_schema_node = ToolNode([get_schema_tool], name="get_schema")
 
-run_query_tool = next(tool for tool in tools if tool.name == "sql_db_query")
+query_cache = QueryResultCache(max_bytes=int(os.getenv("QUERY_CACHE_MAX_BYTES", str(64 * 1024 * 1024))))
+add_table_write_listener(query_cache.invalidate_table)
+
+def _inspect_query(query: str) -> StatementInfo | None:
+    try:
+        with get_connection_manager(db_connection.DATABASE_PATH).reader() as conn:
+            return inspect_statement(conn, query)
+    except sqlite3.Error:
+        return None
+
+def _cacheable_tables(query: str, info: StatementInfo | None) -> list[str] | None:
+    """
+    Returns the tables a query reads if its result may be cached: it must be a single deterministic,
+    read-only statement over cataloged tables. Returns None otherwise.
+    """
+    if info is None or not info.read_only or not info.deterministic or not info.tables or is_time_dependent(query):
+        return None
+    return sorted(info.tables)
+
+def _query_backend(query: str, info: StatementInfo | None) -> str:
+    """
+    The engine a query runs on: 'duckdb' if every table it reads has a current columnar copy, 'sqlite' otherwise.
+    Queries SQLite cannot prepare, e.g. ones written in DuckDB's dialect, are routed by the tables DuckDB finds in them.
+    """
+    if info is not None:
+        return db_connection.backend_for(info.tables)
+    if not db_connection.columnar_tables():
+        return "sqlite"
+    return db_connection.backend_for(columnar_query_tables(query))
+
+def _rewrite_with_rollups(query: str, info: StatementInfo | None) -> str | None:
+    """
+    Rewrites an aggregate query over one table to read the smallest of the table's current rollups that
+    answers it, if any does. A rewrite is only returned once it prepares, i.e. the rollup has every column it reads.
+    """
+    if info is None or not info.read_only or len(info.tables) != 1:
+        return None
+    table_name = next(iter(info.tables))
+    rollups = get_table_rollups(table_name, db_connection.DATABASE_PATH)
+    if not rollups:
+        return None
+    with get_connection_manager(db_connection.DATABASE_PATH).reader() as conn:
+        for rollup in rollups:
+            rewritten = rewrite_for_rollup(query, table_name, rollup)
+            if rewritten is None:
+                continue
+            try:
+                inspect_statement(conn, rewritten)
+            except sqlite3.Error:
+                continue
+            return rewritten
+    return None
+
+query_budget = QueryBudget.from_env()
+
+def _execute(query: str, cancel_event: threading.Event | None, backend: str = "sqlite") -> QueryResult:
+    if backend == "duckdb":
+        engine = get_columnar_engine(db_connection.DATABASE_PATH)
+        if engine is not None:
+            return execute_columnar_query(engine.cursor(), query, query_budget, cancel_event)
+    with get_connection_manager(db_connection.DATABASE_PATH).reader() as conn:
+        return execute_query(conn, query, query_budget, cancel_event)
+
+index_settings = IndexSettings.from_env()
+
+@lru_cache(maxsize=None)
+def _get_index_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-usage")
+
+def _record_index_usage(query: str, info: StatementInfo) -> None:
+    """Records the columns an executed query used, for the index advisor the web app runs (see `start_index_advisor`)."""
+    try:
+        uses = clause_columns(query, info)
+        if uses:
+            record_index_usage(db_connection.DATABASE_PATH, query, uses, info.plan, index_settings)
+    except Exception as e:
+        print(f"Index advisor failed: {e}")
+
+def _run_query(query: str, cancel_event: threading.Event | None = None) -> QueryResult:
+    info = _inspect_query(query)
+    tables = _cacheable_tables(query, info)
+    versions = get_table_versions(tables, db_connection.DATABASE_PATH) if tables else {}
+    result = None
+    # Tables missing from the catalog have no version to key on.
+    cacheable = bool(tables) and 0 not in versions.values()
+    if cacheable:
+        result = query_cache.get(query, versions)
+    executed = result is None
+    if executed:
+        rewritten = _rewrite_with_rollups(query, info)
+        backend = "rollup" if rewritten is not None else _query_backend(query, info)
+        result = _execute(rewritten or query, cancel_event, backend)
+        if backend == "rollup" and result.error not in (None, "timeout", "cancelled"):
+            backend = _query_backend(query, info)
+            result = _execute(query, cancel_event, backend)
+        # SQLite holds every table, so a query it can prepare that failed on a columnar copy (e.g. one written
+        # in SQLite's dialect, or reading a copy replaced while it ran) is run there instead.
+        if backend == "duckdb" and info is not None and result.error not in (None, "timeout", "cancelled"):
+            backend = "sqlite"
+            result = _execute(query, cancel_event, backend)
+        if cacheable and result.error is None:
+            query_cache.put(query, versions, result, size=len(result.text.encode("utf-8")))
+        # The columns used are worked out off the query's path.
+        if index_settings.advisor and backend == "sqlite" and info is not None and info.read_only and result.error is None:
+            _get_index_executor().submit(_record_index_usage, query, info)
+
+    # A cached result scanned nothing this time.
+    record_query(result.row_count or 0, result.vm_steps if executed else 0, len(result.text.encode("utf-8")))
+    return result
+
+RUN_QUERY_DESCRIPTION = "Input to this tool is a detailed and correct SQL query, output is a result from the database. If the query is not correct, an error message will be returned. If an error is returned, rewrite the query, check the query, and try again. If you encounter an issue with Unknown column 'xxxx' in 'field list', use sql_db_schema to query the correct table fields to use."
+
+@lru_cache(maxsize=None)
+def _get_query_executor() -> ThreadPoolExecutor:
+    # One thread per pooled reader connection: the query calls of a message run concurrently, each on a
+    # connection of its own, and calls beyond the pool wait here for a thread rather than for a connection.
+    readers = get_connection_manager(db_connection.DATABASE_PATH).settings.readers
+    return ThreadPoolExecutor(max_workers=max(1, readers), thread_name_prefix="agent-query")
+
+def _run_query_tool(query: str) -> tuple[str, dict]:
+    result = _get_query_executor().submit(_run_query, query).result()
+    return result.text, result.artifact
+
+async def _arun_query_tool(query: str) -> tuple[str, dict]:
+    # The query runs on a worker thread. If the run is cancelled (e.g. the chat client went away),
+    # the event makes SQLite interrupt the statement instead of letting it run to its time budget.
+    cancel_event = threading.Event()
+    try:
+        result = await asyncio.get_running_loop().run_in_executor(_get_query_executor(), _run_query, query, cancel_event)
+    except asyncio.CancelledError:
+        cancel_event.set()
+        raise
+    return result.text, result.artifact
+
+# Queries run on pooled query-only connections under `query_budget`: a time limit enforced by SQLite
+# itself, and a row and byte cap on the result text the model receives.
+run_query_tool = StructuredTool.from_function(
+    func=_run_query_tool,
+    coroutine=_arun_query_tool,
+    name="sql_db_query",
+    description=RUN_QUERY_DESCRIPTION,
+    response_format="content_and_artifact",
+)
+
 run_query_node = ToolNode([run_query_tool], name="run_query")
 
+question_cache = QuestionQueryCache(
+    max_entries=int(os.getenv("QUESTION_CACHE_SIZE", "1000")),
+    similarity_threshold=float(os.getenv("QUESTION_CACHE_SIMILARITY", "1.0")),
+)
+
+def _latest_question(state: State) -> str | None:
+    """Returns the text of the most recent user message."""
+    for message in reversed(state["messages"]):
+        if message.type == "human":
+            if isinstance(message.content, str):
+                return message.content
+            return " ".join(
+                block.get("text", "") if isinstance(block, dict) else str(block)
+                for block in message.content
+            )
+    return None
+
+def _standalone_question(state: State) -> str | None:
+    """
+    Returns the latest question if it opens its thread. Follow-ups (e.g. 'and for 2023?') depend on the
+    earlier turns, so their SQL is neither looked up in nor stored to the process-wide question cache.
+    """
+    if sum(1 for message in state["messages"] if message.type == "human") != 1:
+        return None
+    return _latest_question(state)
+
+context_settings = ContextSettings.from_env()
+
+def compact_context(state: State):
+    """
+    Shortens the stale messages of the questions already answered in the thread (table listings, earlier
+    schemas, long query results) when a new question starts, so that the thread's state stops growing with them.
+    """
+    updates = compact_history(state["messages"], context_settings)
+    return {"messages": updates} if updates else {}
+
+def lookup_cached_query(state: State):
+    """
+    Looks the question up in the question cache. On a hit, issues the remembered SQL as a query tool call,
+    so the graph skips table selection, query generation and checking. Only the first question of a thread
+    is looked up.
+    """
+    question = _standalone_question(state)
+    if question is None:
+        return {}
+    query = question_cache.get(question, get_catalog_version(db_connection.DATABASE_PATH))
+    if query is None:
+        return {}
+    tool_call = {
+        "name": "sql_db_query",
+        "args": {"query": query},
+        "id": str(uuid4()),
+        "type": "tool_call",
+    }
+    return {"messages": [AIMessage(content="", tool_calls=[tool_call])]}
+
+def route_cached_query(state: State) -> Literal["run_query", "select_tables"]:
+    last_message = state["messages"][-1]
+    if last_message.type == "ai" and last_message.tool_calls:
+        return "run_query"
+    return "select_tables"
+
+TABLE_SELECTION_TOP_K = int(os.getenv("TABLE_SELECTION_TOP_K", "3"))
+_table_index: tuple[int, TableIndex] | None = None
+
+def get_table_index() -> TableIndex:
+    """Returns the table relevance index, rebuilding it from the catalog whenever the catalog changed."""
+    global _table_index
+    catalog_version = get_catalog_version(db_connection.DATABASE_PATH)
+    if _table_index is None or _table_index[0] != catalog_version:
+        _table_index = (catalog_version, TableIndex(get_catalog(db_connection.DATABASE_PATH)))
+    return _table_index[1]
+
+def use_database(db_path: str) -> None:
+    """Points the graph's tools at a database other than DB_PATH's, e.g. the web app's own when it runs the
+    graph itself. Call it before the graph runs; what was cached for the previous database is dropped."""
+    global _table_index
+    db_connection.use_database(db_path)
+    _table_index = None
+    query_cache.clear()
+    question_cache.clear()
+
+def select_tables(state: State):
+    """
+    Picks the tables relevant to the question from the local table index and requests their schema,
+    replacing the table listing and the LLM's table choice. Leaves the state unchanged when no table
+    matches, so the graph falls back to letting the LLM choose.
+    """
+    index = get_table_index()
+    if len(index.documents) <= TABLE_SELECTION_TOP_K:
+        table_names = sorted(index.documents)
+    else:
+        table_names = [name for name, _ in index.search(_latest_question(state) or "", TABLE_SELECTION_TOP_K)]
+    if not table_names:
+        return {}
+    tool_call = {
+        "name": "sql_db_schema",
+        "args": {"table_names": ", ".join(table_names)},
+        "id": str(uuid4()),
+        "type": "tool_call",
+    }
+    return {"messages": [AIMessage(content="", tool_calls=[tool_call])]}
+
+def route_selected_tables(state: State) -> Literal["get_schema", "list_tables"]:
+    last_message = state["messages"][-1]
+    if last_message.type == "ai" and last_message.tool_calls:
+        return "get_schema"
+    return "list_tables"
+
+def remember_query(state: State):
+    """
+    Remembers the query that just ran successfully as the answer to the question, if the question opens its
+    thread and that query is the only one that succeeded for it (possibly run more than once). An answer
+    built from several queries cannot be replayed from one, so it is forgotten instead.
+    """
+    question = _standalone_question(state)
+    if question is None:
+        return {}
+    tool_calls, succeeded = {}, set()
+    for message in state["messages"]:
+        if message.type == "ai":
+            tool_calls.update((tool_call["id"], tool_call) for tool_call in message.tool_calls)
+        elif message.type == "tool" and message.name == run_query_tool.name and not str(message.content).startswith("Error"):
+            tool_call = tool_calls.get(message.tool_call_id)
+            if tool_call is not None:
+                succeeded.add(tool_call["args"]["query"])
+    catalog_version = get_catalog_version(db_connection.DATABASE_PATH)
+    if len(succeeded) == 1:
+        question_cache.put(question, catalog_version, next(iter(succeeded)))
+    elif len(succeeded) > 1:
+        question_cache.discard(question, catalog_version)
+    return {}
+
 def list_tables(state: State):
     tool_call = {
         "name": "sql_db_list_tables",
@@ -44,51 +387,149 @@ def list_tables(state: State):
     }
     tool_call_message = AIMessage(content="", tool_calls=[tool_call])
 
-    list_tables_tool = next(tool for tool in tools if tool.name == "sql_db_list_tables")
-    tool_message = list_tables_tool.invoke(tool_call)
+    table_names = ", ".join(catalog_table_names(db_connection.DATABASE_PATH))
+    tool_message = ToolMessage(table_names, name="sql_db_list_tables", tool_call_id=tool_call["id"])
     response = AIMessage(f"Available tables: {tool_message.content}")
 
     return {"messages": [tool_call_message, tool_message, response]}
 
 def call_get_schema(state: State):
-    schema_llm = llm.bind_tools([get_schema_tool], tool_choice="any")
-    response = schema_llm.invoke(state["messages"])
+    schema_llm = get_llm().bind_tools([get_schema_tool], tool_choice="any")
+    response = schema_llm.invoke(context_window(state["messages"], context_settings))
+    record_llm_usage(response)
 
     return {"messages": [response]}
 
+def _schema_tables(state: State) -> list[str] | None:
+    """The tables of the latest schema request, which the next query is written against."""
+    for message in reversed(state["messages"]):
+        for tool_call in getattr(message, "tool_calls", None) or []:
+            if tool_call["name"] == get_schema_tool.name:
+                return [name.strip() for name in tool_call["args"].get("table_names", "").split(",") if name.strip()]
+    return None
+
 def generate_query(state: State, config: RunnableConfig):
     generate_query_system_prompt = config["configurable"].get("generate_query_system_prompt", "")
+    # The dialect is the one of the engine that will run queries over the tables just looked up.
     system_message = {
         "role": "system",
-        "content": generate_query_system_prompt.format(dialect=db_dialect, top_k=5),
+        "content": generate_query_system_prompt.format(dialect=get_db_dialect(_schema_tables(state)), top_k=5),
     }
     # We do not force a tool call here, to allow the model to
     # respond naturally when it obtains the solution.
-    query_run_llm = llm.bind_tools([run_query_tool])
-    response = query_run_llm.invoke([system_message] + state["messages"])
+    query_run_llm = get_llm().bind_tools([run_query_tool])
+    response = query_run_llm.invoke([system_message] + context_window(state["messages"], context_settings))
+    record_llm_usage(response)
 
     return {"messages": [response]}
 
 def check_query(state: State, config: RunnableConfig):
+    """
+    Has the LLM double-check every query of the last message that the local validator could not prove safe.
+    The checks run concurrently, one LLM call per query; the checked queries replace the original ones in
+    place, so the message keeps its calls in order, and queries proven safe are left as they are.
+    """
     check_query_system_prompt = config["configurable"].get("check_query_system_prompt", "")
-    system_message = {
-        "role": "system",
-        "content": check_query_system_prompt.format(dialect=db_dialect),
+    message = state["messages"][-1]
+    validations = _message_validations(message)
+    pending = [
+        position for position, (tool_call, validation) in enumerate(zip(message.tool_calls, validations))
+        if tool_call["name"] == run_query_tool.name and validation.verdict != "safe"
+    ]
+    prompts = []
+    for position in pending:
+        query = message.tool_calls[position]["args"].get("query", "")
+        dialect = "duckdb" if _query_backend(query, _inspect_query(query)) == "duckdb" else get_db_dialect()
+        system_message = {
+            "role": "system",
+            "content": check_query_system_prompt.format(dialect=dialect),
+        }
+        # Generate an artificial user message to check
+        prompts.append([system_message, {"role": "user", "content": query}])
+
+    query_checker_llm = get_llm().bind_tools([run_query_tool], tool_choice="any")
+    responses = query_checker_llm.batch(prompts, config={"max_concurrency": len(prompts)}) if prompts else []
+    tool_calls = list(message.tool_calls)
+    for position, response in zip(pending, responses):
+        record_llm_usage(response)
+        checked = next((call for call in response.tool_calls if call["name"] == run_query_tool.name), None)
+        if checked is not None:
+            tool_calls[position] = {**tool_calls[position], "args": checked["args"]}
+
+    return {"messages": [AIMessage(content=message.content, tool_calls=tool_calls, id=message.id)]}
+
+def _validate_tool_calls(message: AIMessage) -> list[Validation]:
+    """Runs the local validator on every query tool call of a message, against the live schema."""
+    entries = get_catalog(db_connection.DATABASE_PATH)
+    column_types = {
+        name: {column.lower(): declared_type for column, declared_type in entry.columns}
+        for name, entry in entries.items()
     }
+    with get_connection_manager(db_connection.DATABASE_PATH).reader() as conn:
+        validations = [
+            validate_query(conn, tool_call["args"].get("query", ""), column_types)
+            for tool_call in message.tool_calls
+        ]
+    # A query SQLite rejects may be written in DuckDB's dialect, over tables with columnar copies: DuckDB judges it.
+    for position, tool_call in enumerate(message.tool_calls):
+        query = tool_call["args"].get("query", "")
+        if validations[position].verdict == "rejected" and _query_backend(query, None) == "duckdb":
+            engine = get_columnar_engine(db_connection.DATABASE_PATH)
+            if engine is not None:
+                validations[position] = validate_columnar_query(engine.cursor(), query)
+    return validations
 
-    # Generate an artificial user message to check
-    tool_call = state["messages"][-1].tool_calls[0]
-    user_message = {"role": "user", "content": tool_call["args"]["query"]}
-    query_checker_llm = llm.bind_tools([run_query_tool], tool_choice="any")
-    response = query_checker_llm.invoke([system_message, user_message])
-    response.id = state["messages"][-1].id
+# The validations of recent messages, so that `should_continue` and the node it routes to validate a message once.
+_VALIDATION_MEMO_SIZE = 64
+_validation_memo: OrderedDict[tuple, list[Validation]] = OrderedDict()
+_validation_lock = threading.Lock()
 
-    return {"messages": [response]}
+def _message_validations(message: AIMessage) -> list[Validation]:
+    """The validations of a message's tool calls (see `_validate_tool_calls`), computed once per message id,
+    queries and catalog version."""
+    if message.id is None:
+        return _validate_tool_calls(message)
+    key = (
+        message.id,
+        tuple(tool_call["args"].get("query", "") for tool_call in message.tool_calls),
+        get_catalog_version(db_connection.DATABASE_PATH),
+    )
+    with _validation_lock:
+        if key in _validation_memo:
+            _validation_memo.move_to_end(key)
+            return _validation_memo[key]
+    validations = _validate_tool_calls(message)
+    with _validation_lock:
+        _validation_memo[key] = validations
+        while len(_validation_memo) > _VALIDATION_MEMO_SIZE:
+            _validation_memo.popitem(last=False)
+    return validations
+
+def reject_query(state: State):
+    """Answers the tool calls of a message containing a rejected query with the validator's errors,
+    so the model rewrites the query without it being run or sent to the checker."""
+    message = state["messages"][-1]
+    validations = _message_validations(message)
+    tool_messages = [
+        ToolMessage(
+            validation.reason if validation.verdict == "rejected"
+            else "Not executed because another query in the same message was rejected.",
+            name=tool_call["name"],
+            tool_call_id=tool_call["id"],
+        )
+        for tool_call, validation in zip(message.tool_calls, validations)
+    ]
+    return {"messages": tool_messages}
 
-def should_continue(state: State) -> Literal["__end__", "check_query"]:
+def should_continue(state: State) -> Literal["__end__", "check_query", "run_query", "reject_query"]:
     messages = state["messages"]
     last_message = messages[-1]
     if not last_message.tool_calls:
         return "__end__"
-    else:
-        return "check_query"
\ No newline at end of file
+    # Queries the local validator proves safe skip the LLM checker.
+    verdicts = {validation.verdict for validation in _message_validations(last_message)}
+    if "rejected" in verdicts:
+        return "reject_query"
+    if verdicts == {"safe"}:
+        return "run_query"
+    return "check_query"
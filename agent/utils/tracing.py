@@ -0,0 +1,68 @@
+import functools
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+from langgraph.config import get_stream_writer
+
+from data_handler import record, span, TRACE_EVENT_KEY
+from data_handler.tracing import Span
+
+def _emit(current: Span) -> None:
+    try:
+        writer = get_stream_writer()
+    except (RuntimeError, KeyError): # Called outside of a graph run
+        return
+    writer({TRACE_EVENT_KEY: current.to_dict()})
+
+@contextmanager
+def _node_span(name: str) -> Iterator[None]:
+    current = None
+    try:
+        with span(name) as current:
+            yield
+    finally:
+        # Emitted once the span is closed, so that it carries its duration. The web app requests the
+        # "custom" stream mode, records the span in its /metrics and adds it to the run's breakdown.
+        if current is not None:
+            _emit(current)
+
+def traced_node(node, name: str | None = None):
+    """
+    Wraps a graph node so that each of its runs is timed as a span, which also collects the LLM tokens,
+    queries and data_handler calls of the run. The span is sent on the run's custom stream when the node ends.
+
+    Args:
+        node: A node function, or a runnable such as a ToolNode.
+        name (str | None): The span name; defaults to the node's name.
+
+    Returns:
+        The wrapped node: a function with the same signature, or a runnable with sync and async paths.
+    """
+    if isinstance(node, Runnable):
+        name = name or node.get_name()
+
+        def invoke(state: Any, config: RunnableConfig):
+            with _node_span(name):
+                return node.invoke(state, config)
+
+        async def ainvoke(state: Any, config: RunnableConfig):
+            with _node_span(name):
+                return await node.ainvoke(state, config)
+
+        return RunnableLambda(invoke, afunc=ainvoke, name=name)
+
+    name = name or node.__name__
+
+    @functools.wraps(node)
+    def wrapper(*args, **kwargs):
+        with _node_span(name):
+            return node(*args, **kwargs)
+
+    return wrapper
+
+def record_llm_usage(response: AIMessage) -> None:
+    """Adds the tokens reported for an LLM response to the current node's span."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    record(llm_input_tokens=usage.get("input_tokens", 0), llm_output_tokens=usage.get("output_tokens", 0))
@@ -11,20 +11,59 @@ load_dotenv()
 import os
 import sqlite3
 import html
+import json
+import time
+import asyncio
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from typing import List, Optional, AsyncGenerator, Dict
-from io import BytesIO
 import uuid
 
 from fastapi import FastAPI, File, UploadFile, Request, Form, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from langgraph_sdk import get_client
 from markupsafe import Markup
 
-from data_handler import parse_file, push_to_db, DATABASE_PATH, list_tables, get_table_preview, delete_table
-
-app = FastAPI(title="DataPAL: A Conversational Data Analysis Tool")
+from agent.utils.batch import BatchSettings
+from data_handler import DATABASE_PATH, run_catalog_read, list_tables_async, plan_table_page_async, iterate_read, DEFAULT_PAGE_SIZE, delete_table_async, merge_staged_table_async, get_table_source_async, get_index_report_async, get_columnar_report_async, set_table_placement_async, get_rollup_report_async, catalog_table_names, add_table_write_listener, schedule_columnar_sync, shutdown_columnar_sync, start_index_advisor, stop_index_advisor, close_columnar_engines, sanitize_name, SourceFile, SourceHasher, plan_source_load, stage_file, stage_workbook, StagedTable, close_all_connections, shutdown_db_executors, metrics, observe_span, summarize_spans, TRACE_EVENT_KEY
+
+# Uploaded files are parsed in worker processes so that CPU-heavy parsing never blocks the event loop.
+# Database access goes through the async data_handler surface, which runs reads on a thread pool and
+# all writes on a single thread, so concurrent uploads never contend for the write lock.
+UPLOAD_READ_CHUNK_SIZE = 1024 * 1024
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(min(5, os.cpu_count() or 1))))
+ingest_executor: ProcessPoolExecutor | None = None
+
+def get_ingest_executor() -> ProcessPoolExecutor:
+    """Returns the process pool used for parsing uploads, creating it on first use."""
+    global ingest_executor
+    if ingest_executor is None:
+        ingest_executor = ProcessPoolExecutor(
+            max_workers=INGEST_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return ingest_executor
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Columnar copies are brought up to date at startup, and rebuilt in the background after every write.
+    schedule_columnar_sync(DB_PATH)
+    # Indexes are built by this process, the database's writer, for the column uses the agent records.
+    start_index_advisor(DB_PATH)
+    yield
+    stop_index_advisor()
+    if ingest_executor is not None:
+        ingest_executor.shutdown(cancel_futures=True)
+    shutdown_columnar_sync()
+    close_columnar_engines()
+    shutdown_db_executors()
+    close_all_connections()
+
+app = FastAPI(title="DataPAL: A Conversational Data Analysis Tool", lifespan=lifespan)
 APP_DIR = Path(__file__).resolve().parent.parent
 TEMPLATES_DIR = APP_DIR / "templates"
 STATIC_DIR = APP_DIR / "static"
@@ -40,12 +79,42 @@ templates.env.filters['nl2br'] = nl2br_filter
 app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
 
 DB_PATH = DATABASE_PATH
+add_table_write_listener(lambda table_name: schedule_columnar_sync(DB_PATH, table_name))
+
+LANGGRAPH_URL = "http://localhost:2024"
+_langgraph_client = None
+_langgraph_client_failed = False
 
-try:
-    langgraph_client = get_client(url="http://localhost:2024")
-except Exception as e:
-    print(f"Failed to initialize LangGraph client: {e}")
-    langgraph_client = None
+def get_langgraph_client():
+    """Returns the LangGraph client, creating it on first use so the SDK is not imported at startup.
+    Returns None if the client cannot be created."""
+    global _langgraph_client, _langgraph_client_failed
+    if _langgraph_client is None and not _langgraph_client_failed:
+        try:
+            from langgraph_sdk import get_client
+            _langgraph_client = get_client(url=LANGGRAPH_URL)
+        except Exception as e:
+            print(f"Failed to initialize LangGraph client: {e}")
+            _langgraph_client_failed = True
+    return _langgraph_client
+
+_batch_agent = None
+_batch_agent_failed = False
+
+def get_batch_agent():
+    """Returns the agent package, imported into this process on first use to answer batches of questions
+    from this app's database. Chat runs go through the LangGraph server instead. Returns None if the agent
+    cannot be imported."""
+    global _batch_agent, _batch_agent_failed
+    if _batch_agent is None and not _batch_agent_failed:
+        try:
+            import agent
+            agent.use_database(DB_PATH)
+            _batch_agent = agent
+        except Exception as e:
+            print(f"Failed to import the agent for batches: {e}")
+            _batch_agent_failed = True
+    return _batch_agent
 
 db_dir = os.path.dirname(DB_PATH)
 if db_dir and not os.path.exists(db_dir):
@@ -54,8 +123,9 @@ if db_dir and not os.path.exists(db_dir):
 @app.get("/", response_class=HTMLResponse)
 async def main_page(request: Request):
     """Serves the main page with file upload and table management."""
-    tables = list_tables(DB_PATH)
+    tables = await list_tables_async(DB_PATH)
     return templates.TemplateResponse(
+        request,
         "index.html", 
         {
             "request": request, 
@@ -66,17 +136,153 @@ async def main_page(request: Request):
         }
     )
 
+async def spool_upload(file: UploadFile, suffix: str, hasher: SourceHasher | None = None) -> str:
+    """Copies an upload to a temporary spool file in fixed-size chunks, so the request body is never held in memory.
+    The file keeps the upload's extension so the parser can recognise it. Returns the spool file path.
+    With `hasher`, the upload is fingerprinted in the same pass."""
+    loop = asyncio.get_running_loop()
+    fd, spool_path = tempfile.mkstemp(prefix="datapal_upload_", suffix=suffix)
+
+    def write_chunk(spool, chunk: bytes) -> None:
+        spool.write(chunk)
+        if hasher is not None:
+            hasher.update(chunk)
+
+    try:
+        with os.fdopen(fd, "wb") as spool:
+            await file.seek(0)
+            while chunk := await file.read(UPLOAD_READ_CHUNK_SIZE):
+                await loop.run_in_executor(None, write_chunk, spool, chunk)
+    except BaseException:
+        os.remove(spool_path)
+        raise
+    return spool_path
+
+async def merge_upload(
+    filename: str, staged: StagedTable, mode: str = "replace", key_column: str | None = None, source: SourceFile | None = None
+) -> dict:
+    """Merges a staged table into the database on the writer thread. Returns the upload result entry for it."""
+    if staged.sheet_name is not None:
+        filename = f"{filename} [{staged.sheet_name}]"
+    if not staged.parsed:
+        return {
+            "filename": filename, 
+            "status": "Failed to parse", 
+            "error": staged.error
+        }
+    if not staged.success:
+        return {
+            "filename": filename, 
+            "status": "Failed to insert", 
+            "error": staged.error, 
+            "attempted_table_name": staged.table_name
+        }
+
+    success, actual_table_name, error_message = await merge_staged_table_async(
+        staged.staging_path, staged.table_name, DB_PATH, mode, key_column, source
+    )
+    if success:
+        return {
+            "filename": filename, 
+            "status": "Success", 
+            "table_name": actual_table_name
+        }
+    return {
+        "filename": filename, 
+        "status": "Failed to insert", 
+        "error": error_message, 
+        "attempted_table_name": actual_table_name
+    }
+
+async def process_upload(file: UploadFile, all_sheets: bool = False, mode: str = "replace", key_column: str | None = None) -> list[dict]:
+    """Parses one uploaded file in the ingest process pool and merges it into the database on the writer thread.
+    Excel workbooks are ingested one table per worksheet when `all_sheets` is set.
+
+    Uploads of a single table are fingerprinted while they are spooled: a file identical to the one the table
+    was last loaded from is not loaded again, and of a CSV file that only grew at the end only the new rows
+    are parsed and appended. `mode` and `key_column` are passed on to `merge_staged_table`.
+    Returns the upload result entries for the file."""
+    spool_path = None
+    try:
+        if file.filename == "": # Handle case where empty file part is sent
+            return [{
+                "filename": "Unknown (empty part)", 
+                "status": "Skipped", 
+                "error": "Empty file part received."
+            }]
+        allowed_extensions = {".csv", ".xlsx", ".xls"}
+        file_ext = os.path.splitext(file.filename)[1].lower()
+        if file_ext not in allowed_extensions:
+            return [{
+                "filename": file.filename, 
+                "status": "Skipped", 
+                "error": f"Invalid file type: {file_ext}. Only CSV and Excel files are allowed."
+            }]
+
+        table_name_base = os.path.splitext(file.filename)[0]
+        loop = asyncio.get_running_loop()
+        if all_sheets and file_ext in {".xlsx", ".xls"}:
+            # Workbooks split into several tables are always loaded in full.
+            spool_path = await spool_upload(file, file_ext)
+            staged_tables = await loop.run_in_executor(
+                get_ingest_executor(), stage_workbook, spool_path, table_name_base
+            )
+            return [await merge_upload(file.filename, staged, mode, key_column) for staged in staged_tables]
+
+        table_name = sanitize_name(table_name_base, is_table=True)
+        previous = await get_table_source_async(table_name, DB_PATH)
+        hasher = SourceHasher(previous.size_bytes if previous else None)
+        spool_path = await spool_upload(file, file_ext, hasher)
+        source = hasher.result()
+        plan = plan_source_load(previous, source, appendable=file_ext == ".csv")
+        if plan.action == "skip":
+            return [{
+                "filename": file.filename, 
+                "status": "Unchanged", 
+                "table_name": table_name, 
+                "detail": "The file is identical to the one the table was last loaded from."
+            }]
+        if plan.action == "append_tail" and mode == "replace":
+            mode = "append"
+        staged = await loop.run_in_executor(
+            get_ingest_executor(), stage_file, spool_path, table_name_base, None, plan.offset
+        )
+        result = await merge_upload(file.filename, staged, mode, key_column, source)
+        if plan.action == "append_tail" and result["status"] == "Success":
+            result["detail"] = "Only the rows added since the last upload of the file were loaded."
+        return [result]
+    except Exception as e:
+        return [{
+            "filename": file.filename, 
+            "status": "Error", 
+            "error": str(e)
+        }]
+    finally:
+        await file.close()
+        if spool_path is not None and os.path.exists(spool_path):
+            os.remove(spool_path)
+
 @app.post("/uploadfiles/")
-async def create_upload_files(request: Request, files: List[UploadFile] = File(...)):
+async def create_upload_files(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    all_sheets: bool = Form(False),
+    mode: str = Form("replace"),
+    key_column: str = Form(""),
+):
     """Handles file uploads, parsing, and pushing to database. Returns JSON.
     
+    With the `all_sheets` form field set, every worksheet of an Excel workbook becomes its own table.
+    The `mode` form field chooses how an upload is written to an existing table of the same name:
+    'replace' (the default), 'append' its rows, or 'upsert' them on the `key_column` form field.
+
     The frontend expects a JSON response with keys:
     - tables: list of current table names
-    - upload_results: list of dicts, each with {filename, status, table_name?, error?, attempted_table_name?}
+    - upload_results: list of dicts, each with {filename, status, table_name?, detail?, error?, attempted_table_name?}
     - message: optional global success message string
     - error: optional global error message string
     """
-    current_tables = list_tables(DB_PATH) # Get initial state of tables
+    current_tables = await list_tables_async(DB_PATH) # Get initial state of tables
 
     if not files:
         return JSONResponse(
@@ -100,88 +306,28 @@ async def create_upload_files(request: Request, files: List[UploadFile] = File(.
             }
         )
 
-    results = []
-    has_errors = False
-
-    for file in files:
-        if file.filename == "": # Handle case where empty file part is sent
-            results.append(
-                {
-                    "filename": "Unknown (empty part)", 
-                    "status": "Skipped", 
-                    "error": "Empty file part received."
-                }
-            )
-            has_errors = True
-            continue  
-        try:
-            allowed_extensions = {".csv", ".xlsx", ".xls"}
-            file_ext = os.path.splitext(file.filename)[1].lower()
-            if file_ext not in allowed_extensions:
-                results.append(
-                    {
-                        "filename": file.filename, 
-                        "status": "Skipped", 
-                        "error": f"Invalid file type: {file_ext}. Only CSV and Excel files are allowed."
-                    }
-                )
-                has_errors = True
-                continue
+    if mode not in ("replace", "append", "upsert") or (mode == "upsert" and not key_column.strip()):
+        return JSONResponse(
+            status_code=400,
+            content={
+                "tables": current_tables, 
+                "upload_results": [], 
+                "message": None, 
+                "error": "Mode must be 'replace', 'append' or 'upsert', and upserting needs a key column."
+            }
+        )
 
-            await file.seek(0) 
-            file_bytes = await file.read()
-            file_like_object = BytesIO(file_bytes)
-            file_like_object.name = file.filename 
-
-            parsed_data = parse_file(file_like_object)
-
-            if parsed_data is not None:
-                table_name_base = os.path.splitext(file.filename)[0]
-                success, actual_table_name, error_message = push_to_db(parsed_data, table_name_base, DB_PATH)
-                if success:
-                    results.append(
-                        {
-                            "filename": file.filename, 
-                            "status": "Success", 
-                            "table_name": actual_table_name
-                        }
-                    )
-                else:
-                    results.append(
-                        {
-                            "filename": file.filename, 
-                            "status": "Failed to insert", 
-                            "error": error_message, 
-                            "attempted_table_name": actual_table_name
-                        }
-                    )
-                    has_errors = True
-            else:
-                results.append(
-                    {
-                        "filename": file.filename, 
-                        "status": "Failed to parse", 
-                        "error": "File could not be parsed. Check format/content."
-                    }
-                )
-                has_errors = True
-        except Exception as e:
-            results.append(
-                {
-                    "filename": file.filename, 
-                    "status": "Error", 
-                    "error": str(e)
-                }
-            )
-            has_errors = True
-        finally:
-            await file.close()
+    file_results = await asyncio.gather(
+        *(process_upload(file, all_sheets, mode, key_column.strip() or None) for file in files)
+    )
+    results = [result for file_result in file_results for result in file_result]
+    has_errors = any(result["status"] not in ("Success", "Unchanged") for result in results)
 
     final_message = "File processing complete. See details below." if not has_errors else None
     final_error_message = "Some files could not be processed. See details below." if has_errors else None
     
     # Get updated list of tables after processing
-    updated_tables = list_tables(DB_PATH)
+    updated_tables = await list_tables_async(DB_PATH)
 
     return JSONResponse(content={
         "tables": updated_tables if updated_tables is not None else [], 
@@ -192,41 +338,58 @@ async def create_upload_files(request: Request, files: List[UploadFile] = File(.
 
 @app.get("/tables/{table_name}/preview", response_class=HTMLResponse)
 async def preview_table_data(request: Request, table_name: str):
-    """Displays a preview of the specified table."""
+    """Displays a table. Its rows are loaded page by page from `/tables/{table_name}/rows` as the user scrolls."""
     try:
-        preview_df = get_table_preview(table_name, DB_PATH)
-        if preview_df is None: # Should not happen if get_table_preview raises error for non-existent table
-             raise HTTPException(status_code=404, detail=f"Table '{table_name}' not found or an error occurred during preview generation.")
-        
-        # Convert DataFrame to HTML, or pass it to the template to render
-        # For simplicity, sending as list of dicts. Jinja can make a table.
-        if not preview_df.empty:
-            data_html = preview_df.to_html(classes="dataframe", index=False, border=0)
-        else:
-            data_html = f"<p class='empty-table-message'>Table '{table_name}' is empty.</p>"
-
-        return templates.TemplateResponse("table_preview.html", {
+        page = await plan_table_page_async(table_name, DB_PATH)
+        return templates.TemplateResponse(request, "table_preview.html", {
             "request": request,
             "table_name": table_name,
-            "data_html": data_html, # Send HTML directly
-            "preview_data": preview_df.to_dict(orient="records") if not preview_df.empty else [],
-            "columns": list(preview_df.columns)
+            "columns": page.columns,
+            "sortable_columns": page.sortable_columns,
+            "page_size": DEFAULT_PAGE_SIZE,
         })
-    except FileNotFoundError: # Raised by get_table_preview if DB doesn't exist
-        raise HTTPException(status_code=404, detail=f"Database file not found at {DB_PATH}. Please upload files first.")
-    except ValueError as ve: # Raised by get_table_preview if table doesn't exist
-        raise HTTPException(status_code=404, detail=str(ve))
+    except LookupError as le:
+        raise HTTPException(status_code=404, detail=str(le))
     except Exception as e:
         # Log the exception e for debugging
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred while previewing table '{table_name}': {str(e)}")
 
+@app.get("/tables/{table_name}/rows")
+async def table_rows(
+    table_name: str,
+    columns: Optional[str] = None,
+    sort: Optional[str] = None,
+    order: str = "asc",
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+):
+    """A page of a table's rows as JSON, streamed from the database as it is read.
+
+    Query parameters:
+    - columns: comma-separated columns to return (default: all)
+    - sort: an indexed column to order by (default: insertion order); `sortable_columns` in the response lists them
+    - order: 'asc' or 'desc'
+    - cursor: the `next_cursor` of the previous page, which is null on the last page
+    - limit: the most rows to return
+    """
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be 'asc' or 'desc'.")
+    column_list = [column.strip() for column in columns.split(",") if column.strip()] if columns else None
+    try:
+        page = await plan_table_page_async(table_name, DB_PATH, column_list, sort or None, order == "desc", cursor, limit)
+    except LookupError as le:
+        raise HTTPException(status_code=404, detail=str(le))
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    return StreamingResponse(iterate_read(page.iter_json()), media_type="application/json")
+
 
 @app.post("/tables/{table_name}/delete", response_class=HTMLResponse)
 async def delete_table_data(request: Request, table_name: str):
     """Deletes the specified table from the database."""
     # table_name is now correctly taken from the path
     try:
-        success, message = delete_table(table_name, DB_PATH)
+        success, message = await delete_table_async(table_name, DB_PATH)
         if success:
             # Redirect to main page with a success message
             return RedirectResponse(url=f"/?message=Table '{table_name}' deleted successfully.", status_code=303)
@@ -261,12 +424,13 @@ async def chat_page(request: Request, thread_id: str):
     """Serves the chat page for a specific thread."""
     user_id = get_user_id(request) # Make sure user_id is available
     error_message_for_template = None
+    langgraph_client = get_langgraph_client()
     
     if not langgraph_client:
         print("Error in chat_page: LangGraph client was not initialized.")
         error_message_for_template = "Chat service is not available (LangGraph client not initialized). Please check server logs and ensure the LangGraph server is running at http://localhost:2024."
         # Render chat.html with an error message
-        return templates.TemplateResponse("chat.html", {
+        return templates.TemplateResponse(request, "chat.html", {
             "request": request,
             "thread_id": thread_id,
             "user_id": user_id,
@@ -285,7 +449,7 @@ async def chat_page(request: Request, thread_id: str):
         error_message_for_template = f"Could not initialize chat session due to a LangGraph error: {str(e)}. Please ensure the LangGraph server is running at http://localhost:2024 and is accessible."
 
     # Pass thread_id, user_id, and any error to the template
-    return templates.TemplateResponse("chat.html", {
+    return templates.TemplateResponse(request, "chat.html", {
         "request": request, 
         "thread_id": thread_id, 
         "user_id": user_id, 
@@ -347,6 +511,7 @@ async def send_chat_message(request: Request, thread_id: str):
     if not user_message_content or user_message_content.isspace():
         return JSONResponse(content={"error": "Message cannot be empty"}, status_code=400)
 
+    langgraph_client = get_langgraph_client()
     if not langgraph_client:
         # Return an error message in JSON format
         return JSONResponse(
@@ -360,7 +525,7 @@ async def send_chat_message(request: Request, thread_id: str):
             thread_id=thread_id,
             assistant_id="agent",
             input={"messages": [{"role": "user", "content": user_message_content}]},
-            stream_mode="messages" 
+            stream_mode=RUN_STREAM_MODES
         )
         run_id = run["run_id"]
         
@@ -374,112 +539,393 @@ async def send_chat_message(request: Request, thread_id: str):
             status_code=500
         )
 
+# Stream modes requested for agent runs: "messages" carries the LLM tokens, "updates" the node results used for
+# progress and "custom" the span of every finished node, which feeds /metrics and the run's trace.
+RUN_STREAM_MODES = ["messages", "updates", "custom"]
+# Only text produced by these nodes is part of the assistant's reply.
+ANSWER_NODES = {"generate_query"}
+# Assistant text is coalesced into frames of at least this many characters, or flushed after this many seconds.
+SSE_FRAME_CHARS = int(os.getenv("SSE_FRAME_CHARS", "48"))
+SSE_FRAME_INTERVAL = float(os.getenv("SSE_FRAME_INTERVAL", "0.05"))
+
+def sse_event(event: str, data: str) -> str:
+    """Formats one server-sent event. Multi-line data is sent as several data lines."""
+    data_lines = "\n".join(f"data: {line}" for line in data.split("\n"))
+    return f"event: {event}\n{data_lines}\n\n"
+
+def message_text(message) -> str:
+    """Extracts the text of a streamed message (a dict or a message object), ignoring tool-use blocks."""
+    content = message.get("content") if isinstance(message, dict) else getattr(message, "content", None)
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        parts = []
+        for content_block in content:
+            if isinstance(content_block, dict) and content_block.get("type") == "text" and "text" in content_block:
+                parts.append(content_block["text"])
+            elif isinstance(content_block, str): # Handle if a content block is just a string
+                parts.append(content_block)
+        return "".join(parts)
+    return ""
+
+def is_ai_message(message) -> bool:
+    if isinstance(message, dict):
+        return message.get("type") in ("ai", "AIMessageChunk") or message.get("role") in ("ai", "assistant")
+    return getattr(message, "type", None) in ("ai", "AIMessageChunk") or getattr(message, "role", None) == "ai"
+
+def progress_messages(node: str, update: dict | None) -> list[str]:
+    """Describes a finished graph node for the user, e.g. 'Listing tables...' or 'Query returned 12 rows'."""
+    messages = (update or {}).get("messages") or []
+    if node == "lookup_cached_query" and messages:
+        return ["Reusing the query from a previous answer..."]
+    if node == "select_tables" and messages:
+        tool_calls = messages[-1].get("tool_calls") or []
+        if tool_calls:
+            return [f"Reading the schema of {tool_calls[0]['args'].get('table_names', '')}..."]
+    if node == "list_tables":
+        return ["Listing tables..."]
+    if node == "call_get_schema":
+        return ["Choosing tables..."]
+    if node == "get_schema":
+        return ["Writing a query..."]
+    if node == "generate_query" and messages and messages[-1].get("tool_calls"):
+        count = len(messages[-1]["tool_calls"])
+        return ["Validating the query..." if count == 1 else f"Validating {count} queries..."]
+    if node == "check_query":
+        count = len((messages[-1].get("tool_calls") or []) if messages else [])
+        return ["Running the checked query..." if count <= 1 else f"Running {count} checked queries..."]
+    if node == "reject_query":
+        return ["Rewriting an invalid query..."]
+    if node == "run_query":
+        descriptions = []
+        for message in messages:
+            artifact = message.get("artifact") or {}
+            if artifact.get("error"):
+                descriptions.append("Query failed, retrying...")
+            elif artifact.get("row_count") is not None:
+                row_count = artifact["row_count"]
+                if artifact.get("truncated"):
+                    descriptions.append(f"Query returned more than {row_count} rows, showing the first {row_count}")
+                else:
+                    descriptions.append(f"Query returned {row_count} row{'s' if row_count != 1 else ''}")
+            else:
+                descriptions.append("Query finished")
+        return descriptions
+    return []
+
+CHAT_RUN_SECONDS = metrics.histogram(
+    "datapal_chat_run_seconds", "Time from opening a chat stream until the agent run finished."
+)
+CHAT_FIRST_TEXT_SECONDS = metrics.histogram(
+    "datapal_chat_first_text_seconds", "Time from opening a chat stream until the first answer text was sent."
+)
+SSE_RELAY_SECONDS = metrics.histogram(
+    "datapal_sse_relay_seconds", "Time per run spent relaying stream events to the browser, not waiting for the agent."
+)
+SSE_EVENTS = metrics.counter("datapal_sse_events_total", "Server-sent events sent to chat clients.", ("event",))
+
+# Per-run breakdowns of the most recent runs, served by /runs/{run_id}/trace.
+RUN_TRACE_HISTORY = int(os.getenv("RUN_TRACE_HISTORY", "100"))
+recent_run_traces: OrderedDict[str, dict] = OrderedDict()
+
+# Background requests to the LangGraph server (e.g. cancelling a run), kept referenced until they complete.
+pending_background_tasks: set[asyncio.Task] = set()
+
+def run_in_background(coroutine) -> None:
+    """Schedules a coroutine on its own task, e.g. because the current stream's task is being cancelled."""
+    try:
+        task = asyncio.get_running_loop().create_task(coroutine)
+    except RuntimeError: # No running loop, e.g. the generator is finalized at shutdown
+        coroutine.close()
+        return
+    pending_background_tasks.add(task)
+    task.add_done_callback(pending_background_tasks.discard)
+
+async def cancel_run(thread_id: str, run_id: str) -> None:
+    """Cancels an agent run, e.g. because nobody is listening to it anymore. A query it is running is interrupted."""
+    langgraph_client = get_langgraph_client()
+    if not langgraph_client:
+        return
+    try:
+        await langgraph_client.runs.cancel(thread_id, run_id, action="interrupt")
+        print(f"SSE_GENERATOR ({run_id}): Client disconnected, run cancelled.")
+    except Exception as e:
+        print(f"SSE_GENERATOR ({run_id}): Failed to cancel run after client disconnected: {type(e).__name__} - {e}")
+
+def cancel_run_in_background(thread_id: str, run_id: str) -> None:
+    """Schedules `cancel_run` on its own task, since the disconnected stream's own task is being cancelled."""
+    run_in_background(cancel_run(thread_id, run_id))
+
+async def save_run_trace(thread_id: str, trace: dict) -> None:
+    """Attaches a run's trace to its thread's metadata on the LangGraph server, as `last_run_trace`."""
+    langgraph_client = get_langgraph_client()
+    if not langgraph_client:
+        return
+    try:
+        await langgraph_client.threads.update(thread_id, metadata={"last_run_trace": trace})
+    except Exception as e:
+        print(f"SSE_GENERATOR ({trace['run_id']}): Failed to save the run trace: {type(e).__name__} - {e}")
+
+def record_run_trace(thread_id: str, trace: dict) -> None:
+    """Keeps a finished run's trace for /runs/{run_id}/trace, logs it and saves it with the thread."""
+    recent_run_traces[trace["run_id"]] = trace
+    while len(recent_run_traces) > RUN_TRACE_HISTORY:
+        recent_run_traces.popitem(last=False)
+    nodes = ", ".join(
+        f"{node} {summary['seconds'] * 1000:.0f} ms" + (f" x{summary['calls']}" if summary["calls"] > 1 else "")
+        for node, summary in trace["nodes"].items()
+    )
+    total = trace["total"]
+    print(
+        f"SSE_GENERATOR ({trace['run_id']}): Trace: {nodes}; {total['llm_input_tokens']}+{total['llm_output_tokens']} "
+        f"tokens, {total['queries']} queries returning {total['rows_returned']} rows; relay {trace['relay_seconds'] * 1000:.0f} ms."
+    )
+    run_in_background(save_run_trace(thread_id, trace))
+
 async def chat_message_generator(thread_id: str, run_id: str) -> AsyncGenerator[str, None]:
-    """Streams assistant responses via SSE."""
-    print(f"SSE_GENERATOR ({run_id}): Starting for thread {thread_id}. Will capture final assistant response.")
+    """Streams assistant responses via SSE.
+
+    Assistant text is forwarded incrementally as 'message' events carrying escaped HTML deltas,
+    coalesced into small frames. Node progress is reported through 'progress' events.
+    If the client disconnects before the run ends, the run is cancelled."""
+    print(f"SSE_GENERATOR ({run_id}): Starting for thread {thread_id}.")
+    langgraph_client = get_langgraph_client()
     if not langgraph_client:
         print(f"SSE_GENERATOR ({run_id}): LangGraph client not available.")
-        yield f"event: error\ndata: {html.escape('LangGraph client not available.')}\n\n"
-        yield f"event: close\ndata: {html.escape('Connection closed due to server error.')}\n\n"
+        yield sse_event("error", html.escape('LangGraph client not available.'))
+        yield sse_event("close", html.escape('Connection closed due to server error.'))
         return
 
-    latest_assistant_response_content = "" # Stores the latest full content of the assistant's response
     stream_event_count = 0
-    message_event_sent_count = 0 # Should be 0 or 1
+    message_event_sent_count = 0
+    message_nodes: dict[str, str] = {}   # message id -> node that produced it
+    emitted_text: dict[str, str] = {}    # message id -> text already forwarded
+    last_message_id = None
+    pending = []
+    last_flush = asyncio.get_running_loop().time()
+    run_finished = False
+    spans: list[dict] = []               # spans of the run's finished nodes
+    stream_started = time.perf_counter()
+    first_text_seconds = None
+    relay_seconds = 0.0                  # time spent handling events, as opposed to waiting for the agent
+    next_chunk: asyncio.Task | None = None
+
+    def flush() -> str | None:
+        nonlocal pending, last_flush, message_event_sent_count, first_text_seconds
+        last_flush = asyncio.get_running_loop().time()
+        if not pending:
+            return None
+        text = "".join(pending)
+        pending = []
+        message_event_sent_count += 1
+        SSE_EVENTS.inc(event="message")
+        if first_text_seconds is None:
+            first_text_seconds = time.perf_counter() - stream_started
+            CHAT_FIRST_TEXT_SECONDS.observe(first_text_seconds)
+        return sse_event("message", html.escape(text).replace("\n", "<br>"))
+
+    def add_text(message_id: str | None, text: str) -> None:
+        nonlocal last_message_id
+        if not text:
+            return
+        if last_message_id is not None and message_id != last_message_id:
+            # Separate the text of consecutive assistant messages.
+            pending.append("\n\n")
+        last_message_id = message_id
+        pending.append(text)
 
     try:
-        async for chunk in langgraph_client.runs.join_stream(
-            thread_id, run_id, stream_mode="messages" 
-        ):
+        stream = aiter(langgraph_client.runs.join_stream(thread_id, run_id, stream_mode=RUN_STREAM_MODES))
+        while True:
+            # Buffered text is sent once it waited SSE_FRAME_INTERVAL, even while no event arrives (e.g. the
+            # agent is running a query), so the wait for the next event times out at that point.
+            if next_chunk is None:
+                next_chunk = asyncio.ensure_future(anext(stream))
+            timeout = max(0.0, last_flush + SSE_FRAME_INTERVAL - asyncio.get_running_loop().time()) if pending else None
+            done, _ = await asyncio.wait((next_chunk,), timeout=timeout)
+            if not done:
+                yield flush()
+                continue
+            finished, next_chunk = next_chunk, None
+            try:
+                chunk = finished.result()
+            except StopAsyncIteration:
+                break
             stream_event_count += 1
-            # print(f"SSE_GENERATOR ({run_id}): Chunk {stream_event_count}, Event: {chunk.event}, Raw Data: {chunk.data}") # Very verbose
+            event_received = time.perf_counter()
 
             if chunk.event == "error":
+                run_finished = True
                 error_data = chunk.data if chunk.data else "Unknown stream error"
                 print(f"SSE_GENERATOR ({run_id}): Yielding 'error' event due to stream error. Data: {error_data}")
-                yield f"event: error\ndata: {html.escape(f'Stream error: {str(error_data)}')}\n\n"
-                yield f"event: close\ndata: {html.escape('Connection closed due to stream error.')}\n\n"
-                print(f"SSE_GENERATOR ({run_id}): SENT SSE 'error' and 'close' events to client due to LangGraph stream error.")
+                frame = flush()
+                if frame:
+                    yield frame
+                yield sse_event("error", html.escape(f'Stream error: {str(error_data)}'))
+                yield sse_event("close", html.escape('Connection closed due to stream error.'))
                 return
-            
-            elif chunk.event == "close": 
-                print(f"SSE_GENERATOR ({run_id}): Received 'close' event from langgraph stream itself (chunk {stream_event_count}). Not acting yet.")
-                # This event signals the end of the LangGraph stream.
-                # The final latest_assistant_response_content should be assembled by now.
-                pass 
-            
-            elif chunk.event in ["messages", "messages/partial"] and chunk.data:
-                event_type = chunk.event
-                # print(f"SSE_GENERATOR ({run_id}): Processing '{event_type}' event (chunk {stream_event_count}).")
-
-                current_chunk_ai_content = None
-                # Iterate reversed to find the most recent AI message in this chunk's data
-                for message_obj in reversed(chunk.data):
-                    msg_content_data = None
-                    is_ai_message = False
-
-                    # Check for AIMessageChunk (streaming, .role)
-                    if hasattr(message_obj, 'role') and message_obj.role == 'ai':
-                        is_ai_message = True
-                        msg_content_data = message_obj.content
-                    # Check for AIMessage (complete message, .type)
-                    elif hasattr(message_obj, 'type') and message_obj.type == 'ai':
-                        is_ai_message = True
-                        msg_content_data = message_obj.content
-                    # Fallback for dict representation (e.g., if not using Pydantic models directly)
-                    elif isinstance(message_obj, dict):
-                        role = message_obj.get("role")
-                        msg_type = message_obj.get("type") # Less common for 'ai' but for completeness
-                        if role == "ai" or role == "assistant" or msg_type == "ai":
-                            is_ai_message = True
-                            msg_content_data = message_obj.get("content")
-                    
-                    if is_ai_message:
-                        if isinstance(msg_content_data, str):
-                            current_chunk_ai_content = msg_content_data
-                            # print(f"SSE_GENERATOR ({run_id}):   Found string content: '{current_chunk_ai_content[:50]}...'")
-                            break 
-                        elif isinstance(msg_content_data, list):
-                            # print(f"SSE_GENERATOR ({run_id}):   Found list content, processing blocks.")
-                            temp_parts = []
-                            for block_idx, content_block in enumerate(msg_content_data):
-                                if isinstance(content_block, dict) and content_block.get("type") == "text" and "text" in content_block:
-                                    text_part = content_block["text"]
-                                    # print(f"SSE_GENERATOR ({run_id}):     Extracted text_part from block {block_idx}: '{text_part[:50]}...'")
-                                    temp_parts.append(text_part)
-                                elif isinstance(content_block, str): # Handle if a content block is just a string
-                                    temp_parts.append(content_block)
-                            current_chunk_ai_content = "".join(temp_parts)
-                            break 
-                
-                if current_chunk_ai_content is not None:
-                    latest_assistant_response_content = current_chunk_ai_content
-                    # print(f"SSE_GENERATOR ({run_id}): Updated latest_assistant_response_content (len {len(latest_assistant_response_content)})")
-            else:
-                print(f"SSE_GENERATOR ({run_id}): Received unhandled/logging-only chunk event (chunk {stream_event_count}): {chunk.event}")
 
-        # After the loop finishes, send the single, final message
-        print(f"SSE_GENERATOR ({run_id}): LangGraph stream loop finished. Total chunks received: {stream_event_count}.")
-        
-        if latest_assistant_response_content.strip():
-            print(f"SSE_GENERATOR ({run_id}): Sending final assistant message to client (length {len(latest_assistant_response_content)}).")
-            yield f"event: message\ndata: {latest_assistant_response_content.replace(chr(10), '<br>')}\n\n"
-            message_event_sent_count = 1
-        else:
-            print(f"SSE_GENERATOR ({run_id}): Final assistant message is empty. Not sending 'message' event.")
+            elif chunk.event == "messages/metadata" and isinstance(chunk.data, dict):
+                for message_id, info in chunk.data.items():
+                    node = ((info or {}).get("metadata") or {}).get("langgraph_node")
+                    if node:
+                        message_nodes[message_id] = node
+
+            elif chunk.event in ("messages/partial", "messages/complete") and chunk.data:
+                # These events carry every message accumulated so far; forward only the new suffix.
+                for message_obj in chunk.data:
+                    if not is_ai_message(message_obj):
+                        continue
+                    message_id = message_obj.get("id") if isinstance(message_obj, dict) else getattr(message_obj, "id", None)
+                    if message_nodes.get(message_id, "generate_query") not in ANSWER_NODES:
+                        continue
+                    text = message_text(message_obj)
+                    already_sent = emitted_text.get(message_id, "")
+                    if text.startswith(already_sent):
+                        add_text(message_id, text[len(already_sent):])
+                        emitted_text[message_id] = text
+
+            elif chunk.event == "messages" and chunk.data:
+                # Tuple mode: (message chunk, metadata) pairs carrying only the delta.
+                message_obj, metadata = chunk.data[0], (chunk.data[1] if len(chunk.data) > 1 else {})
+                if is_ai_message(message_obj) and (metadata or {}).get("langgraph_node", "generate_query") in ANSWER_NODES:
+                    message_id = message_obj.get("id") if isinstance(message_obj, dict) else getattr(message_obj, "id", None)
+                    add_text(message_id, message_text(message_obj))
+
+            elif chunk.event == "updates" and isinstance(chunk.data, dict):
+                for node, update in chunk.data.items():
+                    descriptions = progress_messages(node, update if isinstance(update, dict) else None)
+                    if descriptions:
+                        frame = flush()
+                        if frame:
+                            yield frame
+                    for description in descriptions:
+                        SSE_EVENTS.inc(event="progress")
+                        yield sse_event("progress", html.escape(description))
+
+            elif chunk.event == "custom" and isinstance(chunk.data, dict) and TRACE_EVENT_KEY in chunk.data:
+                span_data = chunk.data[TRACE_EVENT_KEY]
+                observe_span(span_data)
+                spans.append(span_data)
+
+            elif chunk.event not in ("metadata", "close"):
+                print(f"SSE_GENERATOR ({run_id}): Received unhandled/logging-only chunk event (chunk {stream_event_count}): {chunk.event}")
 
-        print(f"SSE_GENERATOR ({run_id}): Total 'message' events sent to client: {message_event_sent_count}")
-        yield f"event: close\ndata: {html.escape('Stream ended.')}\n\n"
-        print(f"SSE_GENERATOR ({run_id}): SENT final SSE 'close' event to client.")
+            if pending and (
+                sum(len(part) for part in pending) >= SSE_FRAME_CHARS
+                or asyncio.get_running_loop().time() - last_flush >= SSE_FRAME_INTERVAL
+            ):
+                yield flush()
+            relay_seconds += time.perf_counter() - event_received
+
+        run_finished = True
+        frame = flush()
+        if frame:
+            yield frame
+        print(f"SSE_GENERATOR ({run_id}): LangGraph stream loop finished. Chunks received: {stream_event_count}, 'message' events sent: {message_event_sent_count}.")
+        stream_seconds = time.perf_counter() - stream_started
+        CHAT_RUN_SECONDS.observe(stream_seconds)
+        SSE_RELAY_SECONDS.observe(relay_seconds)
+        if spans:
+            record_run_trace(thread_id, {
+                "run_id": run_id,
+                **summarize_spans(spans),
+                "stream_seconds": round(stream_seconds, 6),
+                "first_text_seconds": round(first_text_seconds, 6) if first_text_seconds is not None else None,
+                "relay_seconds": round(relay_seconds, 6),
+            })
+        yield sse_event("close", html.escape('Stream ended.'))
 
     except Exception as e:
         print(f"SSE_GENERATOR ({run_id}): CRITICAL Error during SSE streaming: {type(e).__name__} - {e}")
         import traceback
         print(traceback.format_exc())
-        yield f"event: error\ndata: {html.escape(f'Error streaming response: {str(e)}')}\n\n"
-        yield f"event: close\ndata: {html.escape('Connection closed due to server error.')}\n\n"
+        yield sse_event("error", html.escape(f'Error streaming response: {str(e)}'))
+        yield sse_event("close", html.escape('Connection closed due to server error.'))
         print(f"SSE_GENERATOR ({run_id}): SENT SSE 'error' and 'close' events to client due to CRITICAL exception.")
-
+    finally:
+        if next_chunk is not None:
+            next_chunk.cancel()
+        # Reached without the run having finished when the client disconnected (the generator is closed or
+        # cancelled) or the stream broke; nobody will read the run's answer, so stop it.
+        if not run_finished:
+            cancel_run_in_background(thread_id, run_id)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus metrics: agent node timings, LLM tokens, query sizes, data_handler and SSE timings."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/indexes")
+async def index_report():
+    """The indexes built by the index advisor or at upload, with the speedup measured when each was built."""
+    return JSONResponse(content={"indexes": [record.to_dict() for record in await get_index_report_async()]})
+
+@app.get("/rollups")
+async def rollup_report():
+    """The rollups of large tables the agent's aggregate queries are rewritten to read."""
+    return JSONResponse(content={"rollups": [rollup.to_dict() for rollup in await get_rollup_report_async()]})
+
+@app.get("/columnar")
+async def columnar_report():
+    """The tables with a columnar copy or a pinned placement, and whether each copy is current."""
+    return JSONResponse(content={"tables": [copy.to_dict() for copy in await get_columnar_report_async()]})
+
+@app.post("/tables/{table_name}/placement")
+async def set_placement(table_name: str, placement: str = Form(...)):
+    """Pins a table to the columnar store ('columnar') or to SQLite only ('sqlite'), or places it by size ('auto')."""
+    if placement not in ("auto", "sqlite", "columnar"):
+        raise HTTPException(status_code=400, detail="Placement must be 'auto', 'sqlite' or 'columnar'.")
+    if table_name not in await run_catalog_read(catalog_table_names, DB_PATH):
+        raise HTTPException(status_code=404, detail=f"Table '{table_name}' not found.")
+    await set_table_placement_async(table_name, placement, DB_PATH)
+    return JSONResponse(content={"table": table_name, "placement": placement})
+
+@app.post("/batch")
+async def answer_batch_questions(request: Request):
+    """
+    Answers a batch of questions, e.g. the canned questions of a report. The body is JSON:
+    {"questions": [...], "concurrency": 4, "timeout": 120}, where concurrency (at most BATCH_CONCURRENCY)
+    and the per-question timeout in seconds are optional. The answers are streamed back as JSON lines,
+    in the order they complete, each with the `index` of its question.
+    """
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="The body must be JSON.")
+    questions = body.get("questions") if isinstance(body, dict) else None
+    if not isinstance(questions, list) or not questions or not all(isinstance(q, str) and q.strip() for q in questions):
+        raise HTTPException(status_code=400, detail="'questions' must be a non-empty list of questions.")
+    agent = get_batch_agent()
+    if agent is None:
+        raise HTTPException(status_code=503, detail="The agent is not available.")
+    settings = BatchSettings.from_env()
+    if len(questions) > settings.max_questions:
+        raise HTTPException(status_code=400, detail=f"A batch holds at most {settings.max_questions} questions.")
+    try:
+        concurrency = min(int(body.get("concurrency", settings.concurrency)), settings.concurrency)
+        timeout = float(body.get("timeout", settings.timeout))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="'concurrency' and 'timeout' must be numbers.")
+    if concurrency < 1 or timeout <= 0:
+        raise HTTPException(status_code=400, detail="'concurrency' and 'timeout' must be positive.")
+    settings.concurrency, settings.timeout = concurrency, timeout
+
+    async def answers() -> AsyncGenerator[str, None]:
+        # Runs still going when the client disconnects are cancelled as the generator closes.
+        async for answer in agent.answer_batch([q.strip() for q in questions], settings):
+            yield json.dumps(answer.to_dict()) + "\n"
+
+    return StreamingResponse(answers(), media_type="application/x-ndjson")
+
+@app.get("/runs/{run_id}/trace")
+async def run_trace(run_id: str):
+    """The per-node breakdown of a recent run streamed by this app."""
+    trace = recent_run_traces.get(run_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="No trace recorded for this run.")
+    return JSONResponse(content=trace)
 
 @app.get("/chat/{thread_id}/get-message", response_class=StreamingResponse)
 async def get_chat_message_stream(thread_id: str, run_id: Optional[str] = None):
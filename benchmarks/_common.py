@@ -0,0 +1,84 @@
+"""Helpers shared by the benchmark scripts: size parsing, latency summaries and JSON result files."""
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+_SIZE = re.compile(r"^\s*([0-9.]+)\s*([KMG]?B?)\s*$", re.IGNORECASE)
+_UNITS = {"": 1, "B": 1, "K": 1024, "KB": 1024, "M": 1024 ** 2, "MB": 1024 ** 2, "G": 1024 ** 3, "GB": 1024 ** 3}
+
+def parse_size(text: str) -> int:
+    """Parses a size such as '10MB' or '2GB' into bytes."""
+    match = _SIZE.match(text)
+    if not match:
+        raise ValueError(f"Invalid size: {text!r}")
+    number, unit = match.groups()
+    return int(float(number) * _UNITS[unit.upper()])
+
+def format_size(size: int) -> str:
+    for unit in ("GB", "MB", "KB"):
+        if size >= _UNITS[unit]:
+            return f"{size / _UNITS[unit]:g}{unit}"
+    return f"{size}B"
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def summarize_latencies(seconds: list[float]) -> dict:
+    """Summarizes latencies given in seconds as milliseconds."""
+    if not seconds:
+        return {"count": 0}
+    return {
+        "count": len(seconds),
+        "mean_ms": round(statistics.fmean(seconds) * 1000, 3),
+        "p50_ms": round(statistics.median(seconds) * 1000, 3),
+        "p95_ms": round(percentile(seconds, 95) * 1000, 3),
+        "p99_ms": round(percentile(seconds, 99) * 1000, 3),
+        "max_ms": round(max(seconds) * 1000, 3),
+    }
+
+def environment_info() -> dict:
+    """Describes the build and machine a result was measured on, so results of different builds can be compared."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=PROJECT_ROOT, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def write_results(path: str, suite: str, parameters: dict, results: list[dict]) -> None:
+    """Saves a suite's results as JSON, together with the environment they were measured in."""
+    document = {"suite": suite, "environment": environment_info(), "parameters": parameters, "results": results}
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2, default=str)
+    print(f"Results written to {path}")
+
+def use_scratch_database(directory: str, agent: bool = False) -> str:
+    """
+    Points DB_PATH at a fresh database in `directory` and makes the project importable.
+    Call before importing data_handler or (with `agent=True`) the agent, which read DB_PATH on import.
+    """
+    db_path = os.path.join(directory, "bench.db")
+    os.environ["DB_PATH"] = db_path
+    paths = [str(PROJECT_ROOT / "agent"), str(PROJECT_ROOT)] if agent else [str(PROJECT_ROOT)]
+    for path in reversed(paths):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    return db_path
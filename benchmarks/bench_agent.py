@@ -0,0 +1,249 @@
+"""
+Agent benchmark: end-to-end latency of the compiled LangGraph `agent` over a fixed set of questions.
+
+The LLM is replaced by a replay model that returns recorded responses (tool calls and answers) in order, so
+runs are deterministic, free and measure only the graph's own overhead: table selection, schema lookups,
+validation, query execution and caching. Each scenario exercises a different path through the graph:
+
+    safe_sum        a query the validator proves safe runs without the LLM checker
+    join_checked    an ambiguous join goes through `check_query`
+    dml_rejected    a DELETE is rejected by the validator and rewritten
+    list_fallback   no table matches the question, so the graph lists tables and asks for a schema
+    multi_query     one message with three queries: the ambiguous one is checked, then all run concurrently
+
+Cold runs clear the question and query result caches first; warm runs keep them, so repeated questions are
+answered from the question cache. Per-node wall times come from the spans the traced nodes send on the
+graph's custom stream.
+
+A long thread is also measured: `--thread-turns` questions asked one after another in the same thread, each
+running a query with a large result, with the approximate tokens sent to the model per call. With the
+conversation history bounded, they stop growing once the thread exceeds CONTEXT_MAX_TOKENS.
+
+Usage:
+    python benchmarks/bench_agent.py --iterations 50 --output results/agent.json
+"""
+import argparse
+import importlib
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import asdict
+
+from _common import summarize_latencies, use_scratch_database, write_results
+
+def tool_call(name: str, call_id: str, **args) -> dict:
+    return {"name": name, "args": args, "id": call_id, "type": "tool_call"}
+
+# Recorded LLM responses per scenario, in the order the graph asks for them. Each entry is
+# (content, tool calls). A run that hits the question cache only asks for the last one, the answer.
+SCENARIOS = {
+    "safe_sum": (
+        "What is the total amount of sales in the north region?",
+        [
+            ("", [tool_call("sql_db_query", "q1", query="SELECT SUM(amount) FROM sales WHERE region = 'north'")]),
+            ("The total amount of sales in the north region is shown above.", []),
+        ],
+    ),
+    "join_checked": (
+        "Which customers from the sales table spent the most?",
+        [
+            ("", [tool_call(
+                "sql_db_query", "q1",
+                query="SELECT c.name, SUM(s.amount) AS total FROM sales s JOIN customers c "
+                      "ON s.customer_id = c.id GROUP BY c.name ORDER BY total DESC LIMIT 5",
+            )]),
+            ("", [tool_call(
+                "sql_db_query", "q1",
+                query="SELECT c.name, SUM(s.amount) AS total FROM sales s JOIN customers c "
+                      "ON s.customer_id = c.id GROUP BY c.name ORDER BY total DESC LIMIT 5",
+            )]),
+            ("The customers who spent the most are listed above.", []),
+        ],
+    ),
+    "dml_rejected": (
+        "Remove the cancelled sales and tell me how many are left",
+        [
+            ("", [tool_call("sql_db_query", "q1", query="DELETE FROM sales WHERE status = 'cancelled'")]),
+            ("", [tool_call("sql_db_query", "q2", query="SELECT COUNT(*) FROM sales WHERE status != 'cancelled'")]),
+            ("That many sales are not cancelled.", []),
+        ],
+    ),
+    "list_fallback": (
+        "How many things are there?",
+        [
+            ("", [tool_call("sql_db_schema", "s1", table_names="inventory")]),
+            ("", [tool_call("sql_db_query", "q1", query="SELECT SUM(quantity) FROM inventory")]),
+            ("There are that many things in the inventory.", []),
+        ],
+    ),
+    "multi_query": (
+        "Compare the sales per region with the inventory and the staff per department",
+        [
+            ("", [
+                tool_call("sql_db_query", "q1", query="SELECT region, SUM(amount) FROM sales GROUP BY region"),
+                tool_call("sql_db_query", "q2", query="SELECT SUM(quantity) FROM inventory"),
+                tool_call(
+                    "sql_db_query", "q3",
+                    query="SELECT department, COUNT(*) FROM employees e JOIN sales s ON s.id = e.id GROUP BY department",
+                ),
+            ]),
+            ("", [tool_call(
+                "sql_db_query", "c3",
+                query="SELECT e.department, COUNT(*) FROM employees e JOIN sales s ON s.id = e.id GROUP BY e.department",
+            )]),
+            ("Sales, inventory and staff are compared above.", []),
+        ],
+    ),
+}
+
+def create_tables(db_path: str, rows: int) -> None:
+    import numpy as np
+    import pandas as pd
+    from data_handler import push_to_db
+
+    rng = np.random.default_rng(0)
+    frames = {
+        "sales": pd.DataFrame({
+            "id": np.arange(rows),
+            "customer_id": rng.integers(0, 1000, rows),
+            "region": rng.choice(["north", "south", "east", "west"], rows),
+            "status": rng.choice(["shipped", "cancelled", "pending"], rows),
+            "amount": np.round(rng.random(rows) * 1000, 2),
+        }),
+        "customers": pd.DataFrame({"id": np.arange(1000), "name": [f"customer {i}" for i in range(1000)]}),
+        "inventory": pd.DataFrame({"sku": np.arange(500), "quantity": rng.integers(0, 50, 500)}),
+        "employees": pd.DataFrame({"id": np.arange(200), "department": rng.choice(["ops", "it", "hr"], 200)}),
+    }
+    for name, df in frames.items():
+        success, _, error = push_to_db(df, name, db_path)
+        if not success:
+            raise RuntimeError(error)
+
+def make_replay_model():
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage
+    from langchain_core.messages.utils import count_tokens_approximately
+    from langchain_core.outputs import ChatGeneration, ChatResult
+
+    class ReplayChatModel(BaseChatModel):
+        """Returns the queued responses in order, whatever the prompt. Tool binding is a no-op."""
+        responses: list = []
+        calls: int = 0
+        prompt_tokens: list = []
+
+        @property
+        def _llm_type(self) -> str:
+            return "replay"
+
+        def bind_tools(self, tools, **kwargs):
+            return self
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+            if not self.responses:
+                raise RuntimeError("The replay model ran out of recorded responses")
+            content, tool_calls = self.responses.pop(0)
+            self.calls += 1
+            self.prompt_tokens.append(count_tokens_approximately(messages))
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content, tool_calls=tool_calls))])
+
+    return ReplayChatModel()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=30, help="runs per scenario and cache mode")
+    parser.add_argument("--rows", type=int, default=100_000, help="rows in the sales table")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated scenarios")
+    parser.add_argument("--thread-turns", type=int, default=30, help="questions asked in the long thread")
+    parser.add_argument("--output", default="benchmarks/results/agent.json", help="JSON results file")
+    args = parser.parse_args()
+
+    db_path = use_scratch_database(tempfile.mkdtemp(prefix="datapal_bench_agent_"), agent=True)
+    create_tables(db_path, args.rows)
+    agent = importlib.import_module("agent").agent
+    tools = importlib.import_module("utils.tools")
+    Configuration = importlib.import_module("utils.config").Configuration
+
+    model = make_replay_model()
+    tools.get_llm = lambda: model
+    configurable = asdict(Configuration())
+    from data_handler import get_catalog_version, summarize_spans, TRACE_EVENT_KEY
+
+    def run(question: str, responses: list) -> tuple[int, list[dict]]:
+        """Runs the graph on a question, returning the LLM calls made and the spans of its nodes."""
+        cached = tools.question_cache.get(question, get_catalog_version(db_path)) is not None
+        model.responses = list(responses[-1:] if cached else responses)
+        model.calls = 0
+        spans = [
+            chunk[TRACE_EVENT_KEY]
+            for chunk in agent.stream(
+                {"messages": [{"role": "user", "content": question}]},
+                config={"configurable": configurable},
+                stream_mode="custom",
+            )
+            if TRACE_EVENT_KEY in chunk
+        ]
+        return model.calls, spans
+
+    results = []
+    for name in args.scenarios.split(","):
+        question, responses = SCENARIOS[name]
+        run(question, responses)  # warm up imports and connections
+        for mode in ("cold", "warm"):
+            latencies = []
+            node_totals = defaultdict(float)
+            llm_calls = 0
+            for _ in range(args.iterations):
+                if mode == "cold":
+                    tools.question_cache.clear()
+                    tools.query_cache.clear()
+                start = time.perf_counter()
+                calls, spans = run(question, responses)
+                latencies.append(time.perf_counter() - start)
+                llm_calls += calls
+                for node, summary in summarize_spans(spans)["nodes"].items():
+                    node_totals[node] += summary["seconds"]
+
+            result = {
+                "scenario": name,
+                "mode": mode,
+                **summarize_latencies(latencies),
+                "llm_calls_per_run": round(llm_calls / args.iterations, 2),
+                "node_mean_ms": {
+                    node: round(seconds / args.iterations * 1000, 3) for node, seconds in sorted(node_totals.items())
+                },
+            }
+            results.append(result)
+            print(f"{name} ({mode}): p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms, "
+                  f"{result['llm_calls_per_run']} LLM calls per run")
+
+    # The long thread: the graph is compiled with an in-memory checkpointer, as the LangGraph server runs it.
+    from langgraph.checkpoint.memory import MemorySaver
+
+    thread_agent = importlib.import_module("agent").builder.compile(checkpointer=MemorySaver())
+    thread_config = {"configurable": {**configurable, "thread_id": "long-thread"}}
+    latencies, turn_tokens = [], []
+    for turn in range(args.thread_turns):
+        query = f"SELECT id, region, status, amount FROM sales WHERE id >= {turn} ORDER BY id LIMIT 150"
+        model.responses = [("", [tool_call("sql_db_query", f"q{turn}", query=query)]), (f"Here are the sales from {turn} on.", [])]
+        model.prompt_tokens = []
+        tools.question_cache.clear()
+        start = time.perf_counter()
+        thread_agent.invoke({"messages": [{"role": "user", "content": f"List the sales from id {turn} on"}]}, config=thread_config)
+        latencies.append(time.perf_counter() - start)
+        turn_tokens.append(max(model.prompt_tokens))
+    if turn_tokens:
+        result = {
+            "scenario": "long_thread",
+            "mode": "thread",
+            **summarize_latencies(latencies),
+            "prompt_tokens_first_turn": turn_tokens[0],
+            "prompt_tokens_last_turn": turn_tokens[-1],
+            "prompt_tokens_max": max(turn_tokens),
+        }
+        results.append(result)
+        print(f"long_thread ({args.thread_turns} turns): p50 {result['p50_ms']} ms, prompt tokens "
+              f"{turn_tokens[0]} on the first turn, {turn_tokens[-1]} on the last, {max(turn_tokens)} at most")
+    write_results(args.output, "agent", vars(args), results)
+
+if __name__ == "__main__":
+    main()
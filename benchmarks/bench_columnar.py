@@ -0,0 +1,103 @@
+"""
+Latency of analytical queries over a large table, run on SQLite and on the table's columnar copy with DuckDB.
+
+Creates a scratch table of `--rows` rows, exports its columnar copy (timed), then runs each query
+`--iterations` times on both engines through the agent's query runners, the way `sql_db_query` runs them:
+
+    count           COUNT(*) over the whole table
+    group_sum       SUM and AVG of two columns per region
+    filtered_group  the same, over the rows of one year
+    distinct        COUNT(DISTINCT) of a high-cardinality column
+
+Usage:
+    python benchmarks/bench_columnar.py --rows 20000000 --iterations 5 --output results/columnar.json
+"""
+import argparse
+import tempfile
+import time
+
+from _common import summarize_latencies, use_scratch_database, write_results
+
+QUERIES = {
+    "count": "SELECT COUNT(*) FROM sales",
+    "group_sum": "SELECT region, SUM(amount), AVG(quantity) FROM sales GROUP BY region ORDER BY region",
+    "filtered_group": (
+        "SELECT region, SUM(amount), COUNT(*) FROM sales "
+        "WHERE sold_on >= '2023-01-01' AND sold_on < '2024-01-01' GROUP BY region ORDER BY region"
+    ),
+    "distinct": "SELECT COUNT(DISTINCT customer_id) FROM sales",
+}
+
+def create_table(db_path: str, rows: int, chunk_rows: int) -> None:
+    """Loads the table in chunks, appending each one, so that building it never holds all rows in memory."""
+    import numpy as np
+    import pandas as pd
+    from data_handler import push_to_db
+
+    rng = np.random.default_rng(0)
+    start_day = np.datetime64("2020-01-01")
+    for offset in range(0, rows, chunk_rows):
+        size = min(chunk_rows, rows - offset)
+        df = pd.DataFrame({
+            "region": rng.choice(["north", "south", "east", "west"], size),
+            "customer_id": rng.integers(0, 1_000_000, size),
+            "amount": np.round(rng.random(size) * 1000, 2),
+            "quantity": rng.integers(1, 50, size),
+            "sold_on": (start_day + rng.integers(0, 5 * 365, size)).astype(str),
+        })
+        success, _, error = push_to_db(df, "sales", db_path, mode="replace" if offset == 0 else "append")
+        if not success:
+            raise RuntimeError(error)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20_000_000, help="rows of the scratch table")
+    parser.add_argument("--chunk-rows", type=int, default=1_000_000, help="rows loaded per chunk")
+    parser.add_argument("--iterations", type=int, default=5, help="runs of each query on each engine")
+    parser.add_argument("--timeout", type=float, default=600.0, help="time budget of one query, in seconds")
+    parser.add_argument("--output", default="benchmarks/results/columnar.json", help="JSON results file")
+    args = parser.parse_args()
+
+    db_path = use_scratch_database(tempfile.mkdtemp(prefix="datapal_bench_columnar_"), agent=True)
+    started = time.perf_counter()
+    create_table(db_path, args.rows, args.chunk_rows)
+    print(f"Loaded {args.rows} rows in {time.perf_counter() - started:.1f}s")
+
+    from data_handler import get_columnar_engine, get_connection_manager, set_table_placement, shutdown_columnar_sync, sync_columnar_table
+    from utils.query_runner import QueryBudget, execute_columnar_query, execute_query
+
+    started = time.perf_counter()
+    set_table_placement("sales", "columnar", db_path)
+    # The placement schedules a background sync; the copy is exported here instead, and timed.
+    shutdown_columnar_sync()
+    copy = sync_columnar_table("sales", db_path)
+    export_seconds = time.perf_counter() - started
+    print(f"Exported the columnar copy in {export_seconds:.1f}s, {copy.size_bytes} bytes")
+    engine = get_columnar_engine(db_path)
+
+    budget = QueryBudget(timeout=args.timeout)
+
+    def run_sqlite(sql: str):
+        with get_connection_manager(db_path).reader() as conn:
+            return execute_query(conn, sql, budget)
+
+    def run_duckdb(sql: str):
+        return execute_columnar_query(engine.cursor(), sql, budget)
+
+    results = [{"operation": "export", "backend": "duckdb", "seconds": round(export_seconds, 3), "size_bytes": copy.size_bytes}]
+    for name, sql in QUERIES.items():
+        for backend, run in (("sqlite", run_sqlite), ("duckdb", run_duckdb)):
+            latencies = []
+            for _ in range(args.iterations):
+                start = time.perf_counter()
+                result = run(sql)
+                latencies.append(time.perf_counter() - start)
+                if result.error is not None:
+                    raise RuntimeError(f"{name} failed on {backend}: {result.text}")
+            summary = summarize_latencies(latencies)
+            results.append({"operation": name, "backend": backend, **summary})
+            print(f"{name} on {backend}: p50 {summary['p50_ms']} ms, max {summary['max_ms']} ms")
+    write_results(args.output, "columnar", vars(args), results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Latency benchmark for table listing and previews, called directly and through the FastAPI endpoints.
+
+Creates a scratch database with `--tables` tables of `--rows` rows, then measures at each concurrency level:
+
+    list_tables          `list_tables` called from a thread pool
+    preview_catalog      `get_table_preview` with the default limit, served from the table catalog
+    preview_sql          `get_table_preview` with a limit above the catalog sample, which queries the table
+    page_first           the first keyset page of `--preview-limit` rows, read with `plan_table_page`
+    page_last            the last such page, which should take as long as the first
+    GET /                the main page, through a uvicorn server on a background thread
+    GET /tables/x/preview  the table preview page, through the same server
+    GET /tables/x/rows   the first page of rows the preview page loads, streamed as JSON
+
+Usage:
+    python benchmarks/bench_endpoints.py --concurrency 1,8,32 --requests 400 --output results/endpoints.json
+"""
+import argparse
+import asyncio
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from _common import PROJECT_ROOT, summarize_latencies, use_scratch_database, write_results
+
+def create_tables(db_path: str, tables: int, rows: int) -> list[str]:
+    import numpy as np
+    import pandas as pd
+    from data_handler import push_to_db
+
+    names = []
+    rng = np.random.default_rng(0)
+    for i in range(tables):
+        df = pd.DataFrame({
+            "id": np.arange(rows),
+            "region": rng.choice(["north", "south", "east", "west"], rows),
+            "amount": np.round(rng.random(rows) * 1000, 2),
+            "note": [f"row {n}" for n in range(rows)],
+        })
+        success, table_name, error = push_to_db(df, f"bench_table_{i}", db_path)
+        if not success:
+            raise RuntimeError(error)
+        names.append(table_name)
+    return names
+
+def measure_calls(func, args_list: list[tuple], concurrency: int) -> dict:
+    """Calls `func` once per argument tuple from `concurrency` threads and summarizes the call latencies."""
+    def timed(args):
+        start = time.perf_counter()
+        func(*args)
+        return time.perf_counter() - start
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(timed, args_list))
+    elapsed = time.perf_counter() - started
+    return {**summarize_latencies(latencies), "throughput_per_s": round(len(latencies) / elapsed, 1)}
+
+async def measure_requests(client, paths: list[str], concurrency: int) -> dict:
+    """Requests every path with `concurrency` concurrent clients and summarizes the response latencies."""
+    latencies: list[float] = []
+    errors = 0
+    queue: asyncio.Queue[str] = asyncio.Queue()
+    for path in paths:
+        queue.put_nowait(path)
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            path = queue.get_nowait()
+            start = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {**summarize_latencies(latencies), "throughput_per_s": round(len(latencies) / elapsed, 1), "errors": errors}
+
+async def measure_endpoints(table_names: list[str], levels: list[int], requests: int, port: int) -> list[dict]:
+    import httpx
+    import uvicorn
+    import sys
+
+    sys.path.insert(0, str(PROJECT_ROOT / "app" / "src"))
+    import fast_app
+
+    server = uvicorn.Server(uvicorn.Config(fast_app.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    results = []
+    try:
+        limits = httpx.Limits(max_connections=max(levels))
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60, limits=limits) as client:
+            await client.get("/")  # warm up
+            for concurrency in levels:
+                cases = {
+                    "GET /": ["/"] * requests,
+                    "GET /tables/x/preview": [
+                        f"/tables/{table_names[i % len(table_names)]}/preview" for i in range(requests)
+                    ],
+                    "GET /tables/x/rows": [
+                        f"/tables/{table_names[i % len(table_names)]}/rows" for i in range(requests)
+                    ],
+                }
+                for operation, paths in cases.items():
+                    result = await measure_requests(client, paths, concurrency)
+                    results.append({"operation": operation, "concurrency": concurrency, **result})
+                    print(f"{operation} x{concurrency}: p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms")
+    finally:
+        server.should_exit = True
+        thread.join()
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tables", type=int, default=8, help="tables in the scratch database")
+    parser.add_argument("--rows", type=int, default=50_000, help="rows per table")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=400, help="calls per operation and concurrency level")
+    parser.add_argument("--preview-limit", type=int, default=100, help="limit of the SQL-backed previews")
+    parser.add_argument("--port", type=int, default=8766, help="port of the in-process server")
+    parser.add_argument("--skip-http", action="store_true", help="only measure the data_handler functions")
+    parser.add_argument("--output", default="benchmarks/results/endpoints.json", help="JSON results file")
+    args = parser.parse_args()
+
+    db_path = use_scratch_database(tempfile.mkdtemp(prefix="datapal_bench_endpoints_"))
+    table_names = create_tables(db_path, args.tables, args.rows)
+    from data_handler import list_tables, get_table_preview, plan_table_page
+    from data_handler.browse import encode_cursor
+
+    def read_page(table_name: str, cursor: str | None):
+        return plan_table_page(table_name, db_path, cursor=cursor, limit=args.preview_limit).fetch()
+    last_page = encode_cursor(max(0, args.rows - args.preview_limit))
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    results = []
+    for concurrency in levels:
+        cases = {
+            "list_tables": (list_tables, [(db_path,)] * args.requests),
+            "preview_catalog": (get_table_preview, [
+                (table_names[i % len(table_names)], db_path) for i in range(args.requests)
+            ]),
+            "preview_sql": (get_table_preview, [
+                (table_names[i % len(table_names)], db_path, args.preview_limit) for i in range(args.requests)
+            ]),
+            "page_first": (read_page, [(table_names[i % len(table_names)], None) for i in range(args.requests)]),
+            "page_last": (read_page, [(table_names[i % len(table_names)], last_page) for i in range(args.requests)]),
+        }
+        for operation, (func, args_list) in cases.items():
+            result = measure_calls(func, args_list, concurrency)
+            results.append({"operation": operation, "concurrency": concurrency, **result})
+            print(f"{operation} x{concurrency}: p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms")
+
+    if not args.skip_http:
+        results.extend(asyncio.run(measure_endpoints(table_names, levels, args.requests, args.port)))
+    write_results(args.output, "endpoints", vars(args), results)
+
+if __name__ == "__main__":
+    main()
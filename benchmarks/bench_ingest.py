@@ -0,0 +1,194 @@
+"""
+Ingestion benchmark: throughput and peak memory of loading synthetic CSV and XLSX files into SQLite.
+
+Synthetic files of the requested sizes are generated once (deterministically, from a fixed seed) into
+`--data-dir` and reused by later runs. Each (file, mode) case then runs in a fresh interpreter, so that the
+reported peak RSS belongs to that case alone. Modes:
+
+    parse_file   `parse_file` + `push_to_db`: the whole file is read into one DataFrame first.
+    chunks       `parse_file_chunks` + `push_chunks_to_db`: the file is streamed in DEFAULT_CHUNK_SIZE batches.
+    stage        `stage_file` + `merge_staged_table`: the upload path of the web app.
+
+A case that fails (e.g. runs out of memory) is recorded with its error instead of stopping the suite.
+
+Usage:
+    python benchmarks/bench_ingest.py --csv-sizes 10MB,100MB,1GB,2GB --xlsx-sizes 10MB,100MB --output results/ingest.json
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from _common import PROJECT_ROOT, format_size, parse_size, use_scratch_database, write_results
+
+MODES = ("parse_file", "chunks", "stage")
+SEED = 20240601
+CATEGORIES = ["north", "south", "east", "west", "central"]
+PRODUCTS = [f"product_{i:03d}" for i in range(200)]
+
+def synthetic_frame(start: int, rows: int):
+    """A deterministic block of `rows` rows with integer, float, date, low- and high-cardinality text columns."""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(SEED + start)
+    ids = np.arange(start, start + rows)
+    return pd.DataFrame({
+        "id": ids,
+        "sold_on": pd.Timestamp("2020-01-01") + pd.to_timedelta(ids % 1500, unit="D"),
+        "region": rng.choice(CATEGORIES, rows),
+        "product": rng.choice(PRODUCTS, rows),
+        "quantity": rng.integers(1, 100, rows),
+        "amount": np.round(rng.random(rows) * 1000, 2),
+        "note": [f"order {i} shipped by carrier {i % 17}" for i in ids],
+    })
+
+def generate_csv(path: str, target_bytes: int) -> int:
+    """Appends synthetic blocks to a CSV file until it reaches `target_bytes`. Returns the row count."""
+    rows = 0
+    block = 50_000
+    with open(path, "w", newline="") as f:
+        while f.tell() < target_bytes:
+            synthetic_frame(rows, block).to_csv(f, index=False, header=rows == 0, date_format="%Y-%m-%d")
+            rows += block
+    return rows
+
+def generate_xlsx(path: str, target_bytes: int) -> int:
+    """
+    Writes a synthetic single-sheet workbook of roughly `target_bytes`. XLSX is compressed, so the row count
+    is extrapolated from the size of a small sample workbook. Returns the row count.
+    """
+    import openpyxl
+
+    def write(path: str, rows: int) -> None:
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet("data")
+        written = 0
+        while written < rows:
+            frame = synthetic_frame(written, min(50_000, rows - written))
+            if written == 0:
+                sheet.append(list(frame.columns))
+            frame["sold_on"] = frame["sold_on"].dt.strftime("%Y-%m-%d")
+            for row in frame.itertuples(index=False):
+                sheet.append(list(row))
+            written += len(frame)
+        workbook.save(path)
+
+    sample_rows = 20_000
+    write(path, sample_rows)
+    rows = max(1, int(sample_rows * target_bytes / os.path.getsize(path)))
+    write(path, rows)
+    return rows
+
+def ensure_dataset(data_dir: str, kind: str, size: int) -> tuple[str, int]:
+    """Returns the path and row count of a synthetic file, generating it on first use."""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"synthetic_{format_size(size)}.{kind}")
+    meta_path = path + ".json"
+    if os.path.exists(path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            return path, json.load(f)["rows"]
+    print(f"Generating {path}...")
+    rows = generate_csv(path, size) if kind == "csv" else generate_xlsx(path, size)
+    with open(meta_path, "w") as f:
+        json.dump({"rows": rows, "seed": SEED}, f)
+    return path, rows
+
+def run_case(path: str, mode: str) -> dict:
+    """Runs one ingest case in this process. Meant to be called in a fresh interpreter (see `--child`)."""
+    scratch = tempfile.mkdtemp(prefix="datapal_bench_ingest_")
+    db_path = use_scratch_database(scratch)
+    from data_handler import (
+        parse_file, push_to_db, parse_file_chunks, push_chunks_to_db, stage_file, merge_staged_table,
+    )
+
+    started = time.perf_counter()
+    if mode == "parse_file":
+        df = parse_file(path)
+        parsed = time.perf_counter()
+        if df is None:
+            raise RuntimeError("parse_file returned None")
+        success, table_name, error = push_to_db(df, "bench", db_path)
+    elif mode == "chunks":
+        success, table_name, error = push_chunks_to_db(parse_file_chunks(path), "bench", db_path)
+        parsed = None
+    else:
+        staged = stage_file(path, "bench")
+        parsed = time.perf_counter()
+        if not staged.success:
+            raise RuntimeError(staged.error)
+        success, table_name, error = merge_staged_table(staged.staging_path, staged.table_name, db_path)
+    finished = time.perf_counter()
+    if not success:
+        raise RuntimeError(error)
+
+    import sqlite3
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+    return {
+        "seconds": round(finished - started, 3),
+        "parse_seconds": round(parsed - started, 3) if parsed is not None else None,
+        "rows_loaded": rows,
+        "db_bytes": os.path.getsize(db_path),
+        # ru_maxrss is in KiB on Linux.
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+def measure(path: str, kind: str, mode: str, timeout: float) -> dict:
+    file_bytes = os.path.getsize(path)
+    result = {"kind": kind, "mode": mode, "file": os.path.basename(path), "file_bytes": file_bytes}
+    try:
+        child = subprocess.run(
+            [sys.executable, __file__, "--child", path, mode],
+            capture_output=True, text=True, timeout=timeout, cwd=str(PROJECT_ROOT),
+        )
+    except subprocess.TimeoutExpired:
+        result["error"] = f"timed out after {timeout:g} seconds"
+        return result
+    lines = [line for line in child.stdout.splitlines() if line.startswith("{")]
+    if child.returncode != 0 or not lines:
+        result["error"] = (child.stderr.strip().splitlines() or [f"exit status {child.returncode}"])[-1]
+        return result
+    result.update(json.loads(lines[-1]))
+    result["mb_per_second"] = round(file_bytes / 1024 ** 2 / result["seconds"], 2)
+    result["rows_per_second"] = round(result["rows_loaded"] / result["seconds"])
+    return result
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv-sizes", default="10MB,100MB", help="comma-separated CSV sizes, e.g. 10MB,1GB,2GB")
+    parser.add_argument("--xlsx-sizes", default="10MB", help="comma-separated XLSX sizes ('' to skip)")
+    parser.add_argument("--modes", default=",".join(MODES), help=f"comma-separated modes: {', '.join(MODES)}")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "datapal_bench_data"),
+                        help="where synthetic files are generated and cached")
+    parser.add_argument("--timeout", type=float, default=3600, help="seconds allowed per case")
+    parser.add_argument("--output", default="benchmarks/results/ingest.json", help="JSON results file")
+    parser.add_argument("--child", nargs=2, metavar=("PATH", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_case(*args.child)))
+        return
+
+    modes = [mode for mode in args.modes.split(",") if mode]
+    results = []
+    for kind, sizes in (("csv", args.csv_sizes), ("xlsx", args.xlsx_sizes)):
+        for size in (parse_size(text) for text in sizes.split(",") if text.strip()):
+            path, rows = ensure_dataset(args.data_dir, kind, size)
+            for mode in modes:
+                result = measure(path, kind, mode, args.timeout)
+                result["rows_generated"] = rows
+                results.append(result)
+                if "error" in result:
+                    print(f"{kind} {format_size(size)} {mode}: FAILED ({result['error']})")
+                else:
+                    print(f"{kind} {format_size(size)} {mode}: {result['seconds']} s, {result['mb_per_second']} MB/s, "
+                          f"{result['rows_per_second']} rows/s, peak RSS {result['peak_rss_mb']} MB")
+    write_results(args.output, "ingest", vars(args), results)
+
+if __name__ == "__main__":
+    main()
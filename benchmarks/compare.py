@@ -0,0 +1,77 @@
+"""
+Compares two sets of benchmark results, e.g. from before and after a change.
+
+Takes two result files, or two directories written by `run_all.py`, matches results that measured the same
+case (same suite, scenario, mode, size, concurrency...) and prints the main metrics of each side with the
+new/old ratio. Ratios past `--threshold` in the bad direction are flagged as regressions; the script exits
+with status 1 if there are any.
+
+Usage:
+    python benchmarks/compare.py benchmarks/results/old benchmarks/results/new --threshold 1.2
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# Metrics compared, and whether a higher value is better.
+METRICS = {
+    "p50_ms": False,
+    "p99_ms": False,
+    "seconds": False,
+    "peak_rss_mb": False,
+    "wall_ms_median": False,
+    "mb_per_second": True,
+    "throughput_per_s": True,
+}
+
+def load(path: Path) -> dict[str, list[dict]]:
+    """Returns the results of a file or of every JSON file in a directory, by suite name."""
+    files = sorted(path.glob("*.json")) if path.is_dir() else [path]
+    suites = {}
+    for file in files:
+        with open(file) as f:
+            document = json.load(f)
+        suites[document.get("suite", file.stem)] = document["results"]
+    return suites
+
+def case_key(result: dict) -> tuple:
+    """Identifies a result by its non-numeric fields and integer parameters such as the concurrency level."""
+    return tuple(sorted(
+        (key, value) for key, value in result.items()
+        if key not in METRICS and key != "error" and (isinstance(value, str) or key in ("concurrency", "file_bytes"))
+    ))
+
+def describe(key: tuple) -> str:
+    return " ".join(str(value) for _, value in key)
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("old", type=Path, help="baseline result file or directory")
+    parser.add_argument("new", type=Path, help="result file or directory to compare against it")
+    parser.add_argument("--threshold", type=float, default=1.2, help="ratio flagged as a regression")
+    args = parser.parse_args()
+
+    old_suites, new_suites = load(args.old), load(args.new)
+    regressions = 0
+    for suite in sorted(old_suites.keys() & new_suites.keys()):
+        old_results = {case_key(result): result for result in old_suites[suite]}
+        print(f"== {suite} ==")
+        for result in new_suites[suite]:
+            key = case_key(result)
+            old = old_results.get(key)
+            if old is None:
+                continue
+            for metric, higher_is_better in METRICS.items():
+                if not old.get(metric) or result.get(metric) is None:
+                    continue
+                ratio = result[metric] / old[metric]
+                regressed = ratio < 1 / args.threshold if higher_is_better else ratio > args.threshold
+                regressions += regressed
+                print(f"{describe(key):<50} {metric:<16} {old[metric]:>10} -> {result[metric]:>10}  "
+                      f"x{ratio:.2f}{'  REGRESSION' if regressed else ''}")
+    print(f"{regressions} regression(s) past x{args.threshold:g}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
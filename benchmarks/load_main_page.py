@@ -0,0 +1,174 @@
+"""
+Load test: latency of the main page (`/`) while table previews run concurrently.
+
+Creates a scratch database with a few tables, then keeps `--preview-concurrency` clients requesting
+pages of table rows (as the table preview page loads them) while `--page-concurrency` clients request `/`,
+and reports the latency percentiles of `/`.
+By default the app is served by uvicorn on a background thread of this process, with its own event loop;
+pass `--url` to load a running server instead.
+
+With `--baseline`, the previews call the blocking data_handler functions directly on the event loop,
+as the endpoints did before the async surface existed, for comparison. Pages of rows are quick to read;
+`--preview-delay-ms` adds a blocking delay to each one to model a slow disk.
+
+Usage:
+    python benchmarks/load_main_page.py --requests 500 --preview-concurrency 32
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def create_tables(db_path: str, tables: int, rows: int) -> list[str]:
+    import numpy as np
+    import pandas as pd
+    from data_handler import push_to_db
+
+    names = []
+    rng = np.random.default_rng(0)
+    for i in range(tables):
+        df = pd.DataFrame({
+            "id": np.arange(rows),
+            "category": rng.choice(["north", "south", "east", "west"], rows),
+            "amount": rng.random(rows) * 1000,
+            "note": [f"row {n}" for n in range(rows)],
+        })
+        success, table_name, error = push_to_db(df, f"load_table_{i}", db_path)
+        if not success:
+            raise RuntimeError(error)
+        names.append(table_name)
+    return names
+
+async def run_load(client, table_names: list[str], args) -> dict:
+    page_latencies: list[float] = []
+    preview_latencies: list[float] = []
+    errors = 0
+    done = asyncio.Event()
+
+    async def preview_worker(worker: int):
+        nonlocal errors
+        i = worker
+        while not done.is_set():
+            table_name = table_names[i % len(table_names)]
+            i += 1
+            start = time.perf_counter()
+            response = await client.get(f"/tables/{table_name}/rows")
+            preview_latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    async def page_worker(count: int):
+        nonlocal errors
+        for _ in range(count):
+            start = time.perf_counter()
+            response = await client.get("/")
+            page_latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    previews = [asyncio.create_task(preview_worker(i)) for i in range(args.preview_concurrency)]
+    per_worker = max(1, args.requests // args.page_concurrency)
+    started = time.perf_counter()
+    await asyncio.gather(*(page_worker(per_worker) for _ in range(args.page_concurrency)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await asyncio.gather(*previews)
+
+    return {
+        "page_requests": len(page_latencies),
+        "preview_requests": len(preview_latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "page_p50_ms": round(statistics.median(page_latencies) * 1000, 2),
+        "page_p95_ms": round(percentile(page_latencies, 95) * 1000, 2),
+        "page_p99_ms": round(percentile(page_latencies, 99) * 1000, 2),
+        "page_max_ms": round(max(page_latencies) * 1000, 2),
+        "preview_p99_ms": round(percentile(preview_latencies, 99) * 1000, 2) if preview_latencies else None,
+    }
+
+async def main(args) -> None:
+    import httpx
+
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+            table_names = args.tables.split(",") if args.tables else []
+            if not table_names:
+                sys.exit("--tables is required with --url")
+            print(await run_load(client, table_names, args))
+        return
+
+    scratch = tempfile.mkdtemp(prefix="datapal_load_")
+    os.environ["DB_PATH"] = os.path.join(scratch, "load.db")
+    sys.path.insert(0, str(PROJECT_ROOT))
+    sys.path.insert(0, str(PROJECT_ROOT / "app" / "src"))
+    table_names = create_tables(os.environ["DB_PATH"], args.table_count, args.rows)
+
+    import fast_app
+    from data_handler import TablePage, list_tables, plan_table_page
+
+    if args.preview_delay_ms:
+        fast_iter_json = TablePage.iter_json
+
+        def slow_iter_json(self):
+            time.sleep(args.preview_delay_ms / 1000)
+            yield from fast_iter_json(self)
+        TablePage.iter_json = slow_iter_json
+
+    if args.baseline:
+        async def blocking_plan(table_name, db_path, *args):
+            return plan_table_page(table_name, db_path, *args)
+
+        async def blocking_iterate(iterator):
+            for item in iterator:
+                yield item
+
+        async def blocking_list_tables(db_path):
+            return list_tables(db_path)
+
+        fast_app.plan_table_page_async = blocking_plan
+        fast_app.iterate_read = blocking_iterate
+        fast_app.list_tables_async = blocking_list_tables
+
+    import uvicorn
+
+    config = uvicorn.Config(fast_app.app, host="127.0.0.1", port=args.port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        await asyncio.sleep(0.05)
+    try:
+        limits = httpx.Limits(max_connections=args.page_concurrency + args.preview_concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=60, limits=limits) as client:
+            result = await run_load(client, table_names, args)
+    finally:
+        server.should_exit = True
+        thread.join()
+    result["mode"] = "baseline (blocking)" if args.baseline else "async data_handler"
+    print(result)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300, help="total requests to '/'")
+    parser.add_argument("--page-concurrency", type=int, default=8, help="concurrent clients requesting '/'")
+    parser.add_argument("--preview-concurrency", type=int, default=16, help="concurrent clients requesting previews")
+    parser.add_argument("--table-count", type=int, default=4, help="tables created in the scratch database")
+    parser.add_argument("--rows", type=int, default=20000, help="rows per scratch table")
+    parser.add_argument("--preview-delay-ms", type=float, default=0, help="blocking delay added to every preview")
+    parser.add_argument("--baseline", action="store_true", help="run the data_handler calls on the event loop")
+    parser.add_argument("--port", type=int, default=8765, help="port of the in-process server")
+    parser.add_argument("--url", help="load a running server instead of the in-process app")
+    parser.add_argument("--tables", help="comma-separated tables to preview when using --url")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,57 @@
+"""
+Runs every benchmark suite and writes their JSON results into one directory, so that two builds can be
+compared with `compare.py`.
+
+Suites run one after another, each in its own interpreter. `--quick` uses small inputs that finish in a
+few minutes; the defaults include the 100MB CSV ingest case.
+
+Usage:
+    python benchmarks/run_all.py --output-dir benchmarks/results/$(git rev-parse --short HEAD)
+    python benchmarks/compare.py benchmarks/results/<old> benchmarks/results/<new>
+"""
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+from _common import PROJECT_ROOT
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+
+# Each suite: the script, its arguments, and the extra arguments used with --quick.
+SUITES = {
+    "ingest": ("bench_ingest.py", [], ["--csv-sizes", "10MB", "--xlsx-sizes", "2MB"]),
+    "endpoints": ("bench_endpoints.py", [], ["--rows", "5000", "--requests", "100", "--concurrency", "1,8"]),
+    "agent": ("bench_agent.py", [], ["--rows", "20000", "--iterations", "10"]),
+    "columnar": ("bench_columnar.py", [], ["--rows", "1000000", "--iterations", "3"]),
+    "startup": ("startup_time.py", [], ["--runs", "3"]),
+}
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("suites", nargs="*", default=list(SUITES), help=f"suites to run: {', '.join(SUITES)}")
+    parser.add_argument("--output-dir", default="benchmarks/results/latest", help="directory for the JSON results")
+    parser.add_argument("--quick", action="store_true", help="use small inputs")
+    args = parser.parse_args()
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    failed = []
+    for name in args.suites:
+        script, arguments, quick_arguments = SUITES[name]
+        output = str((output_dir / f"{name}.json").resolve())
+        # startup_time.py predates the shared result format and takes --json instead of --output.
+        output_arguments = ["--json", output] if name == "startup" else ["--output", output]
+        command = [sys.executable, str(BENCHMARKS_DIR / script), *arguments, *output_arguments]
+        if args.quick:
+            command += quick_arguments
+        print(f"== {name} ==", flush=True)
+        if subprocess.run(command, cwd=str(PROJECT_ROOT)).returncode != 0:
+            failed.append(name)
+
+    if failed:
+        print(f"Failed suites: {', '.join(failed)}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Startup benchmark: how long importing the web app, the agent graph and data_handler takes.
+
+Each target is imported in a fresh interpreter with `python -X importtime`, several times. The script reports
+the median wall time, the cumulative import time, the slowest direct imports of the target, and whether any
+module that is meant to be imported lazily (pandas, openpyxl, the Anthropic and LangGraph SDKs, SQLAlchemy)
+was loaded at startup.
+
+It exits with status 1 if a deferred module is imported at startup, or if a target exceeds its `--budget-ms`,
+so it can be used to catch startup regressions.
+
+Usage:
+    python benchmarks/startup_time.py --runs 5 --budget-ms fast_app=1500 --json startup.json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# Each target: the directory added to sys.path (besides the project root), the import statement, and the
+# modules it must not import at startup.
+TARGETS = {
+    "data_handler": (PROJECT_ROOT, "import data_handler", ["pandas", "openpyxl"]),
+    "fast_app": (PROJECT_ROOT / "app" / "src", "import fast_app", ["pandas", "openpyxl", "langgraph_sdk"]),
+    "agent": (
+        PROJECT_ROOT / "agent",
+        "import agent",
+        ["pandas", "openpyxl", "langchain_anthropic", "anthropic", "sqlalchemy"],
+    ),
+}
+
+_IMPORT_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int, int]]:
+    """Parses `-X importtime` output into (module, self_us, cumulative_us, depth) entries."""
+    entries = []
+    for line in stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            entries.append((module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return entries
+
+def measure(name: str, runs: int, db_path: str) -> dict:
+    path, statement, deferred = TARGETS[name]
+    code = (
+        f"import sys; sys.path[:0] = [{str(path)!r}, {str(PROJECT_ROOT)!r}]\n"
+        f"{statement}\n"
+        f"print(','.join(m for m in {deferred!r} if m in sys.modules))"
+    )
+    env = dict(os.environ, DB_PATH=db_path)
+    wall_times, import_times = [], []
+    entries, loaded = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            capture_output=True, text=True, env=env, cwd=str(path),
+        )
+        wall_times.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            raise RuntimeError(f"Importing {name} failed:\n{result.stderr[-2000:]}")
+        entries = parse_importtime(result.stderr)
+        import_times.append(sum(cumulative for _, _, cumulative, depth in entries if depth == 0))
+        loaded = [module for module in result.stdout.strip().split(",") if module]
+
+    slowest = sorted(entries, key=lambda entry: entry[2], reverse=True)
+    return {
+        "target": name,
+        "runs": runs,
+        "wall_ms_median": round(statistics.median(wall_times) * 1000, 1),
+        "wall_ms_min": round(min(wall_times) * 1000, 1),
+        "import_ms_median": round(statistics.median(import_times) / 1000, 1),
+        "modules_imported": len(entries),
+        "slowest_imports": [
+            {"module": module, "cumulative_ms": round(cumulative / 1000, 1)}
+            for module, _, cumulative, depth in slowest if depth == 1
+        ][:10],
+        "deferred_modules_loaded": loaded,
+    }
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("targets", nargs="*", default=list(TARGETS), help=f"targets to measure: {', '.join(TARGETS)}")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters started per target")
+    parser.add_argument("--budget-ms", action="append", default=[], metavar="TARGET=MS",
+                        help="fail if the target's median wall time exceeds MS")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    budgets = {}
+    for budget in args.budget_ms:
+        target, _, ms = budget.partition("=")
+        budgets[target] = float(ms)
+
+    failures = []
+    results = []
+    with tempfile.TemporaryDirectory(prefix="datapal_startup_") as scratch:
+        db_path = os.path.join(scratch, "startup.db")
+        for name in args.targets:
+            result = measure(name, args.runs, db_path)
+            results.append(result)
+            print(f"{name}: median {result['wall_ms_median']} ms wall, {result['import_ms_median']} ms importing "
+                  f"({result['modules_imported']} modules)")
+            for entry in result["slowest_imports"][:5]:
+                print(f"    {entry['cumulative_ms']:>8} ms  {entry['module']}")
+            if result["deferred_modules_loaded"]:
+                failures.append(f"{name} imported {', '.join(result['deferred_modules_loaded'])} at startup")
+            if name in budgets and result["wall_ms_median"] > budgets[name]:
+                failures.append(f"{name} took {result['wall_ms_median']} ms, over its {budgets[name]} ms budget")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"python": sys.version.split()[0], "results": results, "failures": failures}, f, indent=2)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
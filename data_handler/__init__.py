@@ -1,5 +1,24 @@
-from .parser import parse_file
-from .db_handler import push_to_db, sanitize_name, DATABASE_PATH, list_tables, get_table_preview, delete_table
+from .db_handler import push_to_db, push_chunks_to_db, sanitize_name, DATABASE_PATH, list_tables, get_table_preview, delete_table, merge_staged_table, IngestMode
+from .connection import ConnectionManager, SQLiteSettings, get_connection_manager, close_connection_manager, close_all_connections
+from .catalog import TableEntry, get_catalog, catalog_table_names, get_table_entries, get_table_versions, get_catalog_version, sync_catalog, add_table_write_listener
+from .ingest import stage_file, stage_workbook, StagedTable
+from .column_types import ColumnTypeSettings, ColumnPlan, infer_column_plans
+from .indexes import IndexSettings, IndexRecord, IndexReport, record_index_usage, flush_index_usage, advise_indexes, start_index_advisor, stop_index_advisor, create_ingest_indexes, get_index_report
+from .browse import TablePage, plan_table_page, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from .sources import SourceFile, SourceHasher, SourceLoadPlan, fingerprint_file, plan_source_load, get_table_source
+from .columnar import ColumnarSettings, ColumnarCopy, ColumnarEngine, Placement, duckdb_available, get_columnar_copies, get_columnar_report, get_columnar_engine, close_columnar_engines, columnar_query_tables, set_table_placement, sync_columnar_table, schedule_columnar_sync, shutdown_columnar_sync
+from .rollups import RollupSettings, Rollup, build_table_rollups, get_table_rollups, get_rollup_report
+from .tracing import metrics, traced, span, record, record_query, observe_span, summarize_spans, TRACE_EVENT_KEY
+from .async_db import run_read, run_catalog_read, run_write, iterate_read, list_tables_async, get_table_preview_async, plan_table_page_async, delete_table_async, merge_staged_table_async, get_table_source_async, get_index_report_async, get_columnar_report_async, set_table_placement_async, get_rollup_report_async, shutdown_db_executors
 
+# The parser imports pandas, so its names are only imported from it on first access.
+_PARSER_EXPORTS = {'parse_file', 'parse_file_chunks', 'iter_excel_sheets', 'DEFAULT_CHUNK_SIZE'}
 
-__all__ = ['parse_file', 'push_to_db', 'sanitize_name', 'DATABASE_PATH', 'list_tables', 'get_table_preview', 'delete_table']
\ No newline at end of file
+def __getattr__(name: str):
+    if name in _PARSER_EXPORTS:
+        from . import parser
+        return getattr(parser, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = ['parse_file', 'parse_file_chunks', 'iter_excel_sheets', 'DEFAULT_CHUNK_SIZE', 'push_to_db', 'push_chunks_to_db', 'sanitize_name', 'DATABASE_PATH', 'list_tables', 'get_table_preview', 'delete_table', 'merge_staged_table', 'IngestMode', 'stage_file', 'stage_workbook', 'StagedTable', 'ColumnTypeSettings', 'ColumnPlan', 'infer_column_plans', 'ConnectionManager', 'SQLiteSettings', 'get_connection_manager', 'close_connection_manager', 'close_all_connections', 'TableEntry', 'get_catalog', 'catalog_table_names', 'get_table_entries', 'get_table_versions', 'get_catalog_version', 'sync_catalog', 'add_table_write_listener', 'run_read', 'run_catalog_read', 'run_write', 'iterate_read', 'list_tables_async', 'get_table_preview_async', 'plan_table_page_async', 'delete_table_async', 'merge_staged_table_async', 'get_table_source_async', 'get_index_report_async', 'get_columnar_report_async', 'set_table_placement_async', 'get_rollup_report_async', 'shutdown_db_executors', 'IndexSettings', 'IndexRecord', 'IndexReport', 'record_index_usage', 'flush_index_usage', 'advise_indexes', 'start_index_advisor', 'stop_index_advisor', 'create_ingest_indexes', 'get_index_report', 'TablePage', 'plan_table_page', 'DEFAULT_PAGE_SIZE', 'MAX_PAGE_SIZE', 'SourceFile', 'SourceHasher', 'SourceLoadPlan', 'fingerprint_file', 'plan_source_load', 'get_table_source', 'ColumnarSettings', 'ColumnarCopy', 'ColumnarEngine', 'Placement', 'duckdb_available', 'get_columnar_copies', 'get_columnar_report', 'get_columnar_engine', 'close_columnar_engines', 'columnar_query_tables', 'set_table_placement', 'sync_columnar_table', 'schedule_columnar_sync', 'shutdown_columnar_sync', 'RollupSettings', 'Rollup', 'build_table_rollups', 'get_table_rollups', 'get_rollup_report', 'metrics', 'traced', 'span', 'record', 'record_query', 'observe_span', 'summarize_spans', 'TRACE_EVENT_KEY']
\ No newline at end of file
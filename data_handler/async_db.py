@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Iterator, TypeVar, TYPE_CHECKING
+
+from .db_handler import DATABASE_PATH, IngestMode, list_tables, get_table_preview, delete_table, merge_staged_table
+from .browse import DEFAULT_PAGE_SIZE, TablePage, plan_table_page
+from .indexes import IndexRecord, get_index_report
+from .sources import SourceFile, get_table_source
+from .columnar import ColumnarCopy, Placement, get_columnar_report, set_table_placement
+from .rollups import Rollup, get_rollup_report
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+T = TypeVar("T")
+
+# Table reads (previews, queries) run on a small pool that leaves one pooled reader connection free for
+# catalog lookups, which get a thread of their own: listing tables for a page never queues behind slow previews.
+# Writes run on a single thread, matching SQLite's single writer, so concurrent uploads and drops queue up in order.
+DB_READ_WORKERS = int(os.getenv("DB_READ_WORKERS", str(max(1, int(os.getenv("SQLITE_READERS", "4")) - 1))))
+
+_read_executor: ThreadPoolExecutor | None = None
+_catalog_executor: ThreadPoolExecutor | None = None
+_write_executor: ThreadPoolExecutor | None = None
+_executors_lock = threading.Lock()
+
+def get_read_executor() -> ThreadPoolExecutor:
+    """Returns the thread pool that runs blocking database reads, creating it on first use."""
+    global _read_executor
+    with _executors_lock:
+        if _read_executor is None:
+            _read_executor = ThreadPoolExecutor(max_workers=DB_READ_WORKERS, thread_name_prefix="db-reader")
+        return _read_executor
+
+def get_catalog_executor() -> ThreadPoolExecutor:
+    """Returns the thread that runs catalog lookups, creating it on first use."""
+    global _catalog_executor
+    with _executors_lock:
+        if _catalog_executor is None:
+            _catalog_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-catalog")
+        return _catalog_executor
+
+def get_write_executor() -> ThreadPoolExecutor:
+    """Returns the single thread that runs blocking database writes, creating it on first use."""
+    global _write_executor
+    with _executors_lock:
+        if _write_executor is None:
+            _write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        return _write_executor
+
+async def run_read(func: Callable[..., T], *args, **kwargs) -> T:
+    """Runs a blocking database read on the read pool and awaits its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_read_executor(), functools.partial(func, *args, **kwargs))
+
+async def run_catalog_read(func: Callable[..., T], *args, **kwargs) -> T:
+    """Runs a quick catalog lookup on the catalog thread and awaits its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_catalog_executor(), functools.partial(func, *args, **kwargs))
+
+async def run_write(func: Callable[..., T], *args, **kwargs) -> T:
+    """Runs a blocking database write on the writer thread and awaits its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_write_executor(), functools.partial(func, *args, **kwargs))
+
+async def iterate_read(iterator: Iterator[T]) -> AsyncIterator[T]:
+    """
+    Runs a blocking iterator (e.g. rows streamed from a cursor) on the read pool and yields its items as they
+    are produced. The iterator runs to the end without waiting for the consumer, so it holds a pooled
+    connection only as long as the read takes, never for as long as a slow client; it should therefore
+    produce a bounded amount of data, such as one page of rows. It is stopped early if the consumer stops.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stopped = threading.Event()
+    done = object()
+
+    def hand_over(item) -> None:
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:  # the event loop is closed
+            stopped.set()
+
+    def produce() -> None:
+        try:
+            for item in iterator:
+                if stopped.is_set():
+                    break
+                hand_over((item, None))
+        except BaseException as e:
+            hand_over((None, e))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+            hand_over((done, None))
+
+    loop.run_in_executor(get_read_executor(), produce)
+    try:
+        while True:
+            item, error = await queue.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        stopped.set()
+
+async def list_tables_async(db_path: str = DATABASE_PATH) -> list[str]:
+    """Awaitable `list_tables`."""
+    return await run_catalog_read(list_tables, db_path)
+
+async def get_table_preview_async(table_name: str, db_path: str = DATABASE_PATH, limit: int = 5) -> pd.DataFrame | None:
+    """Awaitable `get_table_preview`. Raises the same exceptions."""
+    return await run_read(get_table_preview, table_name, db_path, limit)
+
+async def plan_table_page_async(
+    table_name: str,
+    db_path: str = DATABASE_PATH,
+    columns: list[str] | None = None,
+    sort: str | None = None,
+    descending: bool = False,
+    cursor: str | None = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> TablePage:
+    """Awaitable `plan_table_page`. Raises the same exceptions."""
+    return await run_catalog_read(plan_table_page, table_name, db_path, columns, sort, descending, cursor, limit)
+
+async def delete_table_async(table_name: str, db_path: str = DATABASE_PATH) -> tuple[bool, str]:
+    """Awaitable `delete_table`, run on the writer thread."""
+    return await run_write(delete_table, table_name, db_path)
+
+async def merge_staged_table_async(
+    staging_path: str,
+    table_name: str,
+    db_path: str = DATABASE_PATH,
+    mode: IngestMode = "replace",
+    key_column: str | None = None,
+    source: SourceFile | None = None,
+) -> tuple[bool, str | None, str | None]:
+    """Awaitable `merge_staged_table`, run on the writer thread."""
+    return await run_write(merge_staged_table, staging_path, table_name, db_path, mode, key_column, source)
+
+async def get_table_source_async(table_name: str, db_path: str = DATABASE_PATH) -> SourceFile | None:
+    """Awaitable `get_table_source`."""
+    return await run_catalog_read(get_table_source, table_name, db_path)
+
+async def get_index_report_async(db_path: str = DATABASE_PATH) -> list[IndexRecord]:
+    """Awaitable `get_index_report`."""
+    return await run_catalog_read(get_index_report, db_path)
+
+async def get_columnar_report_async(db_path: str = DATABASE_PATH) -> list[ColumnarCopy]:
+    """Awaitable `get_columnar_report`."""
+    return await run_catalog_read(get_columnar_report, db_path)
+
+async def set_table_placement_async(table_name: str, placement: Placement, db_path: str = DATABASE_PATH) -> None:
+    """Awaitable `set_table_placement`."""
+    await run_write(set_table_placement, table_name, placement, db_path)
+
+async def get_rollup_report_async(db_path: str = DATABASE_PATH) -> list[Rollup]:
+    """Awaitable `get_rollup_report`."""
+    return await run_catalog_read(get_rollup_report, db_path)
+
+def shutdown_db_executors() -> None:
+    """Stops the database thread pools. Call on application shutdown, before closing the connections."""
+    global _read_executor, _catalog_executor, _write_executor
+    with _executors_lock:
+        executors = [
+            executor for executor in (_read_executor, _catalog_executor, _write_executor) if executor is not None
+        ]
+        _read_executor = _catalog_executor = _write_executor = None
+    for executor in executors:
+        executor.shutdown(wait=True, cancel_futures=True)
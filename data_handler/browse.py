@@ -0,0 +1,227 @@
+"""
+Keyset-paginated browsing of uploaded tables.
+
+A page is read by seeking straight to where the previous page ended, instead of skipping rows with OFFSET:
+pages are ordered by rowid, or by an indexed column and then rowid, and the cursor of the next page holds
+the rowid (and sort value) of the last row returned. Reading any page of a table then costs the same,
+however far into the table it is. Rows are read straight from the SQLite cursor and encoded as JSON as
+they are fetched (`TablePage.iter_json`).
+
+Dictionary-encoded tables are views, which have no rowid, so they are paged on their storage table and
+their encoded columns are decoded with their lookup tables. Encoded columns cannot be sorted on, as
+their codes are not in the order of their values.
+"""
+import base64
+import binascii
+import json
+import os
+import sqlite3
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from dotenv import load_dotenv
+
+from .catalog import is_internal_table
+from .connection import get_connection_manager
+from .db_handler import _lookup_table_name, _storage_table_name, _table_objects
+from .tracing import traced
+
+load_dotenv()
+
+DEFAULT_PAGE_SIZE = 100
+# Most rows a page may hold.
+MAX_PAGE_SIZE = int(os.getenv("BROWSE_MAX_PAGE_SIZE", "1000"))
+# Rows fetched from the SQLite cursor at a time while a page is streamed.
+_FETCH_BATCH_SIZE = 256
+
+def encode_cursor(rowid: int, sort_value=None, sorted_page: bool = False) -> str:
+    """Encodes the position of a row as an opaque page cursor."""
+    position = [sort_value, rowid] if sorted_page else [rowid]
+    return base64.urlsafe_b64encode(json.dumps(position, default=str).encode()).decode()
+
+def decode_cursor(cursor: str, sorted_page: bool) -> tuple[object, int]:
+    """Decodes a page cursor into (sort_value, rowid). Raises ValueError if it is not a cursor of this kind of page."""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError):
+        raise ValueError("Invalid page cursor.")
+    if not isinstance(position, list) or len(position) != (2 if sorted_page else 1) or type(position[-1]) is not int:
+        raise ValueError("Invalid page cursor.")
+    return (position[0] if sorted_page else None), position[-1]
+
+@dataclass
+class TablePage:
+    """A planned page of a table: which rows and columns to read, in which order. Read it with `iter_json` or `fetch`."""
+    table_name: str
+    columns: list[str]
+    sortable_columns: list[str]
+    sort: str | None
+    descending: bool
+    limit: int
+    db_path: str
+    # The (sql, params) of the queries that read the page, in order; each takes the number of rows still needed.
+    _segments: list[tuple[str, list]] = field(default_factory=list, repr=False)
+
+    def _iter_rows(self) -> Iterator[list[tuple]]:
+        """Yields the page's rows in batches, each row prefixed with its rowid and sort value, plus one extra row if
+        the table has more rows after the page."""
+        remaining = self.limit + 1
+        with get_connection_manager(self.db_path).reader() as conn:
+            for sql, params in self._segments:
+                cursor = conn.execute(sql, [*params, remaining])
+                try:
+                    while batch := cursor.fetchmany(min(_FETCH_BATCH_SIZE, remaining)):
+                        remaining -= len(batch)
+                        yield batch
+                        if remaining == 0:
+                            return
+                finally:
+                    cursor.close()
+
+    def _next_cursor(self, last_row: tuple) -> str:
+        return encode_cursor(last_row[0], last_row[1], sorted_page=self.sort is not None)
+
+    def iter_json(self) -> Iterator[bytes]:
+        """
+        Streams the page as a JSON object with the keys table, columns, sortable_columns, sort, descending, rows
+        (a list of lists of values, in the order of columns) and next_cursor (None on the last page).
+        Holds a pooled reader connection until the iterator is exhausted or closed.
+        """
+        header = {
+            "table": self.table_name,
+            "columns": self.columns,
+            "sortable_columns": self.sortable_columns,
+            "sort": self.sort,
+            "descending": self.descending,
+        }
+        yield (json.dumps(header)[:-1] + ', "rows": [').encode()
+        rows_read, last_row = 0, None
+        for batch in self._iter_rows():
+            page_rows = batch[: max(0, self.limit - rows_read)]
+            if page_rows:
+                prefix = ", " if rows_read else ""
+                yield (prefix + ", ".join(json.dumps(row[2:], default=str) for row in page_rows)).encode()
+                last_row = page_rows[-1]
+            rows_read += len(batch)
+        next_cursor = self._next_cursor(last_row) if rows_read > self.limit else None
+        yield f'], "next_cursor": {json.dumps(next_cursor)}}}'.encode()
+
+    def fetch(self) -> tuple[list[tuple], str | None]:
+        """Reads the page. Returns its rows, in the order of `columns`, and the cursor of the next page (None on the last page)."""
+        rows = [row for batch in self._iter_rows() for row in batch]
+        next_cursor = self._next_cursor(rows[self.limit - 1]) if len(rows) > self.limit else None
+        return [row[2:] for row in rows[: self.limit]], next_cursor
+
+def _sortable_columns(conn: sqlite3.Connection, storage_name: str, plain_columns: list[str]) -> list[str]:
+    """The columns of `plain_columns` that lead an index of the storage table, in table order."""
+    leading = set()
+    for index in conn.execute(f'PRAGMA index_list("{storage_name}")').fetchall():
+        first = conn.execute(f'PRAGMA index_info("{index[1]}")').fetchone()
+        if first is not None and first[2] is not None:
+            leading.add(first[2])
+    return [column for column in plain_columns if column in leading]
+
+def _page_segments(sort_sql: str | None, descending: bool, position: tuple[object, int] | None) -> list[tuple[str, list]]:
+    """
+    The WHERE clauses (with their parameters) that read a page after `position`, in order. Every clause is
+    answered by a seek in the rowid or the sort column's index: a row value comparison like
+    (col, rowid) > (?, ?) would only seek on the column and scan all rows sharing its value.
+    NULLs sort first, so they come first in ascending and last in descending order.
+    """
+    if sort_sql is None:
+        if position is None:
+            return [("1", [])]
+        return [(f"s.rowid {'<' if descending else '>'} ?", [position[1]])]
+
+    after = "<" if descending else ">"
+    if position is None:
+        null_rows, value_rows = [(f"{sort_sql} IS NULL", [])], [(f"{sort_sql} IS NOT NULL", [])]
+    elif position[0] is None:
+        null_rows = [(f"{sort_sql} IS NULL AND s.rowid {after} ?", [position[1]])]
+        value_rows = [] if descending else [(f"{sort_sql} IS NOT NULL", [])]
+    else:
+        value, rowid = position
+        null_rows = [(f"{sort_sql} IS NULL", [])] if descending else []
+        value_rows = [(f"{sort_sql} = ? AND s.rowid {after} ?", [value, rowid]), (f"{sort_sql} {after} ?", [value])]
+    return value_rows + null_rows if descending else null_rows + value_rows
+
+@traced
+def plan_table_page(
+    table_name: str,
+    db_path: str,
+    columns: list[str] | None = None,
+    sort: str | None = None,
+    descending: bool = False,
+    cursor: str | None = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> TablePage:
+    """
+    Plans a page of a table, read from where the page of `cursor` ended.
+
+    Args:
+        table_name (str): The table to browse.
+        db_path (str): Path to the SQLite database file.
+        columns (list[str] | None): The columns to return, in this order. Defaults to all of them.
+        sort (str | None): An indexed column to order the rows by, then by rowid. Defaults to rowid order.
+        descending (bool): Whether to return the rows in descending order.
+        cursor (str | None): The `next_cursor` of the previous page, read with the same sort. None for the first page.
+        limit (int): The most rows to return, capped at MAX_PAGE_SIZE.
+
+    Returns:
+        TablePage: The planned page.
+
+    Raises:
+        LookupError: If the table does not exist.
+        ValueError: If a column, the sort column, the cursor or the limit is invalid.
+    """
+    if limit < 1:
+        raise ValueError("The page size must be at least 1.")
+    limit = min(limit, MAX_PAGE_SIZE)
+    with get_connection_manager(db_path).reader() as conn:
+        objects = {name: object_type for object_type, name, _ in _table_objects(conn, table_name)}
+        if is_internal_table(table_name) or table_name not in objects:
+            raise LookupError(f"Table '{table_name}' not found.")
+        storage_name = _storage_table_name(table_name) if objects[table_name] == "view" else table_name
+        all_columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{storage_name}")')]
+        encoded = {column for column in all_columns if _lookup_table_name(table_name, column) in objects}
+        sortable = _sortable_columns(conn, storage_name, [column for column in all_columns if column not in encoded])
+
+    columns = columns or all_columns
+    unknown = [column for column in columns if column not in all_columns]
+    if unknown:
+        raise ValueError(f"Table '{table_name}' has no column {', '.join(repr(column) for column in unknown)}.")
+    if sort is not None and sort not in sortable:
+        raise ValueError(
+            f"Table '{table_name}' can only be sorted on its indexed columns"
+            + (f" ({', '.join(sortable)})." if sortable else ", and it has none.")
+        )
+    position = decode_cursor(cursor, sorted_page=sort is not None) if cursor else None
+
+    select_list, joins = ["s.rowid", f's."{sort}"' if sort else "NULL"], []
+    for position_in_page, column in enumerate(columns):
+        if column in encoded:
+            alias = f"d{position_in_page}"
+            joins.append(f'LEFT JOIN "{_lookup_table_name(table_name, column)}" AS {alias} ON {alias}.code = s."{column}"')
+            select_list.append(f"{alias}.value")
+        else:
+            select_list.append(f's."{column}"')
+    direction = " DESC" if descending else ""
+    order_by = (f's."{sort}"{direction}, ' if sort else "") + f"s.rowid{direction}"
+    segments = [
+        (
+            f'SELECT {", ".join(select_list)} FROM "{storage_name}" AS s {" ".join(joins)} '
+            f"WHERE {where} ORDER BY {order_by} LIMIT ?",
+            params,
+        )
+        for where, params in _page_segments(f's."{sort}"' if sort else None, descending, position)
+    ]
+    return TablePage(
+        table_name=table_name,
+        columns=columns,
+        sortable_columns=sortable,
+        sort=sort,
+        descending=descending,
+        limit=limit,
+        db_path=db_path,
+        _segments=segments,
+    )
@@ -0,0 +1,262 @@
+import json
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable
+
+from .connection import get_connection_manager
+from .tracing import traced
+
+# Internal tables are prefixed with an underscore, which `sanitize_name` never produces for uploaded tables.
+INTERNAL_TABLE_PREFIX = "_datapal_"
+CATALOG_TABLE = f"{INTERNAL_TABLE_PREFIX}catalog"
+CATALOG_STATE_TABLE = f"{INTERNAL_TABLE_PREFIX}catalog_state"
+SAMPLE_ROWS = 5
+# Number of sample rows included in the schema description given to the agent.
+TABLE_INFO_SAMPLE_ROWS = 3
+
+@dataclass
+class TableEntry:
+    """The catalog entry of one uploaded table."""
+    name: str
+    columns: list[tuple[str, str]]
+    create_sql: str
+    row_count: int
+    sample_rows: list[list] = field(default_factory=list)
+    version: int = 0
+    updated_at: str | None = None
+
+    @property
+    def column_names(self) -> list[str]:
+        return [name for name, _ in self.columns]
+
+    def table_info(self, sample_rows: int = TABLE_INFO_SAMPLE_ROWS) -> str:
+        """
+        Describes the table for the LLM: its CREATE TABLE statement followed by a few sample rows,
+        in the same layout as `SQLDatabase.get_table_info`.
+        """
+        rows = [
+            "\t".join(str(value)[:100] for value in row)
+            for row in self.sample_rows[:sample_rows]
+        ]
+        sample = "\n".join(rows)
+        return (
+            f"\n{self.create_sql}\n\n/*\n{sample_rows} rows from {self.name} table:\n"
+            f"{chr(9).join(self.column_names)}\n{sample}\n*/"
+        )
+
+_write_listeners: list[Callable[[str], None]] = []
+
+def add_table_write_listener(listener: Callable[[str], None]) -> None:
+    """
+    Registers a callback invoked with a table's name after a write to that table is committed
+    in this process (upload, replace or drop). Caches use it to evict entries eagerly; writes made by
+    other processes are still caught through the table versions.
+    """
+    _write_listeners.append(listener)
+
+def notify_table_written(table_name: str) -> None:
+    """Calls every write listener for a table. Listener errors are reported and otherwise ignored."""
+    for listener in list(_write_listeners):
+        try:
+            listener(table_name)
+        except Exception as e:
+            print(f"Table write listener failed for '{table_name}': {e}")
+
+def is_internal_table(table_name: str) -> bool:
+    return table_name.startswith(INTERNAL_TABLE_PREFIX) or table_name.startswith("sqlite_")
+
+def table_definition_sql(table_name: str, columns: list[tuple[str, str]]) -> str:
+    """A CREATE TABLE statement for the given (name, declared type) columns, laid out like pandas' `get_schema`."""
+    column_definitions = ",\n  ".join(f'"{name}" {declared_type}'.rstrip() for name, declared_type in columns)
+    return f'CREATE TABLE "{table_name}" (\n{column_definitions}\n)'
+
+def ensure_catalog(conn: sqlite3.Connection) -> None:
+    """Creates the catalog tables if they do not exist yet. Needs a writable connection."""
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{CATALOG_TABLE}" (
+            table_name TEXT PRIMARY KEY,
+            columns TEXT NOT NULL,
+            create_sql TEXT NOT NULL,
+            row_count INTEGER NOT NULL,
+            sample_rows TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    """)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{CATALOG_STATE_TABLE}" (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    """)
+
+def _next_version(conn: sqlite3.Connection) -> int:
+    """
+    Draws the next catalog version. Versions come from a single counter that is never reset,
+    so a table that is dropped and re-created never reuses a version.
+    """
+    conn.execute(
+        f'INSERT INTO "{CATALOG_STATE_TABLE}" (key, value) VALUES (\'version\', 1) '
+        "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+    )
+    return conn.execute(f'SELECT value FROM "{CATALOG_STATE_TABLE}" WHERE key = \'version\'').fetchone()[0]
+
+def refresh_table_entry(conn: sqlite3.Connection, table_name: str, row_count: int | None = None) -> int:
+    """
+    Records a table's columns, row count and sample rows in the catalog and bumps its version.
+    Call on the writer connection, inside the transaction that changed the table.
+
+    Args:
+        conn (sqlite3.Connection): The writer connection.
+        table_name (str): The table that was written.
+        row_count (int | None): The table's row count, if the caller already knows it.
+
+    Returns:
+        int: The table's new version.
+    """
+    ensure_catalog(conn)
+    object_type, create_sql = conn.execute(
+        "SELECT type, sql FROM sqlite_master WHERE type IN ('table', 'view') AND name=?", (table_name,)
+    ).fetchone()
+    columns = [(row[1], row[2]) for row in conn.execute(f'PRAGMA table_info("{table_name}")')]
+    if object_type == "view":
+        # A dictionary-encoded table is a view over internal tables; it is queried (and described) like a table.
+        create_sql = table_definition_sql(table_name, columns)
+    if row_count is None:
+        row_count = conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+    sample_rows = [list(row) for row in conn.execute(f'SELECT * FROM "{table_name}" LIMIT {SAMPLE_ROWS}')]
+    version = _next_version(conn)
+    conn.execute(
+        f'INSERT OR REPLACE INTO "{CATALOG_TABLE}" '
+        "(table_name, columns, create_sql, row_count, sample_rows, version, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (
+            table_name,
+            json.dumps(columns),
+            create_sql,
+            row_count,
+            json.dumps(sample_rows, default=str),
+            version,
+            datetime.now(timezone.utc).isoformat(),
+        ),
+    )
+    return version
+
+def remove_table_entry(conn: sqlite3.Connection, table_name: str) -> None:
+    """Removes a dropped table from the catalog. Call on the writer connection."""
+    ensure_catalog(conn)
+    conn.execute(f'DELETE FROM "{CATALOG_TABLE}" WHERE table_name = ?', (table_name,))
+    _next_version(conn)
+
+@traced
+def sync_catalog(db_path: str) -> None:
+    """
+    Brings the catalog in line with the tables that actually exist, e.g. for databases created
+    before the catalog existed: missing tables are added and entries of vanished tables removed.
+    """
+    with get_connection_manager(db_path).writer() as conn:
+        conn.execute("BEGIN")
+        ensure_catalog(conn)
+        existing = {
+            row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")
+            if not is_internal_table(row[0])
+        }
+        cataloged = {row[0] for row in conn.execute(f'SELECT table_name FROM "{CATALOG_TABLE}"')}
+        for table_name in existing - cataloged:
+            refresh_table_entry(conn, table_name)
+        for table_name in cataloged - existing:
+            remove_table_entry(conn, table_name)
+        conn.commit()
+
+_synced_paths: set[str] = set()
+_sync_lock = threading.Lock()
+
+def _ensure_synced(db_path: str) -> None:
+    """Syncs the catalog once per process and database, before it is first read."""
+    if db_path in _synced_paths:
+        return
+    with _sync_lock:
+        if db_path not in _synced_paths:
+            sync_catalog(db_path)
+            _synced_paths.add(db_path)
+
+def _entry_from_row(row: tuple) -> TableEntry:
+    name, columns, create_sql, row_count, sample_rows, version, updated_at = row
+    return TableEntry(
+        name=name,
+        columns=[tuple(column) for column in json.loads(columns)],
+        create_sql=create_sql,
+        row_count=row_count,
+        sample_rows=json.loads(sample_rows),
+        version=version,
+        updated_at=updated_at,
+    )
+
+_ENTRY_COLUMNS = "table_name, columns, create_sql, row_count, sample_rows, version, updated_at"
+
+@traced
+def get_catalog(db_path: str) -> dict[str, TableEntry]:
+    """
+    Reads every catalog entry, ordered by table name.
+
+    Returns:
+        dict[str, TableEntry]: The catalog entries keyed by table name.
+    """
+    _ensure_synced(db_path)
+    with get_connection_manager(db_path).reader() as conn:
+        rows = conn.execute(f'SELECT {_ENTRY_COLUMNS} FROM "{CATALOG_TABLE}" ORDER BY table_name').fetchall()
+    return {row[0]: _entry_from_row(row) for row in rows}
+
+@traced
+def catalog_table_names(db_path: str) -> list[str]:
+    """Reads the names of all cataloged tables, ordered by name."""
+    _ensure_synced(db_path)
+    with get_connection_manager(db_path).reader() as conn:
+        rows = conn.execute(f'SELECT table_name FROM "{CATALOG_TABLE}" ORDER BY table_name').fetchall()
+    return [row[0] for row in rows]
+
+@traced
+def get_table_entries(table_names: list[str], db_path: str) -> dict[str, TableEntry]:
+    """
+    Reads the catalog entries of the given tables with a single primary-key lookup.
+    Tables that are not in the catalog are left out of the result.
+    """
+    _ensure_synced(db_path)
+    if not table_names:
+        return {}
+    placeholders = ", ".join("?" for _ in table_names)
+    with get_connection_manager(db_path).reader() as conn:
+        rows = conn.execute(
+            f'SELECT {_ENTRY_COLUMNS} FROM "{CATALOG_TABLE}" WHERE table_name IN ({placeholders})',
+            list(table_names),
+        ).fetchall()
+    return {row[0]: _entry_from_row(row) for row in rows}
+
+@traced
+def get_table_versions(table_names: list[str], db_path: str) -> dict[str, int]:
+    """
+    Reads the current version of each of the given tables. Tables that do not exist get version 0,
+    so that a cache entry keyed on them is invalidated once they are created.
+    """
+    _ensure_synced(db_path)
+    versions = {table_name: 0 for table_name in table_names}
+    if not table_names:
+        return versions
+    placeholders = ", ".join("?" for _ in table_names)
+    with get_connection_manager(db_path).reader() as conn:
+        rows = conn.execute(
+            f'SELECT table_name, version FROM "{CATALOG_TABLE}" WHERE table_name IN ({placeholders})',
+            list(table_names),
+        ).fetchall()
+    versions.update(dict(rows))
+    return versions
+
+@traced
+def get_catalog_version(db_path: str) -> int:
+    """Reads the latest catalog version, which changes whenever any table is written or dropped."""
+    _ensure_synced(db_path)
+    with get_connection_manager(db_path).reader() as conn:
+        row = conn.execute(f'SELECT value FROM "{CATALOG_STATE_TABLE}" WHERE key = \'version\'').fetchone()
+    return row[0] if row else 0
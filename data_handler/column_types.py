@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import os
+import re
+from dataclasses import dataclass, fields
+from typing import TYPE_CHECKING, Literal
+
+from dotenv import load_dotenv
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+load_dotenv()
+
+@dataclass(kw_only=True)
+class ColumnTypeSettings:
+    """How uploaded columns are typed at ingest. Every field can be overridden by an environment
+    variable named after it, prefixed with 'INGEST_' (e.g. INGEST_DICTIONARY_ENCODING)."""
+    infer_types: bool = True             # parse dates and numbers stored as text, store integral floats as integers
+    dictionary_encoding: bool = False    # store low-cardinality text columns as codes into lookup tables
+    dictionary_max_values: int = 1000    # most distinct values of a dictionary-encoded column
+    dictionary_max_ratio: float = 0.05   # most distinct values per row, in the first chunk
+    sample_size: int = 1000              # values checked when looking for a date format
+
+    @classmethod
+    def from_env(cls, **overrides) -> "ColumnTypeSettings":
+        """Create settings from the environment, with explicit overrides taking precedence."""
+        values = {}
+        for f in fields(cls):
+            env_value = os.environ.get(f"INGEST_{f.name.upper()}")
+            if env_value is None:
+                continue
+            if f.type in (bool, "bool"):
+                values[f.name] = env_value.strip().lower() in ("1", "true", "yes", "on")
+            elif f.type in (float, "float"):
+                values[f.name] = float(env_value)
+            else:
+                values[f.name] = int(env_value)
+        values.update(overrides)
+        return cls(**values)
+
+ColumnKind = Literal["integer", "real", "boolean", "date", "datetime", "text"]
+
+DECLARED_TYPES: dict[str, str] = {
+    "integer": "INTEGER",
+    "real": "REAL",
+    "boolean": "INTEGER",
+    "date": "DATE",
+    "datetime": "TIMESTAMP",
+    "text": "TEXT",
+}
+
+# Date layouts recognized in text columns, tried in order. Month-first comes before day-first, as in pandas.
+DATE_FORMATS = [
+    "%Y-%m-%d",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y/%m/%d",
+    "%m/%d/%Y",
+    "%d/%m/%Y",
+    "%m/%d/%Y %H:%M",
+    "%d/%m/%Y %H:%M",
+    "%d-%m-%Y",
+    "%d.%m.%Y",
+]
+DATE_STORAGE_FORMAT = "%Y-%m-%d"
+DATETIME_STORAGE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Numbers written with a leading zero (zip codes, account numbers) are identifiers and stay text.
+_LEADING_ZERO = re.compile(r"^[+-]?0\d")
+_INT64_LIMIT = 2 ** 63
+
+@dataclass
+class ColumnPlan:
+    """How one column is stored: its SQLite type, and how values are converted to it."""
+    name: str
+    kind: ColumnKind = "text"
+    date_format: str | None = None   # the layout of dates held as text, for 'date' and 'datetime'
+    dictionary: bool = False         # whether values are stored as codes into a lookup table
+
+    @property
+    def declared_type(self) -> str:
+        return DECLARED_TYPES[self.kind]
+
+def _numeric_kind(text: pd.Series) -> ColumnKind | None:
+    import pandas as pd
+
+    if text.str.match(_LEADING_ZERO).any():
+        return None
+    numbers = pd.to_numeric(text, errors="coerce")
+    if numbers.isna().any():
+        return None
+    integral = (numbers % 1 == 0).all() and (numbers.abs() < _INT64_LIMIT).all()
+    return "integer" if integral else "real"
+
+def _date_format(text: pd.Series) -> str | None:
+    import pandas as pd
+
+    for date_format in DATE_FORMATS:
+        if pd.to_datetime(text, format=date_format, errors="coerce").notna().all():
+            return date_format
+    return None
+
+def _infer_text_kind(values: pd.Series, settings: ColumnTypeSettings) -> tuple[ColumnKind, str | None]:
+    """
+    Finds whether the non-null text values of a column are all numbers or all dates of one layout.
+    A sample is checked first, so that most text columns are ruled out without parsing every value.
+    """
+    import pandas as pd
+
+    sample = values.iloc[: settings.sample_size].astype(str).str.strip()
+    if (sample == "").any():
+        return "text", None
+    kind = _numeric_kind(sample)
+    date_format = None if kind else _date_format(sample)
+    if kind is None and date_format is None:
+        return "text", None
+
+    text = values.astype(str).str.strip()
+    if (text == "").any():
+        return "text", None
+    if kind:
+        return _numeric_kind(text) or "text", None
+    parsed = pd.to_datetime(text, format=date_format, errors="coerce")
+    if parsed.isna().any():
+        return "text", None
+    has_time = "%H" in date_format and (parsed.dt.normalize() != parsed).any()
+    return ("datetime" if has_time else "date"), date_format
+
+def infer_column_plans(chunk: pd.DataFrame, settings: ColumnTypeSettings) -> list[ColumnPlan]:
+    """
+    Decides how each column of an upload is stored, from its first chunk.
+
+    - Integer and boolean columns are stored as INTEGER; float columns as INTEGER if every value is whole.
+    - Text columns whose values are all numbers become INTEGER or REAL, unless a value has a leading zero.
+    - Text columns whose values are all dates of one layout become DATE or TIMESTAMP, stored as ISO text
+      so that SQLite's date functions and comparisons work; datetime columns are stored the same way.
+    - With dictionary encoding on, the remaining text columns with few distinct values are encoded.
+
+    Values of later chunks that do not fit their column's type are stored as they are, so nothing is lost.
+    With `infer_types` off, columns keep the type pandas parsed them with.
+
+    Args:
+        chunk (pd.DataFrame): The first chunk of the upload, with sanitized column names.
+        settings (ColumnTypeSettings): The inference settings.
+
+    Returns:
+        list[ColumnPlan]: One plan per column, in column order.
+    """
+    import pandas as pd
+
+    plans = []
+    for name, series in chunk.items():
+        plan = ColumnPlan(name=str(name))
+        values = series.dropna()
+        if pd.api.types.is_bool_dtype(series):
+            plan.kind = "boolean"
+        elif pd.api.types.is_integer_dtype(series):
+            plan.kind = "integer"
+        elif pd.api.types.is_float_dtype(series):
+            whole = settings.infer_types and not values.empty and (values % 1 == 0).all() and (values.abs() < _INT64_LIMIT).all()
+            plan.kind = "integer" if whole else "real"
+        elif pd.api.types.is_datetime64_any_dtype(series):
+            plan.kind = "date" if values.empty or (values.dt.normalize() == values).all() else "datetime"
+        elif settings.infer_types and not values.empty:
+            plan.kind, plan.date_format = _infer_text_kind(values, settings)
+
+        if plan.kind == "text" and settings.dictionary_encoding and not values.empty:
+            distinct = values.nunique()
+            plan.dictionary = (
+                distinct <= settings.dictionary_max_values
+                and distinct / len(series) <= settings.dictionary_max_ratio
+            )
+        plans.append(plan)
+    return plans
+
+def _restore_unparsed(converted: pd.Series, original: pd.Series) -> pd.Series:
+    """Puts back the original value wherever a non-null value could not be converted."""
+    unparsed = converted.isna() & original.notna()
+    if unparsed.any():
+        converted = converted.astype(object)
+        converted[unparsed] = original[unparsed]
+    return converted
+
+def convert_column(series: pd.Series, plan: ColumnPlan) -> list:
+    """
+    Converts the values of one column of a chunk into the Python values stored for its plan.
+    Missing values become None. Dictionary encoding is applied separately, by `DictionaryEncoder`.
+    """
+    import pandas as pd
+
+    if plan.kind in ("integer", "real", "boolean"):
+        if pd.api.types.is_bool_dtype(series):
+            numbers = series.astype("float64")
+        elif pd.api.types.is_numeric_dtype(series):
+            numbers = series
+        else:
+            numbers = pd.to_numeric(series.astype(str).str.strip().where(series.notna()), errors="coerce")
+        values = numbers.astype(object)
+        if plan.kind != "real":
+            whole = numbers.notna() & (numbers % 1 == 0) & (numbers.abs() < _INT64_LIMIT)
+            if whole.any():
+                values[whole] = numbers[whole].astype("int64").astype(object)
+        converted = values.where(numbers.notna())
+        if not pd.api.types.is_numeric_dtype(series):
+            converted = _restore_unparsed(converted, series)
+    elif plan.kind in ("date", "datetime"):
+        storage_format = DATE_STORAGE_FORMAT if plan.kind == "date" else DATETIME_STORAGE_FORMAT
+        if pd.api.types.is_datetime64_any_dtype(series):
+            converted = series.dt.strftime(storage_format)
+        elif plan.date_format == storage_format:
+            converted = series  # already stored as it is written; values that do not parse would be kept anyway
+        else:
+            dates = pd.to_datetime(series.astype(str).str.strip().where(series.notna()), format=plan.date_format, errors="coerce")
+            converted = _restore_unparsed(dates.dt.strftime(storage_format), series)
+    else:
+        converted = series
+    return converted.astype(object).where(converted.notna(), None).tolist()
+
+class DictionaryEncoder:
+    """
+    Assigns integer codes to the distinct values of a dictionary-encoded column, in order of appearance.
+    New values seen in a chunk are collected so they can be added to the lookup table with that chunk.
+    """
+
+    def __init__(self):
+        self.codes: dict = {}
+
+    def encode(self, values: list) -> tuple[list, list[tuple[int, object]]]:
+        """Returns the codes of `values` (None stays None) and the (code, value) pairs new to the lookup table."""
+        new_entries = []
+        codes = []
+        for value in values:
+            if value is None:
+                codes.append(None)
+                continue
+            code = self.codes.get(value)
+            if code is None:
+                code = self.codes[value] = len(self.codes) + 1
+                new_entries.append((code, value))
+            codes.append(code)
+        return codes, new_entries
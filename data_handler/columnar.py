@@ -0,0 +1,433 @@
+"""
+Columnar copies of large tables, queried with DuckDB.
+
+SQLite stores tables row by row, so a query aggregating a few columns of a large table reads every column
+of every row. Tables placed in the columnar store also get a copy in Parquet files, which the agent's
+queries over them read through DuckDB, an embedded columnar engine, instead.
+
+SQLite remains every table's system of record: uploads, previews, paging and the catalog keep using it.
+A table's copy is rebuilt in the background after every write to it (`schedule_columnar_sync`), and is only
+used while it holds the table's current catalog version, so queries fall back to SQLite until it is rebuilt.
+Tables are placed in the columnar store once they have `ColumnarSettings.min_rows` rows, unless their
+placement is pinned with `set_table_placement`.
+
+DuckDB is an optional dependency: without it, every table is only stored and queried in SQLite.
+"""
+import importlib.util
+import os
+import shutil
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields
+from datetime import datetime, timezone
+from typing import Literal
+
+from dotenv import load_dotenv
+
+from .catalog import CATALOG_TABLE, INTERNAL_TABLE_PREFIX, get_table_entries, is_internal_table, catalog_table_names
+from .connection import get_connection_manager
+from .tracing import traced
+
+load_dotenv()
+
+COLUMNAR_TABLE = f"{INTERNAL_TABLE_PREFIX}columnar"
+
+Placement = Literal["auto", "sqlite", "columnar"]
+
+# DuckDB types of the columns' declared SQLite types, by the first matching marker; anything else is text.
+_DUCKDB_TYPES = (
+    ("INT", "BIGINT"),
+    ("REAL", "DOUBLE"),
+    ("FLOA", "DOUBLE"),
+    ("DOUB", "DOUBLE"),
+    ("NUM", "DOUBLE"),
+    ("DEC", "DOUBLE"),
+    ("TIMESTAMP", "TIMESTAMP"),
+    ("DATETIME", "TIMESTAMP"),
+    ("DATE", "DATE"),
+    ("BOOL", "BOOLEAN"),
+)
+
+@dataclass(kw_only=True)
+class ColumnarSettings:
+    """Which tables get a columnar copy, and how it is stored and queried. Every field can be overridden by an
+    environment variable named after it, prefixed with 'COLUMNAR_' (e.g. COLUMNAR_MIN_ROWS)."""
+    enabled: bool = True          # keep columnar copies of large tables, if DuckDB is installed
+    min_rows: int = 1000000       # tables with at least this many rows are placed in the columnar store
+    directory: str = ""           # where the Parquet files go; defaults to '<database name>_columnar' next to it
+    file_rows: int = 1000000      # rows per Parquet file, and per batch read from SQLite while exporting
+    compression: str = "snappy"   # Parquet compression: 'snappy' decodes fastest, 'zstd' is about a third smaller
+    threads: int = 0              # threads DuckDB may use per query; 0 uses all cores
+    memory_limit: str = ""        # memory DuckDB may use, e.g. '2GB'; empty uses its default
+
+    @classmethod
+    def from_env(cls, **overrides) -> "ColumnarSettings":
+        """Create settings from the environment, with explicit overrides taking precedence."""
+        values = {}
+        for f in fields(cls):
+            env_value = os.environ.get(f"COLUMNAR_{f.name.upper()}")
+            if env_value is None:
+                continue
+            if f.type in (bool, "bool"):
+                values[f.name] = env_value.strip().lower() in ("1", "true", "yes", "on")
+            elif f.type in (int, "int"):
+                values[f.name] = int(env_value)
+            else:
+                values[f.name] = env_value
+        values.update(overrides)
+        return cls(**values)
+
+    @property
+    def active(self) -> bool:
+        return self.enabled and duckdb_available()
+
+def duckdb_available() -> bool:
+    """Whether DuckDB is installed. It is only imported once a columnar copy is written or queried."""
+    return importlib.util.find_spec("duckdb") is not None
+
+def columnar_directory(db_path: str, settings: ColumnarSettings) -> str:
+    return os.path.abspath(settings.directory or f"{os.path.splitext(db_path)[0]}_columnar")
+
+def duckdb_type(declared_type: str) -> str:
+    """The DuckDB type a column of the given declared SQLite type is stored as."""
+    declared_type = (declared_type or "").upper()
+    for marker, column_type in _DUCKDB_TYPES:
+        if marker in declared_type:
+            return column_type
+    return "VARCHAR"
+
+def ensure_columnar_table(conn: sqlite3.Connection) -> None:
+    """Creates the table of columnar placements and copies if it does not exist yet. Needs a writable connection."""
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{COLUMNAR_TABLE}" (
+            table_name TEXT PRIMARY KEY,
+            placement TEXT NOT NULL DEFAULT 'auto',
+            path TEXT,
+            version INTEGER,
+            size_bytes INTEGER,
+            exported_at TEXT
+        )
+    """)
+
+@dataclass
+class ColumnarCopy:
+    """The columnar copy of a table, and the catalog version of the table it holds."""
+    table_name: str
+    placement: str
+    path: str | None
+    version: int | None
+    size_bytes: int | None = None
+    exported_at: str | None = None
+    current: bool = False         # whether it holds the table's current version
+
+    def to_dict(self) -> dict:
+        return {field.name: getattr(self, field.name) for field in fields(self)}
+
+def _read_columnar_rows(db_path: str) -> list[ColumnarCopy]:
+    with get_connection_manager(db_path).reader() as conn:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (COLUMNAR_TABLE,)).fetchone() is None:
+            return []
+        rows = conn.execute(
+            f'SELECT c.table_name, c.placement, c.path, c.version, c.size_bytes, c.exported_at, '
+            f'c.version IS NOT NULL AND c.version = k.version FROM "{COLUMNAR_TABLE}" AS c '
+            f'LEFT JOIN "{CATALOG_TABLE}" AS k ON k.table_name = c.table_name ORDER BY c.table_name'
+        ).fetchall()
+    return [ColumnarCopy(*row[:6], current=bool(row[6])) for row in rows]
+
+def get_columnar_copies(db_path: str) -> dict[str, ColumnarCopy]:
+    """The tables whose columnar copy holds their current version, which queries can read instead of SQLite."""
+    return {copy.table_name: copy for copy in _read_columnar_rows(db_path) if copy.current and copy.path}
+
+def get_columnar_report(db_path: str) -> list[ColumnarCopy]:
+    """Every pinned placement and columnar copy, current or not."""
+    return _read_columnar_rows(db_path)
+
+def _wants_copy(placement: str, row_count: int, settings: ColumnarSettings) -> bool:
+    if placement == "auto":
+        return settings.min_rows > 0 and row_count >= settings.min_rows
+    return placement == "columnar"
+
+class UnconvertibleValuesError(ValueError):
+    """A table holds values its columnar copy could not store as they are, so it gets no copy."""
+
+def _export_table(db_path: str, table_name: str, columns: list[tuple[str, str]], target: str, settings: ColumnarSettings) -> tuple[int, int]:
+    """
+    Writes a table's rows into Parquet files in `target`, a batch of `file_rows` rows per file, reading them on
+    a private read-only connection in a single transaction. Returns the catalog version of the rows exported and
+    the size of the files.
+
+    Raises:
+        UnconvertibleValuesError: If a value would be lost converting it to its column's type in the copy, such
+                                  as text that type inference left in a DATE or numeric column. Queries would then
+                                  answer differently on the copy than on SQLite.
+    """
+    import duckdb
+    import pandas as pd
+
+    # Text columns are read as text, so that a batch never mixes types in one column.
+    select_list = ", ".join(
+        f'"{name}"' if duckdb_type(declared_type) != "VARCHAR" else f'CAST("{name}" AS TEXT) AS "{name}"'
+        for name, declared_type in columns
+    )
+    copy_list = ", ".join(f'TRY_CAST("{name}" AS {duckdb_type(declared_type)}) AS "{name}"' for name, declared_type in columns)
+    # Values the cast would turn into NULL (or round, for integers), e.g. text SQLite kept in a DATE column.
+    typed = [(name, duckdb_type(declared_type)) for name, declared_type in columns if duckdb_type(declared_type) != "VARCHAR"]
+    lossy_list = ", ".join(
+        f'COUNT(*) FILTER (WHERE "{name}" IS NOT NULL AND (TRY_CAST("{name}" AS {column_type}) IS NULL'
+        + (f' OR TRY_CAST("{name}" AS DOUBLE) <> TRY_CAST("{name}" AS BIGINT)' if column_type == "BIGINT" else "")
+        + "))"
+        for name, column_type in typed
+    )
+    os.makedirs(target)
+    source = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True, check_same_thread=False)
+    writer = duckdb.connect()
+    try:
+        source.execute("BEGIN")
+        version = source.execute(f'SELECT version FROM "{CATALOG_TABLE}" WHERE table_name = ?', (table_name,)).fetchone()
+        if version is None:
+            raise LookupError(f"Table '{table_name}' not found.")
+        batches = pd.read_sql_query(f'SELECT {select_list} FROM "{table_name}"', source, chunksize=settings.file_rows)
+        part = 0
+        for batch in batches:
+            writer.register("batch", batch)
+            if lossy_list:
+                lost = writer.execute(f"SELECT {lossy_list} FROM batch").fetchone()
+                lossy = [f"{name} ({column_type})" for (name, column_type), count in zip(typed, lost) if count]
+                if lossy:
+                    raise UnconvertibleValuesError(
+                        f"Table '{table_name}' has values that do not convert to the type of their column: {', '.join(lossy)}."
+                    )
+            writer.execute(
+                f"COPY (SELECT {copy_list} FROM batch) TO '{os.path.join(target, f'part-{part:05d}.parquet')}' "
+                f"(FORMAT PARQUET, COMPRESSION {settings.compression.upper()})"
+            )
+            writer.unregister("batch")
+            part += 1
+        if part == 0:
+            # An empty table still gets a file, which gives the copy its columns.
+            empty = ", ".join(f'NULL::{duckdb_type(declared_type)} AS "{name}"' for name, declared_type in columns)
+            writer.execute(
+                f"COPY (SELECT {empty} LIMIT 0) TO '{os.path.join(target, 'part-00000.parquet')}' (FORMAT PARQUET)"
+            )
+    finally:
+        writer.close()
+        source.close()
+    size = sum(entry.stat().st_size for entry in os.scandir(target))
+    return version[0], size
+
+@traced
+def sync_columnar_table(table_name: str, db_path: str, settings: ColumnarSettings | None = None) -> ColumnarCopy | None:
+    """
+    Brings a table's columnar copy in line with its placement: exports the table if it belongs in the columnar
+    store and its copy is missing or stale, and deletes the copy of a table that was dropped or no longer
+    belongs there.
+
+    Returns:
+        ColumnarCopy | None: The table's current copy, or None if it has none.
+    """
+    settings = settings or ColumnarSettings.from_env()
+    if not settings.active or is_internal_table(table_name):
+        return None
+    entry = get_table_entries([table_name], db_path).get(table_name)
+    record = next((copy for copy in _read_columnar_rows(db_path) if copy.table_name == table_name), None)
+    placement = record.placement if record else "auto"
+    if entry is not None and _wants_copy(placement, entry.row_count, settings):
+        if record is not None and record.current and record.path and os.path.isdir(record.path):
+            return record
+        if _unconvertible_versions.get((db_path, table_name)) == entry.version:
+            return None
+        target = os.path.join(columnar_directory(db_path, settings), table_name, uuid.uuid4().hex)
+        try:
+            version, size = _export_table(db_path, table_name, entry.columns, target, settings)
+            with get_connection_manager(db_path).writer() as conn:
+                conn.execute("BEGIN")
+                ensure_columnar_table(conn)
+                current = conn.execute(f'SELECT version FROM "{CATALOG_TABLE}" WHERE table_name = ?', (table_name,)).fetchone()
+                if current is None or current[0] != version:
+                    # The table was written while it was exported; the write scheduled another sync.
+                    conn.rollback()
+                    shutil.rmtree(target, ignore_errors=True)
+                    return None
+                exported_at = datetime.now(timezone.utc).isoformat()
+                conn.execute(
+                    f'INSERT INTO "{COLUMNAR_TABLE}" (table_name, placement, path, version, size_bytes, exported_at) '
+                    "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(table_name) DO UPDATE SET "
+                    "path = excluded.path, version = excluded.version, size_bytes = excluded.size_bytes, "
+                    "exported_at = excluded.exported_at",
+                    (table_name, placement, target, version, size, exported_at),
+                )
+                conn.commit()
+        except UnconvertibleValuesError as e:
+            shutil.rmtree(target, ignore_errors=True)
+            _unconvertible_versions[(db_path, table_name)] = entry.version
+            print(f"{e} It stays on SQLite only.")
+            return None
+        except Exception:
+            shutil.rmtree(target, ignore_errors=True)
+            raise
+        if record is not None and record.path and record.path != target:
+            shutil.rmtree(record.path, ignore_errors=True)
+        print(f"Exported '{table_name}' (version {version}) to the columnar store, {size} bytes.")
+        return ColumnarCopy(table_name, placement, target, version, size, exported_at, current=True)
+
+    if record is not None and (record.path or entry is None):
+        with get_connection_manager(db_path).writer() as conn:
+            conn.execute("BEGIN")
+            if entry is None and placement == "auto":
+                conn.execute(f'DELETE FROM "{COLUMNAR_TABLE}" WHERE table_name = ?', (table_name,))
+            else:
+                conn.execute(
+                    f'UPDATE "{COLUMNAR_TABLE}" SET path = NULL, version = NULL, size_bytes = NULL, exported_at = NULL '
+                    "WHERE table_name = ?",
+                    (table_name,),
+                )
+            conn.commit()
+        if record.path:
+            shutil.rmtree(record.path, ignore_errors=True)
+    return None
+
+def set_table_placement(table_name: str, placement: Placement, db_path: str) -> None:
+    """
+    Pins where a table is stored: 'columnar' keeps a columnar copy whatever its size, 'sqlite' keeps none,
+    and 'auto' places it by size again. The copy is then built or deleted in the background.
+    Pinned placements outlive the table, so a table uploaded again under the same name keeps its placement.
+    """
+    if placement not in ("auto", "sqlite", "columnar"):
+        raise ValueError(f"Placement must be 'auto', 'sqlite' or 'columnar', not '{placement}'.")
+    with get_connection_manager(db_path).writer() as conn:
+        conn.execute("BEGIN")
+        ensure_columnar_table(conn)
+        conn.execute(
+            f'INSERT INTO "{COLUMNAR_TABLE}" (table_name, placement) VALUES (?, ?) '
+            "ON CONFLICT(table_name) DO UPDATE SET placement = excluded.placement",
+            (table_name, placement),
+        )
+        conn.commit()
+    schedule_columnar_sync(db_path, table_name)
+
+_sync_executor: ThreadPoolExecutor | None = None
+_pending_syncs: set[tuple[str, str | None]] = set()
+# The version of each table whose export found unconvertible values, so that it is not exported again until written.
+_unconvertible_versions: dict[tuple[str, str], int] = {}
+_sync_lock = threading.Lock()
+
+def _run_sync(db_path: str, table_name: str | None) -> None:
+    with _sync_lock:
+        _pending_syncs.discard((db_path, table_name))
+    table_names = [table_name] if table_name is not None else catalog_table_names(db_path) + [
+        copy.table_name for copy in _read_columnar_rows(db_path)
+    ]
+    for name in dict.fromkeys(table_names):
+        try:
+            sync_columnar_table(name, db_path)
+        except Exception as e:
+            print(f"Columnar copy of '{name}' failed: {e}")
+
+def schedule_columnar_sync(db_path: str, table_name: str | None = None) -> None:
+    """
+    Syncs a table's columnar copy (see `sync_columnar_table`), or every table's if `table_name` is None,
+    on a background thread. Requests for a table already waiting to be synced are merged.
+    Call it after writing tables, e.g. from a table write listener.
+    """
+    global _sync_executor
+    if not ColumnarSettings.from_env().active:
+        return
+    with _sync_lock:
+        if (db_path, table_name) in _pending_syncs:
+            return
+        _pending_syncs.add((db_path, table_name))
+        if _sync_executor is None:
+            # A single thread, so a table is never exported twice at once.
+            _sync_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="columnar-sync")
+        _sync_executor.submit(_run_sync, db_path, table_name)
+
+def shutdown_columnar_sync() -> None:
+    """Stops the background syncs, dropping the ones not started yet. Call on application shutdown."""
+    global _sync_executor
+    with _sync_lock:
+        executor, _sync_executor = _sync_executor, None
+        _pending_syncs.clear()
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+class ColumnarEngine:
+    """
+    An in-memory DuckDB database that exposes the current columnar copies of one SQLite database's tables
+    as views named after the tables. It can read no files but the copies, and queries run on cursors of it.
+    """
+
+    def __init__(self, db_path: str, settings: ColumnarSettings):
+        import duckdb
+
+        self.db_path = db_path
+        self._conn = duckdb.connect()
+        if settings.threads:
+            self._conn.execute(f"SET threads = {int(settings.threads)}")
+        if settings.memory_limit:
+            self._conn.execute("SET memory_limit = ?", (settings.memory_limit,))
+        directory = columnar_directory(db_path, settings)
+        os.makedirs(directory, exist_ok=True)
+        self._conn.execute("SET allowed_directories = ?", ([directory + os.sep],))
+        self._conn.execute("SET enable_external_access = false")
+        self._views: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def sync_views(self, copies: dict[str, ColumnarCopy]) -> None:
+        """Points the views at the given copies, dropping the views of tables that have none."""
+        wanted = {name: copy.path for name, copy in copies.items()}
+        if wanted == self._views:
+            return
+        with self._lock:
+            for name in set(self._views) - set(wanted):
+                self._conn.execute(f'DROP VIEW IF EXISTS "{name}"')
+            for name, path in wanted.items():
+                if self._views.get(name) != path:
+                    pattern = os.path.join(path, "*.parquet").replace("'", "''")
+                    self._conn.execute(f"CREATE OR REPLACE VIEW \"{name}\" AS SELECT * FROM read_parquet('{pattern}')")
+            self._views = wanted
+
+    def cursor(self):
+        """A new DuckDB cursor, to run one query on."""
+        return self._conn.cursor()
+
+    def close(self) -> None:
+        self._conn.close()
+
+_engines: dict[str, ColumnarEngine] = {}
+_engines_lock = threading.Lock()
+
+def get_columnar_engine(db_path: str, copies: dict[str, ColumnarCopy] | None = None) -> ColumnarEngine | None:
+    """
+    Returns the DuckDB engine of a database, creating it on first use, with its views pointing at `copies`
+    (by default the database's current copies). Returns None if columnar copies are disabled or DuckDB is missing.
+    """
+    settings = ColumnarSettings.from_env()
+    if not settings.active:
+        return None
+    with _engines_lock:
+        engine = _engines.get(db_path)
+        if engine is None:
+            engine = _engines[db_path] = ColumnarEngine(db_path, settings)
+    engine.sync_views(get_columnar_copies(db_path) if copies is None else copies)
+    return engine
+
+def close_columnar_engines() -> None:
+    """Closes every DuckDB engine. Call on application shutdown."""
+    with _engines_lock:
+        engines = list(_engines.values())
+        _engines.clear()
+    for engine in engines:
+        engine.close()
+
+def columnar_query_tables(sql: str) -> set[str] | None:
+    """The tables a query reads, as DuckDB parses it, or None if DuckDB cannot parse it or is not installed."""
+    if not duckdb_available():
+        return None
+    import duckdb
+
+    try:
+        return set(duckdb.get_table_names(sql))
+    except duckdb.Error:
+        return None
@@ -0,0 +1,169 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, fields
+from typing import Iterator
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+@dataclass(kw_only=True)
+class SQLiteSettings:
+    """The tunable settings of pooled SQLite connections. Every field can be overridden by an
+    environment variable named after it, prefixed with 'SQLITE_' (e.g. SQLITE_CACHE_SIZE)."""
+    readers: int = 4
+    busy_timeout: int = 5000             # milliseconds to wait for a lock before failing
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    cache_size: int = -65536             # negative values are KiB, i.e. 64 MiB per connection
+    mmap_size: int = 268435456           # 256 MiB
+    temp_store: str = "MEMORY"
+    # Applied to the writer only while a bulk ingest runs, then restored.
+    bulk_synchronous: str = "OFF"
+    bulk_cache_size: int = -262144       # 256 MiB
+
+    @classmethod
+    def from_env(cls, **overrides) -> "SQLiteSettings":
+        """Create settings from the environment, with explicit overrides taking precedence."""
+        values = {}
+        for f in fields(cls):
+            env_value = os.environ.get(f"SQLITE_{f.name.upper()}")
+            if env_value is not None:
+                values[f.name] = int(env_value) if f.type in (int, "int") else env_value
+        values.update(overrides)
+        return cls(**values)
+
+class ConnectionManager:
+    """
+    Shares SQLite connections to one database file between threads.
+
+    Readers are served from a small pool of query-only connections; all writes go through a single
+    writer connection guarded by a lock, which matches SQLite's one-writer model and avoids lock waits.
+    Every connection is opened once with the configured PRAGMAs (WAL journal by default), and runs in
+    autocommit mode so that transactions are always explicit (`BEGIN` ... `commit()`).
+    """
+
+    def __init__(self, db_path: str, settings: SQLiteSettings | None = None):
+        self.db_path = db_path
+        self.settings = settings or SQLiteSettings.from_env()
+        self._readers: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._reader_count = 0
+        self._reader_lock = threading.Lock()
+        self._writer: sqlite3.Connection | None = None
+        self._writer_lock = threading.RLock()
+        self._closed = False
+
+    def _connect(self, read_only: bool = False) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.settings.busy_timeout / 1000,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        if not read_only:
+            conn.execute(f"PRAGMA journal_mode={self.settings.journal_mode}")
+        conn.execute(f"PRAGMA synchronous={self.settings.synchronous}")
+        conn.execute(f"PRAGMA cache_size={int(self.settings.cache_size)}")
+        conn.execute(f"PRAGMA mmap_size={int(self.settings.mmap_size)}")
+        conn.execute(f"PRAGMA temp_store={self.settings.temp_store}")
+        if read_only:
+            conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """Borrows a query-only connection from the pool, opening one if the pool is not yet full."""
+        conn = None
+        if self._writer is None:
+            # The writer sets the journal mode, so it is opened before any reader.
+            with self.writer():
+                pass
+        with self._reader_lock:
+            if self._readers.empty() and self._reader_count < self.settings.readers:
+                self._reader_count += 1
+                try:
+                    conn = self._connect(read_only=True)
+                except Exception:
+                    self._reader_count -= 1
+                    raise
+        if conn is None:
+            conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            if self._closed:
+                conn.close()
+            else:
+                self._readers.put(conn)
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """Holds the single writer connection. A transaction left open by an error is rolled back."""
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = self._connect()
+            try:
+                yield self._writer
+            finally:
+                if self._writer.in_transaction:
+                    self._writer.rollback()
+
+    @contextmanager
+    def bulk_writer(self) -> Iterator[sqlite3.Connection]:
+        """Holds the writer connection with the bulk-load settings applied, restoring the regular ones afterwards."""
+        with self.writer() as conn:
+            conn.execute(f"PRAGMA synchronous={self.settings.bulk_synchronous}")
+            conn.execute(f"PRAGMA cache_size={int(self.settings.bulk_cache_size)}")
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                conn.execute(f"PRAGMA synchronous={self.settings.synchronous}")
+                conn.execute(f"PRAGMA cache_size={int(self.settings.cache_size)}")
+
+    def close(self) -> None:
+        """Closes every idle connection. Connections still borrowed are closed when they are returned."""
+        self._closed = True
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+_managers: dict[str, ConnectionManager] = {}
+_managers_lock = threading.Lock()
+
+def get_connection_manager(db_path: str, **settings_overrides) -> ConnectionManager:
+    """
+    Returns the shared connection manager for a database file, creating it on first use.
+    Settings overrides only apply when the manager is created.
+    """
+    key = os.path.abspath(db_path)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = ConnectionManager(db_path, SQLiteSettings.from_env(**settings_overrides))
+            _managers[key] = manager
+        return manager
+
+def close_connection_manager(db_path: str) -> None:
+    """Closes and forgets the connection manager of a database file, e.g. before the file is removed."""
+    with _managers_lock:
+        manager = _managers.pop(os.path.abspath(db_path), None)
+    if manager is not None:
+        manager.close()
+
+def close_all_connections() -> None:
+    """Closes every connection manager. Call on application shutdown."""
+    with _managers_lock:
+        managers = list(_managers.values())
+        _managers.clear()
+    for manager in managers:
+        manager.close()
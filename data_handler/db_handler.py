@@ -1,11 +1,30 @@
-import pandas as pd
+from __future__ import annotations
+
 import sqlite3
 import os
 import re
+from typing import Iterable, Literal, TYPE_CHECKING
 from dotenv import load_dotenv
 
+from .connection import get_connection_manager
+from .catalog import catalog_table_names, get_table_entries, refresh_table_entry, remove_table_entry, notify_table_written, table_definition_sql, SAMPLE_ROWS, INTERNAL_TABLE_PREFIX, CATALOG_TABLE
+from .indexes import create_ingest_indexes, index_name
+from .rollups import build_table_rollups, drop_table_rollups
+from .sources import SourceFile, record_source
+from .column_types import ColumnPlan, ColumnTypeSettings, DictionaryEncoder, infer_column_plans, convert_column
+from .tracing import traced
+
+if TYPE_CHECKING:
+    import pandas as pd
+
 load_dotenv()
 
+# pandas is imported by the functions that need it, so that listing, dropping and merging tables
+# (e.g. at web app startup) never pay for importing it.
+
+# How an upload is written to an existing table: replace it, append its rows, or upsert them on a key column.
+IngestMode = Literal["replace", "append", "upsert"]
+
 def get_database_path() -> str:
     """
     Gets the full database path primarily from the DB_PATH environment variable.
@@ -47,9 +66,10 @@ def get_database_path() -> str:
 
 DATABASE_PATH = get_database_path()
 
+@traced
 def list_tables(db_path: str = DATABASE_PATH) -> list[str]:
     """
-    Lists all tables in the SQLite database.
+    Lists all uploaded tables in the SQLite database, as recorded in the table catalog.
 
     Args:
         db_path (str): Path to the SQLite database file.
@@ -59,18 +79,16 @@ def list_tables(db_path: str = DATABASE_PATH) -> list[str]:
     """
     tables = []
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = [row[0] for row in cursor.fetchall()]
-        conn.close()
+        tables = catalog_table_names(db_path)
     except sqlite3.Error as e:
         print(f"SQLite error while listing tables: {e}")
     return tables
 
+@traced
 def get_table_preview(table_name: str, db_path: str = DATABASE_PATH, limit: int = 5) -> pd.DataFrame | None:
     """
     Fetches a preview (first N rows) of a table from the SQLite database.
+    Small previews are served from the sample rows kept in the table catalog.
 
     Args:
         table_name (str): The name of the table to preview.
@@ -80,15 +98,19 @@ def get_table_preview(table_name: str, db_path: str = DATABASE_PATH, limit: int
     Returns:
         pd.DataFrame | None: A DataFrame with the preview data, or None if an error occurs or table not found.
     """
+    import pandas as pd
+
     try:
-        conn = sqlite3.connect(db_path)
+        entry = get_table_entries([table_name], db_path).get(table_name)
+        if entry is not None and (limit <= SAMPLE_ROWS or entry.row_count <= len(entry.sample_rows)):
+            return pd.DataFrame(entry.sample_rows[:limit], columns=entry.column_names)
         # Sanitize table_name just in case, though it should be from a trusted list
         # However, direct SQL construction with f-string is generally risky.
         # Using parameters for table names directly is not supported by sqlite3 for FROM clause.
         # We rely on table_name being from a list of existing tables.
         query = f'SELECT * FROM "{table_name}" LIMIT {limit}'
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+        with get_connection_manager(db_path).reader() as conn:
+            df = pd.read_sql_query(query, conn)
         return df
     except sqlite3.Error as e:
         print(f"SQLite error while getting table preview for '{table_name}': {e}")
@@ -97,6 +119,7 @@ def get_table_preview(table_name: str, db_path: str = DATABASE_PATH, limit: int
         print(f"An unexpected error occurred while getting table preview for '{table_name}': {e}")
         return None
 
+@traced
 def delete_table(table_name: str, db_path: str = DATABASE_PATH) -> tuple[bool, str]:
     """
     Deletes a table from the SQLite database.
@@ -109,12 +132,14 @@ def delete_table(table_name: str, db_path: str = DATABASE_PATH) -> tuple[bool, s
         tuple[bool, str]: (success_status, message)
     """
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        # Ensure table name is quoted for safety, similar to get_table_preview
-        cursor.execute(f'DROP TABLE IF EXISTS "{table_name}"')
-        conn.commit()
-        conn.close()
+        with get_connection_manager(db_path).writer() as conn:
+            conn.execute("BEGIN")
+            _drop_table_objects(conn, table_name)
+            remove_table_entry(conn, table_name)
+            record_source(conn, table_name, None)
+            drop_table_rollups(conn, table_name)
+            conn.commit()
+        notify_table_written(table_name)
         return True, f"Table '{table_name}' deleted successfully."
     except sqlite3.Error as e:
         error_msg = f"SQLite error while deleting table '{table_name}': {e}"
@@ -158,43 +183,352 @@ def sanitize_name(name: str, is_table: bool = True) -> str:
         name = prefix + name
     return name
 
-def push_to_db(df: pd.DataFrame, table_name_base: str, db_path: str = DATABASE_PATH) -> tuple[bool, str | None, str | None]:
+# A dictionary-encoded table is stored as an internal table of codes plus one lookup table per encoded
+# column, behind a view that has the table's name and original columns. `sanitize_name` never produces
+# double underscores, so these names cannot collide with uploaded tables or with each other.
+def _storage_table_name(table_name: str) -> str:
+    return f"{INTERNAL_TABLE_PREFIX}data_{table_name}"
+
+def _lookup_table_name(table_name: str, column_name: str) -> str:
+    return f"{INTERNAL_TABLE_PREFIX}dict_{table_name}__{column_name}"
+
+def _table_objects(conn: sqlite3.Connection, table_name: str, schema: str = "main") -> list[tuple[str, str, str]]:
+    """The (type, name, sql) of the table or view named `table_name` and of the internal tables behind it."""
+    lookup_prefix = _lookup_table_name(table_name, "")
+    return conn.execute(
+        f"SELECT type, name, sql FROM {schema}.sqlite_master WHERE type IN ('table', 'view') "
+        "AND (name = ? OR name = ? OR substr(name, 1, ?) = ?)",
+        (table_name, _storage_table_name(table_name), len(lookup_prefix), lookup_prefix),
+    ).fetchall()
+
+def _drop_table_objects(conn: sqlite3.Connection, table_name: str) -> None:
+    """Drops a table, or the view of a dictionary-encoded table together with its internal tables."""
+    for object_type, name, _ in sorted(_table_objects(conn, table_name), key=lambda obj: obj[0] != "view"):
+        conn.execute(f'DROP {object_type.upper()} IF EXISTS "{name}"')
+
+def _create_table_storage(conn: sqlite3.Connection, table_name: str, plans: list[ColumnPlan]) -> tuple[str, dict[int, str]]:
+    """
+    Creates the table for the given column plans, or for dictionary-encoded columns the internal tables
+    and the view over them.
+
+    Returns:
+        tuple[str, dict[int, str]]: The INSERT statement for the rows, and the INSERT statement of the
+                                    lookup table of each encoded column, by column position.
+    """
+    encoded = any(plan.dictionary for plan in plans)
+    storage_name = _storage_table_name(table_name) if encoded else table_name
+    conn.execute(table_definition_sql(
+        storage_name, [(plan.name, "INTEGER" if plan.dictionary else plan.declared_type) for plan in plans]
+    ))
+    lookup_inserts = {}
+    if encoded:
+        select_list, joins = [], []
+        for position, plan in enumerate(plans):
+            if not plan.dictionary:
+                select_list.append(f't."{plan.name}"')
+                continue
+            lookup_name = _lookup_table_name(table_name, plan.name)
+            alias = f"d{position}"
+            # Values are unique (and so indexed), which appending to the table relies on to look codes up.
+            conn.execute(f'CREATE TABLE "{lookup_name}" (code INTEGER PRIMARY KEY, value TEXT UNIQUE)')
+            lookup_inserts[position] = f'INSERT INTO "{lookup_name}" (code, value) VALUES (?, ?)'
+            select_list.append(f'{alias}.value AS "{plan.name}"')
+            joins.append(f'LEFT JOIN "{lookup_name}" AS {alias} ON {alias}.code = t."{plan.name}"')
+        conn.execute(
+            f'CREATE VIEW "{table_name}" AS SELECT {", ".join(select_list)} '
+            f'FROM "{storage_name}" AS t {" ".join(joins)}'
+        )
+    column_list = ", ".join(f'"{plan.name}"' for plan in plans)
+    placeholders = ", ".join("?" for _ in plans)
+    return f'INSERT INTO "{storage_name}" ({column_list}) VALUES ({placeholders})', lookup_inserts
+
+def _iter_frame_slices(df: pd.DataFrame, chunksize: int):
+    """Yields consecutive row slices of at most `chunksize` rows from a DataFrame."""
+    for start in range(0, len(df), chunksize):
+        yield df.iloc[start:start + chunksize]
+
+@traced
+def push_chunks_to_db(
+    chunks: Iterable[pd.DataFrame],
+    table_name_base: str,
+    db_path: str = DATABASE_PATH,
+    type_settings: ColumnTypeSettings | None = None,
+    mode: IngestMode = "replace",
+    key_column: str | None = None,
+    source: SourceFile | None = None,
+) -> tuple[bool, str | None, str | None]:
+    """
+    Streams DataFrame chunks into a SQLite table inside a single transaction.
+    The table is replaced using the schema of the first chunk, column names are sanitized once,
+    and every chunk is appended as it arrives, so memory use is bounded by the chunk size.
+    Nothing is committed unless every chunk was written.
+
+    Column types are inferred from the first chunk (see `infer_column_plans`): dates are stored as ISO text,
+    numbers held as text become INTEGER or REAL, and, with dictionary encoding on, low-cardinality text
+    columns are stored as codes into lookup tables behind a view with the table's name and columns.
+    With INDEX_AT_INGEST on, the most selective columns are indexed afterwards (see `create_ingest_indexes`),
+    and large tables are then pre-aggregated (see `build_table_rollups`).
+
+    In 'append' and 'upsert' mode the chunks are written to a scratch database first and then merged into
+    the existing table by `merge_staged_table`.
+
+    Args:
+        chunks (Iterable[pd.DataFrame]): The chunks to push, all with the same columns (e.g. from `parse_file_chunks`).
+        table_name_base (str): The base name for the table (e.g., original filename without extension).
+        db_path (str): Path to the SQLite database file.
+        type_settings (ColumnTypeSettings | None): How columns are typed. Defaults to the settings from the environment.
+        mode (IngestMode): Whether to replace the table, append the rows to it, or upsert them on `key_column`.
+        key_column (str | None): The column identifying rows, for 'upsert'.
+        source (SourceFile | None): The fingerprint of the file the chunks were parsed from, recorded with the
+                                    write so that re-uploads of the file can be skipped (see `sources`).
+    Returns:
+        tuple[bool, str | None, str | None]: (success_status, actual_table_name, error_message)
+    """
+    if mode != "replace":
+        return _push_via_staging(chunks, table_name_base, db_path, type_settings, mode, key_column, source)
+    settings = type_settings or ColumnTypeSettings.from_env()
+    actual_table_name = sanitize_name(table_name_base, is_table=True)
+    try:
+        with get_connection_manager(db_path).bulk_writer() as conn:
+            conn.execute("BEGIN")
+            plans = None
+            insert_sql = None
+            lookup_inserts: dict[int, str] = {}
+            encoders: dict[int, DictionaryEncoder] = {}
+            total_rows = 0
+            for chunk in chunks:
+                if plans is None:
+                    clean_columns = [sanitize_name(str(col), is_table=False) for col in chunk.columns]
+                    plans = infer_column_plans(chunk.set_axis(clean_columns, axis=1), settings)
+                    _drop_table_objects(conn, actual_table_name)
+                    insert_sql, lookup_inserts = _create_table_storage(conn, actual_table_name, plans)
+                    encoders = {position: DictionaryEncoder() for position in lookup_inserts}
+
+                columns = []
+                for position, plan in enumerate(plans):
+                    values = convert_column(chunk.iloc[:, position], plan)
+                    if position in encoders:
+                        values, new_entries = encoders[position].encode(values)
+                        if new_entries:
+                            conn.executemany(lookup_inserts[position], new_entries)
+                    columns.append(values)
+                conn.executemany(insert_sql, zip(*columns))
+                total_rows += len(chunk)
+
+            if total_rows == 0:
+                conn.rollback()
+                return False, None, "Input DataFrame is empty. Nothing to push."
+            refresh_table_entry(conn, actual_table_name, row_count=total_rows)
+            record_source(conn, actual_table_name, source)
+            conn.commit()
+        notify_table_written(actual_table_name)
+        create_ingest_indexes(db_path, actual_table_name)
+        build_table_rollups(db_path, actual_table_name)
+        return True, actual_table_name, None
+    except sqlite3.Error as e_sqlite:
+        error_msg = f"SQLite error during database operation: {e_sqlite}"
+        print(error_msg)
+        return False, actual_table_name, error_msg # Return actual_table_name even on error for context
+    except Exception as e:
+        error_msg = f"An unexpected error occurred: {e}"
+        print(error_msg)
+        return False, actual_table_name, error_msg
+
+def _push_via_staging(chunks, table_name_base: str, db_path: str, type_settings, mode: IngestMode, key_column, source) -> tuple[bool, str | None, str | None]:
+    # Imported here, as the ingest module builds on this one.
+    from .ingest import _stage_chunks
+
+    staged = _stage_chunks(chunks, table_name_base, table_name_base, type_settings=type_settings)
+    if not staged.success:
+        return False, staged.table_name, staged.error
+    return merge_staged_table(staged.staging_path, staged.table_name, db_path, mode=mode, key_column=key_column, source=source)
+
+@traced
+def push_to_db(
+    df: pd.DataFrame,
+    table_name_base: str,
+    db_path: str = DATABASE_PATH,
+    chunksize: int | None = None,
+    type_settings: ColumnTypeSettings | None = None,
+    mode: IngestMode = "replace",
+    key_column: str | None = None,
+) -> tuple[bool, str | None, str | None]:
     """
     Pushes a pandas DataFrame to a specified SQLite database table.
+    The DataFrame is written in slices of `chunksize` rows so that no full copy of it is made.
     
     Args:
         df (pd.DataFrame): The DataFrame to push.
         table_name_base (str): The base name for the table (e.g., original filename without extension).
         db_path (str): Path to the SQLite database file. Defaults to DATABASE_NAME.
+        chunksize (int | None): The number of rows written per batch. Defaults to DEFAULT_CHUNK_SIZE.
+        type_settings (ColumnTypeSettings | None): How columns are typed, see `push_chunks_to_db`.
+        mode (IngestMode): Whether to replace the table, append the rows to it, or upsert them on `key_column`.
+        key_column (str | None): The column identifying rows, for 'upsert'.
     Returns:
         tuple[bool, str | None, str | None]: (success_status, actual_table_name, error_message)
     """
+    from .parser import DEFAULT_CHUNK_SIZE
 
     if df.empty:
         return False, None, "Input DataFrame is empty. Nothing to push."
 
-    actual_table_name = sanitize_name(table_name_base, is_table=True)
-    
-    df_renamed = df.copy()
-    clean_columns = {col: sanitize_name(col, is_table=False) for col in df_renamed.columns}
-    df_renamed.rename(columns=clean_columns, inplace=True)
+    return push_chunks_to_db(
+        _iter_frame_slices(df, chunksize or DEFAULT_CHUNK_SIZE), table_name_base, db_path, type_settings, mode, key_column
+    )
+
+def _merge_staged_rows(conn: sqlite3.Connection, table_name: str, mode: IngestMode, key_column: str | None) -> tuple[int, int]:
+    """
+    Appends or upserts the rows of the attached staging table into the existing table of the same name.
+    Columns are matched by name, and values of dictionary-encoded columns are encoded with the existing
+    lookup tables, which gain the values they lack. Call inside the writer's transaction.
+
+    Returns:
+        tuple[int, int]: The number of rows inserted and deleted.
+    """
+    objects = {name: object_type for object_type, name, _ in _table_objects(conn, table_name)}
+    storage_name = _storage_table_name(table_name) if objects.get(table_name) == "view" else table_name
+    columns = [row[1] for row in conn.execute(f'PRAGMA main.table_info("{storage_name}")')]
+    staged_columns = [row[1] for row in conn.execute(f'PRAGMA staging.table_info("{table_name}")')]
+    if sorted(columns) != sorted(staged_columns):
+        raise ValueError(
+            f"The columns of the upload ({', '.join(staged_columns)}) do not match those of table "
+            f"'{table_name}' ({', '.join(columns)})."
+        )
+    if mode == "upsert" and key_column not in columns:
+        raise ValueError(f"Key column '{key_column}' is not a column of table '{table_name}'.")
+
+    select_list, joins = [], []
+    for position, column in enumerate(columns):
+        lookup_name = _lookup_table_name(table_name, column)
+        if lookup_name not in objects:
+            select_list.append(f's."{column}"')
+            continue
+        conn.execute(
+            f'INSERT INTO main."{lookup_name}" (value) SELECT DISTINCT s."{column}" FROM staging."{table_name}" AS s '
+            f'WHERE s."{column}" IS NOT NULL AND s."{column}" NOT IN (SELECT value FROM main."{lookup_name}")'
+        )
+        select_list.append(f'd{position}.code')
+        joins.append(f'LEFT JOIN main."{lookup_name}" AS d{position} ON d{position}.value = s."{column}"')
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    select_sql = f'SELECT {", ".join(select_list)} FROM staging."{table_name}" AS s {" ".join(joins)}'
+
+    if mode == "append":
+        return conn.execute(f'INSERT INTO main."{storage_name}" ({column_list}) {select_sql}').rowcount, 0
+
+    # Upserts delete the rows whose key comes again, then insert the upload; the key is indexed for the deletes.
+    conn.execute(
+        f'CREATE INDEX IF NOT EXISTS main."{index_name(table_name, key_column)}" ON "{storage_name}" ("{key_column}")'
+    )
+    incoming = f"{INTERNAL_TABLE_PREFIX}incoming"
+    conn.execute(f'DROP TABLE IF EXISTS temp."{incoming}"')
+    conn.execute(f'CREATE TEMP TABLE "{incoming}" ({column_list})')
     try:
-        conn = sqlite3.connect(db_path)
-        df_renamed.to_sql(actual_table_name, conn, if_exists='replace', index=False)
-        conn.commit()
-        conn.close()
-        return True, actual_table_name, None
+        conn.execute(f'INSERT INTO temp."{incoming}" ({column_list}) {select_sql}')
+        # The last row of the upload with a given key wins; rows without a key are all kept.
+        conn.execute(
+            f'DELETE FROM temp."{incoming}" WHERE "{key_column}" IS NOT NULL AND rowid NOT IN '
+            f'(SELECT MAX(rowid) FROM temp."{incoming}" WHERE "{key_column}" IS NOT NULL GROUP BY "{key_column}")'
+        )
+        deleted = conn.execute(
+            f'DELETE FROM main."{storage_name}" WHERE "{key_column}" IN (SELECT "{key_column}" FROM temp."{incoming}")'
+        ).rowcount
+        inserted = conn.execute(
+            f'INSERT INTO main."{storage_name}" ({column_list}) SELECT {column_list} FROM temp."{incoming}"'
+        ).rowcount
+    finally:
+        conn.execute(f'DROP TABLE IF EXISTS temp."{incoming}"')
+    return inserted, deleted
+
+@traced
+def merge_staged_table(
+    staging_path: str,
+    table_name: str,
+    db_path: str = DATABASE_PATH,
+    mode: IngestMode = "replace",
+    key_column: str | None = None,
+    source: SourceFile | None = None,
+) -> tuple[bool, str | None, str | None]:
+    """
+    Copies a table from a staging database (e.g. written by `stage_file`) into the SQLite database in a
+    single transaction. A dictionary-encoded table is copied with its internal tables and view. The copy
+    runs entirely inside SQLite, and the staging file is removed afterwards.
+
+    By default any existing table of the same name is replaced. In 'append' mode the staged rows are added
+    to the existing table; in 'upsert' mode existing rows whose `key_column` value comes again in the staged
+    rows are replaced by them. Both need the staged table to have the existing table's columns, and behave
+    like 'replace' when the table does not exist yet. The table's rollups are rebuilt afterwards
+    (see `build_table_rollups`).
+
+    Args:
+        staging_path (str): Path to the staging SQLite database file.
+        table_name (str): The (already sanitized) name of the table to copy.
+        db_path (str): Path to the SQLite database file.
+        mode (IngestMode): Whether to replace the table, append the rows to it, or upsert them on `key_column`.
+        key_column (str | None): The column identifying rows, for 'upsert'. Sanitized like the column names.
+        source (SourceFile | None): The fingerprint of the file the table was parsed from, recorded with the write.
+    Returns:
+        tuple[bool, str | None, str | None]: (success_status, actual_table_name, error_message)
+    """
+    if mode == "upsert":
+        if not key_column:
+            return False, table_name, "Upserting needs a key column."
+        key_column = sanitize_name(key_column, is_table=False)
+    try:
+        with get_connection_manager(db_path).bulk_writer() as conn:
+            conn.execute("ATTACH DATABASE ? AS staging", (staging_path,))
+            try:
+                objects = _table_objects(conn, table_name, schema="staging")
+                if not any(name == table_name for _, name, _ in objects):
+                    return False, table_name, f"Staged table '{table_name}' not found."
+                conn.execute("BEGIN")
+                replace = mode == "replace" or not any(name == table_name for _, name, _ in _table_objects(conn, table_name))
+                if replace:
+                    _drop_table_objects(conn, table_name)
+                    row_count = None
+                    # Tables first, then the view over them.
+                    for object_type, name, create_sql in sorted(objects, key=lambda obj: obj[0] == "view"):
+                        conn.execute(create_sql)
+                        if object_type == "table":
+                            cursor = conn.execute(f'INSERT INTO main."{name}" SELECT * FROM staging."{name}"')
+                            if name in (table_name, _storage_table_name(table_name)):
+                                row_count = cursor.rowcount
+                else:
+                    inserted, deleted = _merge_staged_rows(conn, table_name, mode, key_column)
+                    previous = conn.execute(
+                        f'SELECT row_count FROM "{CATALOG_TABLE}" WHERE table_name = ?', (table_name,)
+                    ).fetchone()
+                    row_count = previous[0] + inserted - deleted if previous else None
+                refresh_table_entry(conn, table_name, row_count=row_count)
+                record_source(conn, table_name, source)
+                conn.commit()
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                conn.execute("DETACH DATABASE staging")
+        notify_table_written(table_name)
+        if replace:
+            create_ingest_indexes(db_path, table_name)
+        build_table_rollups(db_path, table_name)
+        return True, table_name, None
+    except ValueError as e_columns:
+        print(e_columns)
+        return False, table_name, str(e_columns)
     except sqlite3.Error as e_sqlite:
         error_msg = f"SQLite error during database operation: {e_sqlite}"
         print(error_msg)
-        return False, actual_table_name, error_msg # Return actual_table_name even on error for context
+        return False, table_name, error_msg
     except Exception as e:
         error_msg = f"An unexpected error occurred: {e}"
         print(error_msg)
-        return False, actual_table_name, error_msg
+        return False, table_name, error_msg
+    finally:
+        if os.path.exists(staging_path):
+            os.remove(staging_path)
 
 if __name__ == '__main__':
-    
+    import pandas as pd
+
     # Test reading from actual database
     print("\nChecking contents of production database...")
     try:
@@ -0,0 +1,553 @@
+"""
+Index advisor for uploaded tables.
+
+Uploaded tables are created without indexes. For every query the agent runs, it records the columns the
+query filters, joins and groups on, together with the query's plan (`record_index_usage`). The uses are
+buffered in memory and written every `flush_interval` seconds, in one transaction. `advise_indexes`
+then indexes the columns that keep being used by queries which scan a whole table, most used first, within
+a storage budget. It drops managed indexes whose columns went idle, or whose columns are used less than a
+column that needs the room. Each index is timed against the last query that needed it, before and after it
+is built, so its speedup can be reported. `create_ingest_indexes` can also index the selective columns of
+a table right after it is uploaded.
+
+Indexes are built by a job the process owning the database's writes runs every `advise_interval` seconds
+(`start_index_advisor`, started by the web app), never on the path of a query.
+
+Managed indexes are named `_datapal_idx_<table>__<column>` and listed in an internal table, which
+`get_index_report` reads.
+"""
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, fields
+from datetime import datetime, timedelta, timezone
+from typing import Literal
+
+from dotenv import load_dotenv
+
+from .catalog import INTERNAL_TABLE_PREFIX
+from .connection import get_connection_manager
+from .tracing import traced
+
+load_dotenv()
+
+INDEX_USAGE_TABLE = f"{INTERNAL_TABLE_PREFIX}index_usage"
+INDEX_TABLE = f"{INTERNAL_TABLE_PREFIX}indexes"
+INDEX_PREFIX = f"{INTERNAL_TABLE_PREFIX}idx_"
+# Columns whose values average more than this many characters hold free text, which is not indexed at upload.
+_FREE_TEXT_LENGTH = 64
+
+ColumnUseKind = Literal["filter", "join", "group"]
+
+@dataclass(kw_only=True)
+class IndexSettings:
+    """How indexes are managed. Every field can be overridden by an environment variable named after it,
+    prefixed with 'INDEX_' (e.g. INDEX_STORAGE_BUDGET)."""
+    advisor: bool = True                  # record the columns agent queries use and index the hot ones
+    storage_budget: int = 67108864        # bytes all managed indexes of a database may take, 64 MiB
+    min_uses: int = 3                     # scanning queries using a column before it is indexed
+    idle_days: float = 7.0                # managed indexes whose column was not used for this long are dropped
+    at_ingest: bool = False               # index selective columns when a table is uploaded
+    ingest_max_columns: int = 2           # most columns indexed per uploaded table
+    ingest_min_selectivity: float = 0.01  # distinct values per row a column needs to be indexed at upload
+    sample_rows: int = 10000              # rows sampled to estimate a column's cardinality and index size
+    timing_timeout: float = 10.0          # seconds a query may run when timed before and after indexing
+    flush_interval: float = 30.0          # seconds recorded column uses are buffered in memory before being written
+    advise_interval: float = 300.0        # seconds between two passes of the job started by `start_index_advisor`
+
+    @classmethod
+    def from_env(cls, **overrides) -> "IndexSettings":
+        """Create settings from the environment, with explicit overrides taking precedence."""
+        values = {}
+        for f in fields(cls):
+            env_value = os.environ.get(f"INDEX_{f.name.upper()}")
+            if env_value is None:
+                continue
+            if f.type in (bool, "bool"):
+                values[f.name] = env_value.strip().lower() in ("1", "true", "yes", "on")
+            elif f.type in (float, "float"):
+                values[f.name] = float(env_value)
+            else:
+                values[f.name] = int(env_value)
+        values.update(overrides)
+        return cls(**values)
+
+@dataclass
+class IndexRecord:
+    """A managed index, with the timing of the query it was built for (if any)."""
+    name: str
+    table_name: str
+    column_name: str
+    origin: Literal["advisor", "ingest"]
+    size_bytes: int
+    created_at: str
+    query: str | None = None
+    seconds_before: float | None = None
+    seconds_after: float | None = None
+
+    @property
+    def speedup(self) -> float | None:
+        if not self.seconds_before or not self.seconds_after:
+            return None
+        return self.seconds_before / self.seconds_after
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "table_name": self.table_name,
+            "column_name": self.column_name,
+            "origin": self.origin,
+            "size_bytes": self.size_bytes,
+            "created_at": self.created_at,
+            "query": self.query,
+            "seconds_before": self.seconds_before,
+            "seconds_after": self.seconds_after,
+            "speedup": self.speedup,
+        }
+
+@dataclass
+class IndexReport:
+    """What one `advise_indexes` pass changed."""
+    created: list[IndexRecord]
+    dropped: list[IndexRecord]
+
+def index_name(table_name: str, column_name: str) -> str:
+    # `sanitize_name` never produces double underscores, so the name is unique per table and column.
+    return f"{INDEX_PREFIX}{table_name}__{column_name}"
+
+def ensure_index_tables(conn: sqlite3.Connection) -> None:
+    """Creates the index advisor's tables if they do not exist yet. Needs a writable connection."""
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{INDEX_USAGE_TABLE}" (
+            table_name TEXT NOT NULL,
+            column_name TEXT NOT NULL,
+            filter_uses INTEGER NOT NULL DEFAULT 0,
+            join_uses INTEGER NOT NULL DEFAULT 0,
+            group_uses INTEGER NOT NULL DEFAULT 0,
+            scans INTEGER NOT NULL DEFAULT 0,
+            last_used TEXT NOT NULL,
+            last_query TEXT NOT NULL,
+            last_plan TEXT NOT NULL,
+            PRIMARY KEY (table_name, column_name)
+        )
+    """)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{INDEX_TABLE}" (
+            index_name TEXT PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            column_name TEXT NOT NULL,
+            origin TEXT NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            query TEXT,
+            seconds_before REAL,
+            seconds_after REAL
+        )
+    """)
+
+def plan_scans_table(plan: list[str]) -> bool:
+    """Whether an EXPLAIN QUERY PLAN output reads a whole table, or sorts to group, without an index."""
+    return any(
+        (detail.startswith("SCAN ") and "INDEX" not in detail) or "TEMP B-TREE FOR GROUP BY" in detail
+        for detail in plan
+    )
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _indexed_columns(conn: sqlite3.Connection, table_name: str) -> set[str]:
+    """The columns that lead an existing index of the table, managed or not."""
+    columns = set()
+    for row in conn.execute(f'PRAGMA index_list("{table_name}")').fetchall():
+        info = conn.execute(f'PRAGMA index_info("{row[1]}")').fetchone()
+        if info is not None and info[2] is not None:
+            columns.add(info[2])
+    return columns
+
+def _is_table(conn: sqlite3.Connection, table_name: str) -> bool:
+    # Dictionary-encoded uploads are views, which cannot be indexed.
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)
+    ).fetchone() is not None
+
+@dataclass
+class _ColumnUsage:
+    """The uses of a column recorded since the last flush."""
+    filter_uses: int = 0
+    join_uses: int = 0
+    group_uses: int = 0
+    scans: int = 0
+    last_used: str = ""
+    last_query: str = ""
+    last_plan: str = ""
+
+_usage_buffers: dict[str, dict[tuple[str, str], _ColumnUsage]] = {}
+_flush_timers: dict[str, threading.Timer] = {}
+_usage_lock = threading.Lock()
+
+def record_index_usage(
+    db_path: str,
+    sql: str,
+    uses: list[tuple[str, str, ColumnUseKind]],
+    plan: list[str],
+    settings: IndexSettings | None = None,
+) -> None:
+    """
+    Records the columns one query filtered, joined and grouped on, and its plan. The uses are kept in memory
+    and written by `flush_index_usage`, within `flush_interval` seconds.
+
+    Args:
+        db_path (str): Path to the SQLite database file.
+        sql (str): The query.
+        uses (list[tuple[str, str, ColumnUseKind]]): (table, column, kind) for each column use of the query.
+        plan (list[str]): The query's EXPLAIN QUERY PLAN details.
+        settings (IndexSettings | None): Defaults to the settings from the environment.
+    """
+    settings = settings or IndexSettings.from_env()
+    kinds: dict[tuple[str, str], set[str]] = {}
+    for table_name, column_name, kind in uses:
+        kinds.setdefault((table_name, column_name), set()).add(kind)
+    if not kinds:
+        return
+    scanned = plan_scans_table(plan)
+    plan_text = "\n".join(plan)
+    now = _now()
+    with _usage_lock:
+        buffer = _usage_buffers.setdefault(db_path, {})
+        for key, column_kinds in kinds.items():
+            usage = buffer.setdefault(key, _ColumnUsage())
+            usage.filter_uses += "filter" in column_kinds
+            usage.join_uses += "join" in column_kinds
+            usage.group_uses += "group" in column_kinds
+            usage.scans += scanned
+            usage.last_used = now
+            # The query and plan kept are those of the last scan, which an index would speed up.
+            if scanned or not usage.scans:
+                usage.last_query, usage.last_plan = sql, plan_text
+        if db_path not in _flush_timers:
+            timer = threading.Timer(settings.flush_interval, flush_index_usage, (db_path,))
+            timer.daemon = True
+            _flush_timers[db_path] = timer
+            timer.start()
+
+@traced
+def flush_index_usage(db_path: str) -> int:
+    """
+    Writes the column uses recorded in this process since the last flush, in a single transaction.
+
+    Returns:
+        int: The number of columns whose uses were written.
+    """
+    with _usage_lock:
+        buffer = _usage_buffers.pop(db_path, {})
+        timer = _flush_timers.pop(db_path, None)
+    if timer is not None:
+        timer.cancel()
+    if not buffer:
+        return 0
+    try:
+        with get_connection_manager(db_path).writer() as conn:
+            conn.execute("BEGIN")
+            ensure_index_tables(conn)
+            conn.executemany(
+                f'INSERT INTO "{INDEX_USAGE_TABLE}" '
+                "(table_name, column_name, filter_uses, join_uses, group_uses, scans, last_used, last_query, last_plan) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(table_name, column_name) DO UPDATE SET "
+                "filter_uses = filter_uses + excluded.filter_uses, join_uses = join_uses + excluded.join_uses, "
+                "group_uses = group_uses + excluded.group_uses, scans = scans + excluded.scans, "
+                "last_used = excluded.last_used, "
+                "last_query = CASE WHEN excluded.scans > 0 THEN excluded.last_query ELSE last_query END, "
+                "last_plan = CASE WHEN excluded.scans > 0 THEN excluded.last_plan ELSE last_plan END",
+                [
+                    (
+                        table_name, column_name, usage.filter_uses, usage.join_uses, usage.group_uses,
+                        usage.scans, usage.last_used, usage.last_query, usage.last_plan,
+                    )
+                    for (table_name, column_name), usage in buffer.items()
+                ],
+            )
+            conn.commit()
+    except sqlite3.Error as e:
+        print(f"Index advisor: could not record the uses of {len(buffer)} columns: {e}")
+        return 0
+    return len(buffer)
+
+@atexit.register
+def _flush_all_index_usage() -> None:
+    # Uses still buffered when the process exits are written rather than lost.
+    for db_path in list(_usage_buffers):
+        flush_index_usage(db_path)
+
+def _index_size(conn: sqlite3.Connection, name: str) -> int | None:
+    """The bytes an index takes, from the dbstat table where SQLite was built with it."""
+    try:
+        return conn.execute("SELECT SUM(pgsize) FROM dbstat WHERE name = ?", (name,)).fetchone()[0]
+    except sqlite3.Error:
+        return None
+
+def _estimate_index_size(conn: sqlite3.Connection, table_name: str, column_name: str, sample_rows: int) -> int:
+    """Estimates an index's size from the table's row count and a sample of the column's values."""
+    rows = conn.execute(f'SELECT MAX(rowid) FROM "{table_name}"').fetchone()[0] or 0
+    average_length = conn.execute(
+        f'SELECT AVG(LENGTH(CAST("{column_name}" AS BLOB))) FROM (SELECT "{column_name}" FROM "{table_name}" LIMIT ?)',
+        (sample_rows,),
+    ).fetchone()[0] or 0
+    # Each entry holds the key, the rowid and a record header; built indexes fill their pages almost fully.
+    return int(rows * (average_length + 12) * 1.1)
+
+def _time_query(conn: sqlite3.Connection, sql: str, timeout: float) -> float | None:
+    """Runs a query to completion and returns its duration, or None if it failed or ran past `timeout`."""
+    deadline = time.monotonic() + timeout
+    conn.set_progress_handler(lambda: time.monotonic() > deadline, 1000)
+    started = time.perf_counter()
+    try:
+        cursor = conn.execute(sql)
+        while cursor.fetchmany(1024):
+            pass
+        return time.perf_counter() - started
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.set_progress_handler(None, 0)
+        if conn.in_transaction:
+            conn.rollback()
+
+def _managed_indexes(conn: sqlite3.Connection) -> list[IndexRecord]:
+    rows = conn.execute(
+        f'SELECT index_name, table_name, column_name, origin, size_bytes, created_at, query, seconds_before, seconds_after '
+        f'FROM "{INDEX_TABLE}" ORDER BY created_at'
+    ).fetchall()
+    return [IndexRecord(*row) for row in rows]
+
+def _build_index(
+    db_path: str,
+    table_name: str,
+    column_name: str,
+    origin: Literal["advisor", "ingest"],
+    query: str | None,
+    settings: IndexSettings,
+) -> IndexRecord:
+    """Creates a managed index, timing `query` on a reader before and after it is built."""
+    manager = get_connection_manager(db_path)
+    seconds_before = None
+    if query:
+        with manager.reader() as conn:
+            seconds_before = _time_query(conn, query, settings.timing_timeout)
+    name = index_name(table_name, column_name)
+    with manager.writer() as conn:
+        conn.execute("BEGIN")
+        ensure_index_tables(conn)
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table_name}" ("{column_name}")')
+        size = _index_size(conn, name)
+        if size is None:
+            size = _estimate_index_size(conn, table_name, column_name, settings.sample_rows)
+        record = IndexRecord(name, table_name, column_name, origin, size, _now(), query, seconds_before)
+        conn.execute(
+            f'INSERT OR REPLACE INTO "{INDEX_TABLE}" '
+            "(index_name, table_name, column_name, origin, size_bytes, created_at, query, seconds_before) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (name, table_name, column_name, origin, size, record.created_at, query, seconds_before),
+        )
+        conn.commit()
+    if query:
+        with manager.reader() as conn:
+            record.seconds_after = _time_query(conn, query, settings.timing_timeout)
+        with manager.writer() as conn:
+            conn.execute(
+                f'UPDATE "{INDEX_TABLE}" SET seconds_after = ? WHERE index_name = ?', (record.seconds_after, name)
+            )
+    speedup = f", query {record.seconds_before:.4f}s -> {record.seconds_after:.4f}s (x{record.speedup:.1f})" if record.speedup else ""
+    print(f"Index advisor: created {name} on {table_name}({column_name}), {size} bytes{speedup}")
+    return record
+
+def _drop_index(conn: sqlite3.Connection, record: IndexRecord, reason: str) -> None:
+    conn.execute(f'DROP INDEX IF EXISTS "{record.name}"')
+    conn.execute(f'DELETE FROM "{INDEX_TABLE}" WHERE index_name = ?', (record.name,))
+    print(f"Index advisor: dropped {record.name} ({reason})")
+
+@traced
+def advise_indexes(db_path: str, settings: IndexSettings | None = None) -> IndexReport:
+    """
+    Brings the managed indexes in line with how columns are used.
+
+    - Records of indexes that vanished (their table was dropped or re-uploaded) are removed.
+    - Managed indexes whose column has not been used for `idle_days` are dropped.
+    - Columns used by at least `min_uses` queries that scanned a table, and used within `idle_days`, are
+      indexed, most used first.
+      While an index does not fit the storage budget, managed indexes of less used columns are dropped
+      to make room; if that is not enough, the column is skipped.
+
+    Args:
+        db_path (str): Path to the SQLite database file.
+        settings (IndexSettings | None): Defaults to the settings from the environment.
+
+    Returns:
+        IndexReport: The indexes created, with their measured speedup, and the indexes dropped.
+    """
+    settings = settings or IndexSettings.from_env()
+    manager = get_connection_manager(db_path)
+    report = IndexReport(created=[], dropped=[])
+    with manager.writer() as conn:
+        conn.execute("BEGIN")
+        ensure_index_tables(conn)
+        conn.execute(
+            f'DELETE FROM "{INDEX_TABLE}" WHERE index_name NOT IN (SELECT name FROM sqlite_master WHERE type = \'index\')'
+        )
+        conn.execute(
+            f'DELETE FROM "{INDEX_USAGE_TABLE}" WHERE table_name NOT IN '
+            "(SELECT name FROM sqlite_master WHERE type IN ('table', 'view'))"
+        )
+        usage = {
+            (table_name, column_name): (scans, last_used, last_query)
+            for table_name, column_name, scans, last_used, last_query in conn.execute(
+                f'SELECT table_name, column_name, scans, last_used, last_query FROM "{INDEX_USAGE_TABLE}"'
+            )
+        }
+        managed = _managed_indexes(conn)
+        idle_since = (datetime.now(timezone.utc) - timedelta(days=settings.idle_days)).isoformat()
+        for record in list(managed):
+            last_used = usage.get((record.table_name, record.column_name), (0, "", None))[1]
+            if max(record.created_at, last_used) < idle_since:
+                _drop_index(conn, record, f"unused for {settings.idle_days:g} days")
+                managed.remove(record)
+                report.dropped.append(record)
+
+        candidates = []
+        for (table_name, column_name), (scans, last_used, last_query) in usage.items():
+            if scans < settings.min_uses or last_used < idle_since or not _is_table(conn, table_name):
+                continue
+            columns = {row[1] for row in conn.execute(f'PRAGMA table_info("{table_name}")')}
+            if column_name in columns and column_name not in _indexed_columns(conn, table_name):
+                candidates.append((scans, table_name, column_name, last_query))
+        conn.commit()
+
+        to_build = []
+        used_bytes = sum(record.size_bytes for record in managed)
+        for scans, table_name, column_name, last_query in sorted(candidates, reverse=True):
+            size = _estimate_index_size(conn, table_name, column_name, settings.sample_rows)
+            # Less used columns give up their index first; indexes built at upload have no uses yet.
+            evictable = sorted(
+                (record for record in managed
+                 if usage.get((record.table_name, record.column_name), (0,))[0] < scans),
+                key=lambda record: usage.get((record.table_name, record.column_name), (0,))[0],
+            )
+            freed, evicted = 0, []
+            while used_bytes - freed + size > settings.storage_budget and evictable:
+                record = evictable.pop(0)
+                freed += record.size_bytes
+                evicted.append(record)
+            if used_bytes - freed + size > settings.storage_budget:
+                continue
+            conn.execute("BEGIN")
+            for record in evicted:
+                _drop_index(conn, record, f"making room for {table_name}({column_name})")
+                managed.remove(record)
+                report.dropped.append(record)
+            conn.commit()
+            used_bytes += size - freed
+            to_build.append((table_name, column_name, last_query))
+
+    # Built outside the writer lock held above, so that timing the queries never blocks uploads.
+    for table_name, column_name, last_query in to_build:
+        try:
+            report.created.append(_build_index(db_path, table_name, column_name, "advisor", last_query, settings))
+        except sqlite3.Error as e:
+            print(f"Index advisor: could not index {table_name}({column_name}): {e}")
+    return report
+
+_advisor_thread: threading.Thread | None = None
+_advisor_stop = threading.Event()
+_advisor_lock = threading.Lock()
+
+def _run_advisor(db_path: str, settings: IndexSettings, stop: threading.Event) -> None:
+    while not stop.wait(settings.advise_interval):
+        try:
+            flush_index_usage(db_path)
+            advise_indexes(db_path, settings)
+        except Exception as e:
+            print(f"Index advisor failed: {e}")
+
+def start_index_advisor(db_path: str, settings: IndexSettings | None = None) -> None:
+    """
+    Runs `advise_indexes` every `advise_interval` seconds on a background thread, if the advisor is on.
+    Call it once, at startup, in the process owning the database's writes (the web app), so that indexes are
+    built through its writer connection; processes that run queries only record the columns they use.
+    """
+    global _advisor_thread
+    settings = settings or IndexSettings.from_env()
+    if not settings.advisor:
+        return
+    with _advisor_lock:
+        if _advisor_thread is not None:
+            return
+        _advisor_stop.clear()
+        _advisor_thread = threading.Thread(
+            target=_run_advisor, args=(db_path, settings, _advisor_stop), name="index-advisor", daemon=True
+        )
+        _advisor_thread.start()
+
+def stop_index_advisor() -> None:
+    """Stops the advisor job, waiting for a pass under way to finish. Call on application shutdown."""
+    global _advisor_thread
+    with _advisor_lock:
+        thread, _advisor_thread = _advisor_thread, None
+        _advisor_stop.set()
+    if thread is not None:
+        thread.join()
+
+@traced
+def create_ingest_indexes(db_path: str, table_name: str, settings: IndexSettings | None = None) -> list[IndexRecord]:
+    """
+    Indexes the most selective columns of a freshly uploaded table, if `at_ingest` is on.
+    Columns qualify when a sample of their values has at least `ingest_min_selectivity` distinct values
+    per row; REAL columns (measures) and free text are skipped. At most `ingest_max_columns` columns are
+    indexed, most distinct values first, and only while the storage budget allows.
+
+    Returns:
+        list[IndexRecord]: The indexes created; empty when `at_ingest` is off or the table is a view.
+    """
+    settings = settings or IndexSettings.from_env()
+    if not settings.at_ingest:
+        return []
+    try:
+        with get_connection_manager(db_path).reader() as conn:
+            if not _is_table(conn, table_name):
+                return []
+            candidates = []
+            for _, column_name, declared_type, *_ in conn.execute(f'PRAGMA table_info("{table_name}")').fetchall():
+                if declared_type.upper() in ("REAL", "FLOAT", "DOUBLE"):
+                    continue
+                distinct, sampled, average_length = conn.execute(
+                    f'SELECT COUNT(DISTINCT "{column_name}"), COUNT(*), AVG(LENGTH("{column_name}")) '
+                    f'FROM (SELECT "{column_name}" FROM "{table_name}" LIMIT ?)',
+                    (settings.sample_rows,),
+                ).fetchone()
+                if sampled and distinct / sampled >= settings.ingest_min_selectivity \
+                        and (average_length or 0) <= _FREE_TEXT_LENGTH:
+                    candidates.append((distinct, column_name))
+            used_bytes = sum(
+                size for (size,) in conn.execute(f'SELECT size_bytes FROM "{INDEX_TABLE}"')
+            ) if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (INDEX_TABLE,)).fetchone() else 0
+            chosen = []
+            for _, column_name in sorted(candidates, reverse=True)[: settings.ingest_max_columns]:
+                size = _estimate_index_size(conn, table_name, column_name, settings.sample_rows)
+                if used_bytes + size <= settings.storage_budget:
+                    used_bytes += size
+                    chosen.append(column_name)
+        return [_build_index(db_path, table_name, column_name, "ingest", None, settings) for column_name in chosen]
+    except sqlite3.Error as e:
+        print(f"Index advisor: could not index uploaded table '{table_name}': {e}")
+        return []
+
+@traced
+def get_index_report(db_path: str) -> list[IndexRecord]:
+    """Lists the managed indexes of a database, with the speedup measured when each was built."""
+    with get_connection_manager(db_path).reader() as conn:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (INDEX_TABLE,)).fetchone() is None:
+            return []
+        # Indexes dropped along with their table are still listed until the advisor's next pass.
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        return [record for record in _managed_indexes(conn) if record.name in existing]
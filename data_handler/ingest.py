@@ -0,0 +1,90 @@
+import os
+import tempfile
+from dataclasses import dataclass
+
+from .db_handler import push_chunks_to_db
+from .connection import get_connection_manager, close_connection_manager
+from .tracing import traced
+
+@dataclass
+class StagedTable:
+    """The outcome of parsing one file (or one worksheet of a workbook) into its own staging database."""
+    filename: str
+    sheet_name: str | None = None
+    table_name: str | None = None
+    staging_path: str | None = None
+    error: str | None = None
+    parsed: bool = True
+
+    @property
+    def success(self) -> bool:
+        return self.staging_path is not None
+
+@traced
+def stage_file(file_input, table_name_base: str, chunksize: int | None = None, start_offset: int = 0) -> StagedTable:
+    """
+    Parses a CSV or Excel file into a table of a private, temporary SQLite database.
+
+    Staging keeps the CPU-heavy parsing independent of the shared database, so several files can be
+    parsed in parallel (e.g. in a process pool) and later written with `merge_staged_table`, one at a time.
+
+    Args:
+        file_input: A file path or a file-like object with a 'name' or 'filename' attribute.
+        table_name_base (str): The base name for the table (e.g., original filename without extension).
+        chunksize (int | None): The number of rows parsed and written per batch. Defaults to DEFAULT_CHUNK_SIZE.
+        start_offset (int): For CSV files, the byte offset of the first row to stage (see `parse_file_chunks`).
+
+    Returns:
+        StagedTable: Where the staged table lives, or why the file could not be staged.
+    """
+    # The parser (and pandas with it) is only imported where files are parsed, e.g. in ingest worker processes.
+    from .parser import parse_file_chunks, DEFAULT_CHUNK_SIZE
+
+    filename = getattr(file_input, 'name', None) or getattr(file_input, 'filename', None) or str(file_input)
+    chunks = parse_file_chunks(file_input, chunksize=chunksize or DEFAULT_CHUNK_SIZE, start_offset=start_offset)
+    if chunks is None:
+        return StagedTable(filename=filename, error="File could not be parsed. Check format/content.", parsed=False)
+
+    return _stage_chunks(chunks, table_name_base, filename)
+
+def _stage_chunks(chunks, table_name_base: str, filename: str, sheet_name: str | None = None, type_settings=None) -> StagedTable:
+    """Writes parsed chunks into a new staging database file."""
+    fd, staging_path = tempfile.mkstemp(prefix="datapal_staging_", suffix=".db")
+    os.close(fd)
+    # A staging database is private and disposable, so it needs no durable journal.
+    get_connection_manager(staging_path, journal_mode="MEMORY", synchronous="OFF", readers=1)
+    try:
+        success, actual_table_name, error_message = push_chunks_to_db(chunks, table_name_base, staging_path, type_settings)
+    finally:
+        close_connection_manager(staging_path)
+    if not success:
+        os.remove(staging_path)
+        return StagedTable(filename=filename, sheet_name=sheet_name, table_name=actual_table_name, error=error_message)
+    return StagedTable(filename=filename, sheet_name=sheet_name, table_name=actual_table_name, staging_path=staging_path)
+
+@traced
+def stage_workbook(file_input, table_name_base: str, chunksize: int | None = None) -> list[StagedTable]:
+    """
+    Stages every worksheet of an Excel workbook as its own table, named '<table_name_base>_<sheet name>'
+    (sanitized like any other table name). Each sheet is streamed in batches into its own staging database.
+
+    Args:
+        file_input: A workbook path or a file-like object with a 'name' or 'filename' attribute.
+        table_name_base (str): The base name for the tables (e.g., original filename without extension).
+        chunksize (int | None): The number of rows parsed and written per batch. Defaults to DEFAULT_CHUNK_SIZE.
+
+    Returns:
+        list[StagedTable]: One entry per worksheet, or a single unparsed entry if the workbook cannot be opened.
+    """
+    from .parser import iter_excel_sheets, DEFAULT_CHUNK_SIZE
+
+    filename = getattr(file_input, 'name', None) or getattr(file_input, 'filename', None) or str(file_input)
+    try:
+        sheets = iter_excel_sheets(file_input, chunksize=chunksize or DEFAULT_CHUNK_SIZE, all_sheets=True)
+    except Exception as e:
+        print(f"An error occurred while opening {filename}: {e}")
+        return [StagedTable(filename=filename, error="File could not be parsed. Check format/content.", parsed=False)]
+    return [
+        _stage_chunks(chunks, f"{table_name_base}_{sheet_name}", filename, sheet_name=sheet_name)
+        for sheet_name, chunks in sheets
+    ]
@@ -1,54 +1,77 @@
 import pandas as pd
 import os
-from io import BytesIO, StringIO
-import openpyxl
+import codecs
+from typing import Iterator
 from dotenv import load_dotenv
 
+from .tracing import traced
+
 load_dotenv()
 
-def parse_file(file_input) -> pd.DataFrame | None:
+# Number of rows read per chunk by the streaming ingest path.
+DEFAULT_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "50000"))
+
+def _latin1_fallback(error: UnicodeDecodeError) -> tuple[str, int]:
     """
-    Parses a CSV or Excel file from a file path or a file-like object into a pandas DataFrame.
+    Codec error handler that decodes the offending bytes as latin-1.
+    Lets a streamed CSV be read as UTF-8 without restarting when a stray latin-1 byte shows up mid-file.
+    """
+    return error.object[error.start:error.end].decode('latin1'), error.end
 
-    Args:
-        file_input: Either a string path to the CSV or Excel file, 
-                    or a file-like object (e.g., BytesIO, StringIO, Streamlit's UploadedFile).
+codecs.register_error('utf8_latin1_fallback', _latin1_fallback)
 
-    Returns:
-        pd.DataFrame: A pandas DataFrame containing the parsed data, 
-                      or None if the file type is unsupported or an error occurs.
+def _get_file_info(file_input) -> tuple[str | None, str | None]:
     """
-    file_extension = None
-    original_filename = None
+    Works out the original filename and lower-cased extension of a file path or file-like object.
 
+    Returns:
+        tuple[str | None, str | None]: (original_filename, file_extension), both None if the input type is not recognized.
+    """
     if hasattr(file_input, 'name'): # Check if it's a file-like object with a 'name' attribute (like Streamlit's UploadedFile)
         original_filename = file_input.name
-        file_extension = os.path.splitext(original_filename)[1].lower()
     elif hasattr(file_input, 'filename'): # Check for FastAPI's UploadFile
         original_filename = file_input.filename
-        file_extension = os.path.splitext(original_filename)[1].lower()
     elif isinstance(file_input, str):
         original_filename = file_input
-        file_extension = os.path.splitext(file_input)[1].lower()
     else:
+        return None, None
+    return original_filename, os.path.splitext(original_filename)[1].lower()
+
+def _can_memory_map(file_input) -> bool:
+    """
+    Whether pandas should read the input through a memory-mapped view of the file.
+    Only non-empty files on disk can be mapped; file-like objects are read as they are.
+    """
+    return isinstance(file_input, str) and os.path.getsize(file_input) > 0
+
+@traced
+def parse_file(file_input) -> pd.DataFrame | None:
+    """
+    Parses a CSV or Excel file from a file path or a file-like object into a pandas DataFrame.
+
+    Args:
+        file_input: Either a string path to the CSV or Excel file, 
+                    or a file-like object (e.g., BytesIO, StringIO, Streamlit's UploadedFile).
+
+    Returns:
+        pd.DataFrame: A pandas DataFrame containing the parsed data, 
+                      or None if the file type is unsupported or an error occurs.
+    """
+    original_filename, file_extension = _get_file_info(file_input)
+    if original_filename is None:
         print("Error: Input type not recognized. Must be a file path or a file-like object with a 'name' attribute.")
         return None
 
     try:
         if file_extension == '.csv':
-            if hasattr(file_input, 'getvalue') and isinstance(file_input.getvalue(), bytes):
-                if hasattr(file_input, 'seek'):
-                    file_input.seek(0)
-                try:
-                    df = pd.read_csv(StringIO(file_input.getvalue().decode('utf-8')))
-                except UnicodeDecodeError:
-                    if hasattr(file_input, 'seek'):
-                         file_input.seek(0)
-                    df = pd.read_csv(file_input, encoding='latin1') # Or let pandas infer
-            else: # It's a path or a text-based file-like object
-                 if hasattr(file_input, 'seek'):
-                    file_input.seek(0)
-                 df = pd.read_csv(file_input)
+            if hasattr(file_input, 'seek'):
+                file_input.seek(0)
+            df = pd.read_csv(
+                file_input,
+                encoding='utf-8',
+                encoding_errors='utf8_latin1_fallback',
+                memory_map=_can_memory_map(file_input),
+            )
             return df
         elif file_extension in ['.xls', '.xlsx']:
             if hasattr(file_input, 'seek'):
@@ -69,3 +92,165 @@ def parse_file(file_input) -> pd.DataFrame | None:
         if hasattr(file_input, 'type'):
             print(f"Uploaded file type was: {file_input.type}")
         return None
+
+
+def parse_file_chunks(file_input, chunksize: int = DEFAULT_CHUNK_SIZE, start_offset: int = 0) -> Iterator[pd.DataFrame] | None:
+    """
+    Parses a CSV or Excel file into an iterator of DataFrames of at most `chunksize` rows,
+    so that callers can process arbitrarily large files with bounded memory.
+
+    CSV files are read incrementally straight from the path (through a memory-mapped view of the file)
+    or file-like object; nothing is decoded up-front. Bytes that are not valid UTF-8 are decoded as latin-1.
+    For Excel workbooks only the first worksheet is read, streamed as by `iter_excel_sheets`.
+
+    With `start_offset`, only the CSV rows from that byte offset on are read (the header still names the
+    columns), e.g. the rows appended to a file since it was last loaded. The offset must be at a line start.
+
+    Args:
+        file_input: Either a string path to the CSV or Excel file, or a file-like object
+                    with a 'name' or 'filename' attribute.
+        chunksize (int): The maximum number of rows per yielded DataFrame.
+        start_offset (int): For CSV files, the byte offset of the first row to read.
+
+    Returns:
+        Iterator[pd.DataFrame] | None: An iterator over the parsed chunks,
+                                       or None if the file type is unsupported or the file cannot be opened.
+    """
+    original_filename, file_extension = _get_file_info(file_input)
+    if original_filename is None:
+        print("Error: Input type not recognized. Must be a file path or a file-like object with a 'name' attribute.")
+        return None
+
+    try:
+        if file_extension == '.csv':
+            if hasattr(file_input, 'seek'):
+                file_input.seek(0)
+            if start_offset:
+                return _read_csv_tail(file_input, chunksize, start_offset)
+            return pd.read_csv(
+                file_input,
+                chunksize=chunksize,
+                encoding='utf-8',
+                encoding_errors='utf8_latin1_fallback',
+                memory_map=_can_memory_map(file_input),
+            )
+        elif file_extension in ['.xls', '.xlsx']:
+            sheets = iter_excel_sheets(file_input, chunksize=chunksize, all_sheets=False)
+            return (chunk for _, chunks in sheets for chunk in chunks)
+        else:
+            print(f"Unsupported file type: {file_extension} for file {original_filename}")
+            return None
+    except FileNotFoundError:
+        print(f"Error: File not found at {original_filename}")
+        return None
+    except pd.errors.EmptyDataError:
+        print(f"Error: The file {original_filename} is empty.")
+        return None
+    except Exception as e:
+        print(f"An error occurred while opening {original_filename}: {e}")
+        return None
+
+def _read_csv_tail(file_input, chunksize: int, start_offset: int) -> Iterator[pd.DataFrame]:
+    """Reads the CSV rows from `start_offset` on, named after the file's header."""
+    columns = pd.read_csv(file_input, nrows=0, encoding='utf-8', encoding_errors='utf8_latin1_fallback').columns
+    source = open(file_input, 'rb') if isinstance(file_input, str) else file_input
+    source.seek(start_offset)
+    reader = pd.read_csv(
+        source,
+        chunksize=chunksize,
+        header=None,
+        names=list(columns),
+        encoding='utf-8',
+        encoding_errors='utf8_latin1_fallback',
+    )
+
+    def chunks():
+        try:
+            yield from reader
+        finally:
+            reader.close()
+            if source is not file_input:
+                source.close()
+    return chunks()
+
+def _header_names(header_row: tuple) -> list[str]:
+    """
+    Turns the first row of a worksheet into column names the way `pd.read_excel` does:
+    blank headers become 'Unnamed: <position>' and repeated headers get a '.1', '.2', ... suffix.
+    """
+    names = []
+    seen: dict[str, int] = {}
+    for position, value in enumerate(header_row):
+        name = f"Unnamed: {position}" if value is None else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+def _iter_worksheet_chunks(worksheet, chunksize: int) -> Iterator[pd.DataFrame]:
+    """
+    Streams the rows of a read-only worksheet as DataFrames of at most `chunksize` rows.
+    The first row is the header; fully blank rows are skipped.
+    """
+    rows = worksheet.iter_rows(values_only=True)
+    header_row = next(rows, None)
+    if header_row is None:
+        return
+    columns = _header_names(header_row)
+    width = len(columns)
+    batch = []
+    for row in rows:
+        if all(value is None for value in row):
+            continue
+        # Rows of read-only worksheets are not guaranteed to have the header's width.
+        row = tuple(row[:width]) + (None,) * (width - len(row))
+        batch.append(row)
+        if len(batch) >= chunksize:
+            yield pd.DataFrame(batch, columns=columns)
+            batch = []
+    if batch:
+        yield pd.DataFrame(batch, columns=columns)
+
+def _iter_workbook_sheets(workbook, chunksize: int, all_sheets: bool) -> Iterator[tuple[str, Iterator[pd.DataFrame]]]:
+    try:
+        worksheets = workbook.worksheets if all_sheets else workbook.worksheets[:1]
+        for worksheet in worksheets:
+            yield worksheet.title, _iter_worksheet_chunks(worksheet, chunksize)
+    finally:
+        workbook.close()
+
+def iter_excel_sheets(file_input, chunksize: int = DEFAULT_CHUNK_SIZE, all_sheets: bool = True) -> Iterator[tuple[str, Iterator[pd.DataFrame]]]:
+    """
+    Streams the worksheets of an Excel workbook as (sheet_name, chunk_iterator) pairs.
+
+    .xlsx workbooks are opened with openpyxl's read-only mode and their rows are read lazily in
+    batches of `chunksize`, so the workbook is never loaded into memory as a whole. Each chunk iterator
+    must be consumed before advancing to the next sheet. Legacy .xls workbooks are not supported by
+    openpyxl and are parsed whole, one chunk per sheet.
+
+    Args:
+        file_input: Either a string path to the workbook or a file-like object with a 'name' or 'filename' attribute.
+        chunksize (int): The maximum number of rows per yielded DataFrame.
+        all_sheets (bool): Whether to yield every worksheet, or only the first one.
+
+    Returns:
+        Iterator[tuple[str, Iterator[pd.DataFrame]]]: The worksheets, in workbook order.
+
+    Raises:
+        Exception: If the workbook cannot be opened. This happens eagerly, before the first sheet is read.
+    """
+    _, file_extension = _get_file_info(file_input)
+    if hasattr(file_input, 'seek'):
+        file_input.seek(0)
+    if file_extension == '.xls':
+        excel_file = pd.ExcelFile(file_input)
+        sheet_names = excel_file.sheet_names if all_sheets else excel_file.sheet_names[:1]
+        return ((sheet_name, iter([excel_file.parse(sheet_name)])) for sheet_name in sheet_names)
+
+    import openpyxl # Only needed for .xlsx workbooks, so imported on first use.
+
+    workbook = openpyxl.load_workbook(file_input, read_only=True, data_only=True)
+    return _iter_workbook_sheets(workbook, chunksize, all_sheets)
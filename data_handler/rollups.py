@@ -0,0 +1,329 @@
+"""
+Materialized rollups (pre-aggregations) of large uploaded tables.
+
+Most questions about a table count or sum rows per value of one or two low-cardinality columns, which
+scans the whole table every time. When a large table is written, `build_table_rollups` pre-aggregates it:
+it picks the low-cardinality columns as dimensions and the numeric columns other than keys as measures, and stores, for
+all dimensions together, every pair of them and every single one, the row count and the sum, non-null count, minimum and
+maximum of each measure per group. The agent rewrites eligible GROUP BY queries to read a rollup instead
+of the table (`agent/utils/rollup_rewrite.py`).
+
+A rollup records the catalog version of the table it was built from, and is only used while the table is
+still at that version: any write makes its rollups stale until they are rebuilt at the end of the write.
+All rollups of a database fit in `RollupSettings.storage_budget` bytes.
+
+Rollups are stored in internal tables named `_datapal_rollup_<table>__<dimension>[__<dimension>]` and
+listed in an internal table, which `get_table_rollups` reads.
+"""
+import json
+import os
+import sqlite3
+from dataclasses import dataclass, fields
+from datetime import datetime, timezone
+from itertools import combinations
+
+from dotenv import load_dotenv
+
+from .catalog import CATALOG_TABLE, INTERNAL_TABLE_PREFIX
+from .connection import get_connection_manager
+from .tracing import traced
+
+load_dotenv()
+
+ROLLUP_TABLE = f"{INTERNAL_TABLE_PREFIX}rollups"
+ROLLUP_PREFIX = f"{INTERNAL_TABLE_PREFIX}rollup_"
+# The column holding each group's row count. Sanitized column names never start with an underscore.
+ROWS_COLUMN = "__rows"
+MEASURE_AGGREGATES = ("sum", "count", "min", "max")
+_NUMERIC_TYPES = ("INT", "REAL", "FLOA", "DOUB", "NUM", "DEC")
+# Columns whose values average more than this many characters hold free text, which is never a dimension.
+_FREE_TEXT_LENGTH = 64
+
+@dataclass(kw_only=True)
+class RollupSettings:
+    """Which tables are pre-aggregated, and how. Every field can be overridden by an environment variable
+    named after it, prefixed with 'ROLLUP_' (e.g. ROLLUP_STORAGE_BUDGET)."""
+    enabled: bool = True              # build rollups of large tables when they are written
+    min_rows: int = 100000            # tables with fewer rows are cheap enough to scan
+    max_dimensions: int = 3           # low-cardinality columns grouped on per table, fewest values first
+    max_dimension_values: int = 1000  # most distinct values (in a sample) a dimension may have
+    max_measures: int = 8             # numeric columns aggregated per table
+    max_rollup_rows: int = 100000     # most groups a rollup may have...
+    max_row_ratio: float = 0.1        # ...and at most this many per row of its table
+    storage_budget: int = 67108864    # bytes all rollups of a database may take, 64 MiB
+    sample_rows: int = 10000          # rows sampled to pick a table's dimensions
+
+    @classmethod
+    def from_env(cls, **overrides) -> "RollupSettings":
+        """Create settings from the environment, with explicit overrides taking precedence."""
+        values = {}
+        for f in fields(cls):
+            env_value = os.environ.get(f"ROLLUP_{f.name.upper()}")
+            if env_value is None:
+                continue
+            if f.type in (bool, "bool"):
+                values[f.name] = env_value.strip().lower() in ("1", "true", "yes", "on")
+            elif f.type in (float, "float"):
+                values[f.name] = float(env_value)
+            else:
+                values[f.name] = int(env_value)
+        values.update(overrides)
+        return cls(**values)
+
+@dataclass
+class Rollup:
+    """A rollup of a table: one row per group of `dimensions`, with the aggregates of `measures`."""
+    name: str
+    table_name: str
+    dimensions: list[str]
+    measures: list[str]
+    version: int
+    row_count: int
+    size_bytes: int
+    built_at: str
+
+    def to_dict(self) -> dict:
+        return {field.name: getattr(self, field.name) for field in fields(self)}
+
+def measure_column(measure: str, aggregate: str) -> str:
+    """The rollup column holding an aggregate ('sum', 'count', 'min' or 'max') of a measure."""
+    return f"{measure}__{aggregate}"
+
+def rollup_name(table_name: str, dimensions: tuple[str, ...]) -> str:
+    return f"{ROLLUP_PREFIX}{table_name}__{'__'.join(dimensions)}"
+
+def ensure_rollup_table(conn: sqlite3.Connection) -> None:
+    """Creates the table listing the rollups if it does not exist yet. Needs a writable connection."""
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{ROLLUP_TABLE}" (
+            rollup_name TEXT PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            dimensions TEXT NOT NULL,
+            measures TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            row_count INTEGER NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            built_at TEXT NOT NULL
+        )
+    """)
+
+def drop_table_rollups(conn: sqlite3.Connection, table_name: str) -> None:
+    """Drops the rollups of a table. Call on the writer connection, inside a transaction."""
+    ensure_rollup_table(conn)
+    for (name,) in conn.execute(f'SELECT rollup_name FROM "{ROLLUP_TABLE}" WHERE table_name = ?', (table_name,)).fetchall():
+        conn.execute(f'DROP TABLE IF EXISTS "{name}"')
+    conn.execute(f'DELETE FROM "{ROLLUP_TABLE}" WHERE table_name = ?', (table_name,))
+
+def _is_numeric_type(declared_type: str) -> bool:
+    declared_type = (declared_type or "").upper()
+    return any(marker in declared_type for marker in _NUMERIC_TYPES)
+
+def _choose_columns(conn: sqlite3.Connection, table_name: str, columns: list[tuple[str, str]], settings: RollupSettings) -> tuple[list[str], list[str]]:
+    """
+    Picks a table's dimensions, the non-REAL columns with few distinct values in a sample of its rows (fewest
+    first), and its measures, the other numeric columns. Non-REAL columns with a distinct value in every
+    sampled row are keys (e.g. an id) rather than measures, and are left out; REAL measures, such as amounts,
+    often have one too.
+    """
+    select_list = ", ".join(f'COUNT(DISTINCT "{name}"), AVG(LENGTH("{name}"))' for name, _ in columns)
+    stats = conn.execute(
+        f'SELECT COUNT(*), {select_list} FROM (SELECT * FROM "{table_name}" LIMIT ?)', (settings.sample_rows,)
+    ).fetchone()
+    sampled = stats[0]
+    distinct_counts = {name: stats[1 + 2 * position] for position, (name, _) in enumerate(columns)}
+    continuous = {
+        name for name, declared_type in columns
+        if any(marker in (declared_type or "").upper() for marker in ("REAL", "FLOA", "DOUB"))
+    }
+    dimensions = []
+    for position, (name, _) in enumerate(columns):
+        if name in continuous:
+            continue
+        distinct, average_length = distinct_counts[name], stats[2 + 2 * position]
+        if 0 < distinct <= settings.max_dimension_values and (average_length or 0) <= _FREE_TEXT_LENGTH:
+            dimensions.append((distinct, name))
+    dimensions = [name for _, name in sorted(dimensions)[: settings.max_dimensions]]
+    measures = [
+        name for name, declared_type in columns
+        if _is_numeric_type(declared_type) and name not in dimensions
+        and (name in continuous or sampled < 2 or distinct_counts[name] < sampled)
+    ][: settings.max_measures]
+    return dimensions, measures
+
+def _aggregate_sql(source: str, dimensions: tuple[str, ...], measures: list[str], from_rollup: bool) -> str:
+    """The query grouping `source` (the table, or a finer rollup of it) by `dimensions`."""
+    select_list = [f'"{name}"' for name in dimensions]
+    if from_rollup:
+        select_list.append(f'SUM("{ROWS_COLUMN}")')
+        for measure in measures:
+            select_list += [
+                f'SUM("{measure_column(measure, "sum")}")',
+                f'SUM("{measure_column(measure, "count")}")',
+                f'MIN("{measure_column(measure, "min")}")',
+                f'MAX("{measure_column(measure, "max")}")',
+            ]
+    else:
+        select_list.append("COUNT(*)")
+        for measure in measures:
+            select_list += [f'SUM("{measure}")', f'COUNT("{measure}")', f'MIN("{measure}")', f'MAX("{measure}")']
+    group_by = ", ".join(f'"{name}"' for name in dimensions)
+    return f'SELECT {", ".join(select_list)} FROM "{source}" GROUP BY {group_by}'
+
+def _grains(dimensions: list[str]) -> list[tuple[str, ...]]:
+    """Every grouping of a table's dimensions a rollup is built for: all of them, then every pair, then each one."""
+    grains = [tuple(dimensions)] if dimensions else []
+    if len(dimensions) > 2:
+        grains += list(combinations(dimensions, 2))
+    if len(dimensions) > 1:
+        grains += [(dimension,) for dimension in dimensions]
+    return grains
+
+def _create_rollup_table(conn: sqlite3.Connection, name: str, dimensions: tuple[str, ...], measures: list[str], column_types: dict[str, str]) -> None:
+    columns = [f'"{dimension}" {column_types.get(dimension) or ""}'.rstrip() for dimension in dimensions]
+    columns.append(f'"{ROWS_COLUMN}" INTEGER')
+    for measure in measures:
+        measure_type = column_types.get(measure) or ""
+        columns += [
+            f'"{measure_column(measure, "sum")}" {measure_type}'.rstrip(),
+            f'"{measure_column(measure, "count")}" INTEGER',
+            f'"{measure_column(measure, "min")}" {measure_type}'.rstrip(),
+            f'"{measure_column(measure, "max")}" {measure_type}'.rstrip(),
+        ]
+    conn.execute(f'CREATE TABLE "{name}" ({", ".join(columns)})')
+
+def _table_size(conn: sqlite3.Connection, name: str, row_count: int, column_count: int) -> int:
+    """The bytes a table takes, from the dbstat table where SQLite was built with it, or else estimated."""
+    try:
+        size = conn.execute("SELECT SUM(pgsize) FROM dbstat WHERE name = ?", (name,)).fetchone()[0]
+        if size is not None:
+            return size
+    except sqlite3.Error:
+        pass
+    return int(row_count * (column_count * 9 + 12) * 1.1)
+
+@traced
+def build_table_rollups(db_path: str, table_name: str, settings: RollupSettings | None = None) -> list[Rollup]:
+    """
+    Builds (or rebuilds) the rollups of a table after it was written, replacing its previous ones.
+
+    A rollup is built for all of the table's dimensions together, for every pair of them and for every single
+    dimension. The table itself is scanned as few times as possible: once, grouped by all dimensions, when
+    that rollup is small enough, and every coarser rollup is aggregated from the smallest finer one.
+    Rollups with more than `max_rollup_rows` groups, or more than `max_row_ratio` groups per table row, are
+    skipped, and the largest ones are dropped until every rollup of the database fits the storage budget.
+    Tables with fewer than `min_rows` rows, or without low-cardinality columns, get no rollups.
+    The table is aggregated on a reader; if it is written meanwhile, nothing is stored, as that write
+    rebuilds the rollups itself.
+
+    Returns:
+        list[Rollup]: The rollups built; empty when rollups are disabled or the table does not qualify.
+    """
+    settings = settings or RollupSettings.from_env()
+    if not settings.enabled:
+        return []
+    manager = get_connection_manager(db_path)
+    try:
+        with manager.reader() as conn:
+            conn.execute("BEGIN")
+            try:
+                entry = conn.execute(
+                    f'SELECT columns, row_count, version FROM "{CATALOG_TABLE}" WHERE table_name = ?', (table_name,)
+                ).fetchone()
+                grains: dict[tuple[str, ...], list[tuple]] = {}
+                dimensions, measures, version = [], [], None
+                if entry is not None and entry[1] >= settings.min_rows:
+                    columns = [tuple(column) for column in json.loads(entry[0])]
+                    version = entry[2]
+                    dimensions, measures = _choose_columns(conn, table_name, columns, settings)
+                    max_groups = min(settings.max_rollup_rows, int(entry[1] * settings.max_row_ratio))
+                    # The table is scanned once, grouped by all dimensions, if that is small enough; coarser
+                    # groupings are then aggregated from that rollup. Otherwise by pairs, then by single dimensions.
+                    for grain in _grains(dimensions):
+                        if any(set(grain) <= set(scanned) for scanned in grains):
+                            continue
+                        rows = conn.execute(f"{_aggregate_sql(table_name, grain, measures, False)} LIMIT ?", (max_groups + 1,)).fetchall()
+                        if len(rows) <= max_groups:
+                            grains[grain] = rows
+            finally:
+                conn.rollback()
+
+        with manager.writer() as conn:
+            conn.execute("BEGIN")
+            current = conn.execute(f'SELECT version FROM "{CATALOG_TABLE}" WHERE table_name = ?', (table_name,)).fetchone()
+            if current is not None and version is not None and current[0] != version:
+                conn.rollback()
+                return []
+            drop_table_rollups(conn, table_name)
+            if not grains and not dimensions:
+                conn.commit()
+                return []
+            column_types = {name: declared_type for name, declared_type in columns}
+            built_at = datetime.now(timezone.utc).isoformat()
+            rollups = []
+            for grain, rows in grains.items():
+                name = rollup_name(table_name, grain)
+                _create_rollup_table(conn, name, grain, measures, column_types)
+                if rows:
+                    placeholders = ", ".join("?" for _ in rows[0])
+                    conn.executemany(f'INSERT INTO "{name}" VALUES ({placeholders})', rows)
+                rollups.append((grain, name, len(rows)))
+            for grain in _grains(dimensions):
+                sources = sorted((row_count, name) for scanned, name, row_count in rollups if set(grain) < set(scanned))
+                if grain in grains or not sources:
+                    continue
+                name = rollup_name(table_name, grain)
+                _create_rollup_table(conn, name, grain, measures, column_types)
+                cursor = conn.execute(f'INSERT INTO "{name}" {_aggregate_sql(sources[0][1], grain, measures, True)}')
+                rollups.append((grain, name, cursor.rowcount))
+
+            ensure_rollup_table(conn)
+            used_bytes = conn.execute(f'SELECT COALESCE(SUM(size_bytes), 0) FROM "{ROLLUP_TABLE}"').fetchone()[0]
+            column_count = len(measures) * len(MEASURE_AGGREGATES) + 1
+            sized = [
+                (_table_size(conn, name, row_count, len(grain) + column_count), grain, name, row_count)
+                for grain, name, row_count in rollups
+            ]
+            built = []
+            # Smallest first: they answer the most queries and leave the most room.
+            for size, grain, name, row_count in sorted(sized):
+                if used_bytes + size > settings.storage_budget:
+                    conn.execute(f'DROP TABLE "{name}"')
+                    continue
+                used_bytes += size
+                rollup = Rollup(name, table_name, list(grain), measures, version, row_count, size, built_at)
+                conn.execute(
+                    f'INSERT INTO "{ROLLUP_TABLE}" (rollup_name, table_name, dimensions, measures, version, row_count, size_bytes, built_at) '
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (name, table_name, json.dumps(rollup.dimensions), json.dumps(measures), version, row_count, size, built_at),
+                )
+                built.append(rollup)
+            conn.commit()
+        if built:
+            print(f"Built {len(built)} rollups of '{table_name}': {', '.join(rollup.name for rollup in built)}")
+        return built
+    except sqlite3.Error as e:
+        print(f"Could not build the rollups of '{table_name}': {e}")
+        return []
+
+def _read_rollups(conn: sqlite3.Connection, where: str, params: tuple) -> list[Rollup]:
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (ROLLUP_TABLE,)).fetchone() is None:
+        return []
+    rows = conn.execute(
+        f'SELECT r.rollup_name, r.table_name, r.dimensions, r.measures, r.version, r.row_count, r.size_bytes, r.built_at '
+        f'FROM "{ROLLUP_TABLE}" AS r JOIN "{CATALOG_TABLE}" AS c ON c.table_name = r.table_name AND c.version = r.version '
+        f"WHERE {where} ORDER BY r.row_count",
+        params,
+    ).fetchall()
+    return [Rollup(row[0], row[1], json.loads(row[2]), json.loads(row[3]), *row[4:]) for row in rows]
+
+@traced
+def get_table_rollups(table_name: str, db_path: str) -> list[Rollup]:
+    """The rollups of a table built from its current version, which can answer its queries; smallest first."""
+    with get_connection_manager(db_path).reader() as conn:
+        return _read_rollups(conn, "r.table_name = ?", (table_name,))
+
+@traced
+def get_rollup_report(db_path: str) -> list[Rollup]:
+    """Lists the current rollups of every table of a database."""
+    with get_connection_manager(db_path).reader() as conn:
+        return _read_rollups(conn, "1", ())
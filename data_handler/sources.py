@@ -0,0 +1,145 @@
+"""
+Fingerprints of the files tables were loaded from, so that re-uploads can be skipped or loaded incrementally.
+
+A table's source fingerprint is recorded in the same transaction as the write that loaded it, and forgotten
+by any write that did not come from a file. When a file is uploaded again, `plan_source_load` compares it
+with the recorded fingerprint:
+- a byte-identical file needs no write at all;
+- a CSV file that only grew at the end (the old file is a byte prefix of the new one and ended on a line
+  break) only needs the rows after the old end, which start at a known byte offset;
+- anything else is loaded in full.
+"""
+import hashlib
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Literal
+
+from .catalog import INTERNAL_TABLE_PREFIX
+from .connection import get_connection_manager
+from .tracing import traced
+
+SOURCES_TABLE = f"{INTERNAL_TABLE_PREFIX}sources"
+_READ_BLOCK_SIZE = 1024 * 1024
+
+@dataclass
+class SourceFile:
+    """The fingerprint of a file a table was loaded from."""
+    content_hash: str                 # SHA-256 of the whole file
+    size_bytes: int
+    ends_with_newline: bool
+    prefix_hash: str | None = None    # SHA-256 of the file's first bytes, as many as the previous source had
+
+class SourceHasher:
+    """
+    Fingerprints a file from its bytes, fed in order with `update` (e.g. while an upload is spooled to disk).
+    With `prefix_size`, the first `prefix_size` bytes are also hashed on their own, so that the file can be
+    compared with a previous, shorter version in the same pass.
+    """
+
+    def __init__(self, prefix_size: int | None = None):
+        self._hash = hashlib.sha256()
+        self._prefix_hash = hashlib.sha256() if prefix_size else None
+        self._prefix_size = prefix_size or 0
+        self._size = 0
+        self._last_byte = b""
+
+    def update(self, data: bytes) -> None:
+        if not data:
+            return
+        if self._prefix_hash is not None and self._size < self._prefix_size:
+            self._prefix_hash.update(data[: self._prefix_size - self._size])
+        self._hash.update(data)
+        self._size += len(data)
+        self._last_byte = data[-1:]
+
+    def result(self) -> SourceFile:
+        return SourceFile(
+            content_hash=self._hash.hexdigest(),
+            size_bytes=self._size,
+            ends_with_newline=self._last_byte == b"\n",
+            prefix_hash=self._prefix_hash.hexdigest() if self._prefix_hash is not None and self._size >= self._prefix_size else None,
+        )
+
+def fingerprint_file(path: str, prefix_size: int | None = None) -> SourceFile:
+    """Fingerprints a file on disk. See `SourceHasher` for `prefix_size`."""
+    hasher = SourceHasher(prefix_size)
+    with open(path, "rb") as f:
+        while block := f.read(_READ_BLOCK_SIZE):
+            hasher.update(block)
+    return hasher.result()
+
+@dataclass
+class SourceLoadPlan:
+    """How a file should be loaded into a table, given the file the table was last loaded from."""
+    action: Literal["skip", "append_tail", "full"]
+    offset: int = 0   # for 'append_tail': the byte offset where the new rows start
+
+def plan_source_load(previous: SourceFile | None, source: SourceFile, appendable: bool) -> SourceLoadPlan:
+    """
+    Decides how to load `source` into a table last loaded from `previous`.
+
+    Args:
+        previous (SourceFile | None): The table's recorded source, or None if it has none (or does not exist).
+        source (SourceFile): The new file's fingerprint, with its prefix hashed to the previous source's size.
+        appendable (bool): Whether rows can be read from a byte offset of the file, i.e. it is a CSV file.
+
+    Returns:
+        SourceLoadPlan: 'skip' for an identical file, 'append_tail' for a file that only grew at the end,
+                        'full' otherwise.
+    """
+    if previous is None:
+        return SourceLoadPlan("full")
+    if source.content_hash == previous.content_hash and source.size_bytes == previous.size_bytes:
+        return SourceLoadPlan("skip")
+    if (
+        appendable
+        and previous.ends_with_newline
+        and source.size_bytes > previous.size_bytes
+        and source.prefix_hash == previous.content_hash
+    ):
+        return SourceLoadPlan("append_tail", offset=previous.size_bytes)
+    return SourceLoadPlan("full")
+
+def ensure_sources_table(conn: sqlite3.Connection) -> None:
+    """Creates the sources table if it does not exist yet. Needs a writable connection."""
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{SOURCES_TABLE}" (
+            table_name TEXT PRIMARY KEY,
+            content_hash TEXT NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            ends_with_newline INTEGER NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    """)
+
+def record_source(conn: sqlite3.Connection, table_name: str, source: SourceFile | None) -> None:
+    """
+    Records the file a table was just loaded from, or forgets the table's source if `source` is None.
+    Call on the writer connection, inside the transaction that wrote the table.
+    """
+    ensure_sources_table(conn)
+    if source is None:
+        conn.execute(f'DELETE FROM "{SOURCES_TABLE}" WHERE table_name = ?', (table_name,))
+        return
+    conn.execute(
+        f'INSERT OR REPLACE INTO "{SOURCES_TABLE}" (table_name, content_hash, size_bytes, ends_with_newline, updated_at) '
+        "VALUES (?, ?, ?, ?, ?)",
+        (table_name, source.content_hash, source.size_bytes, int(source.ends_with_newline),
+         datetime.now(timezone.utc).isoformat()),
+    )
+
+@traced
+def get_table_source(table_name: str, db_path: str) -> SourceFile | None:
+    """Returns the fingerprint of the file a table was last loaded from, if it still exists and has one."""
+    with get_connection_manager(db_path).reader() as conn:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (SOURCES_TABLE,)).fetchone() is None:
+            return None
+        row = conn.execute(
+            f'SELECT content_hash, size_bytes, ends_with_newline FROM "{SOURCES_TABLE}" AS s '
+            "WHERE table_name = ? AND EXISTS (SELECT 1 FROM sqlite_master WHERE name = s.table_name)",
+            (table_name,),
+        ).fetchone()
+    if row is None:
+        return None
+    return SourceFile(content_hash=row[0], size_bytes=row[1], ends_with_newline=bool(row[2]))
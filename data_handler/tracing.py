@@ -0,0 +1,283 @@
+"""
+Lightweight tracing and Prometheus metrics, without third-party dependencies.
+
+Work is timed in two ways:
+- `traced` wraps a function and records its wall time under the function's name.
+- `span` opens a named span (e.g. one agent graph node) that collects the timings of the traced
+  functions it calls, plus amounts recorded with `record` (LLM tokens) and `record_query` (SQL rows and
+  bytes). A finished span can be sent to another process as a dict and recorded there with `observe_span`.
+
+Timings made outside any span go straight to the process's `metrics` registry; timings made inside a
+span are recorded when the span is observed, so nothing is counted twice. `metrics.render()` returns every
+metric in the Prometheus text exposition format.
+"""
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+# Key of the custom stream events in which the agent sends each finished node's span to the web app.
+TRACE_EVENT_KEY = "datapal_trace"
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+BYTES_BUCKETS = (0, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labelnames: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Counter:
+    """A monotonically increasing value per label combination."""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    """Observations counted into cumulative buckets per label combination, with their sum and count."""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple = SECONDS_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: dict[tuple, list] = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, state):
+                    labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {state[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+class MetricsRegistry:
+    """The metrics of one process, rendered together for a `/metrics` endpoint."""
+
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple = SECONDS_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+FUNCTION_SECONDS = metrics.histogram(
+    "datapal_function_seconds", "Wall time of data_handler functions.", ("function",)
+)
+NODE_SECONDS = metrics.histogram(
+    "datapal_node_seconds", "Wall time of agent graph nodes.", ("node",)
+)
+LLM_TOKENS = metrics.counter(
+    "datapal_llm_tokens_total", "LLM tokens used by agent graph nodes.", ("node", "direction")
+)
+SQL_ROWS_RETURNED = metrics.histogram(
+    "datapal_sql_rows_returned", "Rows returned per agent query.", ("node",), COUNT_BUCKETS
+)
+SQL_VM_STEPS = metrics.histogram(
+    "datapal_sql_vm_steps",
+    "SQLite virtual machine instructions per agent query, a proxy for the rows it scanned.",
+    ("node",),
+    COUNT_BUCKETS,
+)
+SQL_RESULT_BYTES = metrics.histogram(
+    "datapal_sql_result_bytes", "Bytes of query results serialized for the model.", ("node",), BYTES_BUCKETS
+)
+
+@dataclass
+class Span:
+    """The work done by one named unit, such as an agent graph node."""
+    name: str
+    seconds: float = 0.0
+    counts: dict[str, float] = field(default_factory=dict)            # e.g. llm_input_tokens
+    functions: dict[str, list[float]] = field(default_factory=dict)   # function -> [calls, seconds]
+    queries: list[dict] = field(default_factory=list)                 # rows_returned, vm_steps, result_bytes
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "seconds": self.seconds,
+            "counts": dict(self.counts),
+            "functions": {name: list(value) for name, value in self.functions.items()},
+            "queries": list(self.queries),
+        }
+
+_current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar("datapal_span", default=None)
+_span_lock = threading.Lock()  # spans are shared with the worker threads their node starts
+
+def current_span() -> Span | None:
+    return _current_span.get()
+
+@contextmanager
+def span(name: str) -> Iterator[Span]:
+    """Times the enclosed block as a span, collecting what is recorded while it runs."""
+    current = Span(name)
+    token = _current_span.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.seconds = time.perf_counter() - start
+        _current_span.reset(token)
+
+def record_function(name: str, seconds: float) -> None:
+    current = _current_span.get()
+    if current is None:
+        FUNCTION_SECONDS.observe(seconds, function=name)
+        return
+    with _span_lock:
+        calls = current.functions.setdefault(name, [0, 0.0])
+        calls[0] += 1
+        calls[1] += seconds
+
+def record(**amounts: float) -> None:
+    """Adds amounts such as `llm_input_tokens=120` to the current span. Does nothing outside a span."""
+    current = _current_span.get()
+    if current is None:
+        return
+    with _span_lock:
+        for name, amount in amounts.items():
+            current.counts[name] = current.counts.get(name, 0) + amount
+
+def record_query(rows_returned: int, vm_steps: int, result_bytes: int) -> None:
+    """Records the size of one executed query, in the current span if there is one."""
+    query = {"rows_returned": rows_returned, "vm_steps": vm_steps, "result_bytes": result_bytes}
+    current = _current_span.get()
+    if current is None:
+        _observe_query(query, "")
+        return
+    with _span_lock:
+        current.queries.append(query)
+
+def _observe_query(query: dict, node: str) -> None:
+    SQL_ROWS_RETURNED.observe(query.get("rows_returned") or 0, node=node)
+    SQL_VM_STEPS.observe(query.get("vm_steps") or 0, node=node)
+    SQL_RESULT_BYTES.observe(query.get("result_bytes") or 0, node=node)
+
+def observe_span(span_data: dict) -> None:
+    """Records a finished span (as returned by `Span.to_dict`) in this process's metrics."""
+    node = span_data.get("name", "")
+    NODE_SECONDS.observe(span_data.get("seconds", 0.0), node=node)
+    counts = span_data.get("counts") or {}
+    for direction in ("input", "output"):
+        tokens = counts.get(f"llm_{direction}_tokens")
+        if tokens:
+            LLM_TOKENS.inc(tokens, node=node, direction=direction)
+    for function, (calls, seconds) in (span_data.get("functions") or {}).items():
+        # Only the total is known per function, so the calls are observed at their mean duration.
+        for _ in range(int(calls)):
+            FUNCTION_SECONDS.observe(seconds / calls, function=function)
+    for query in span_data.get("queries") or []:
+        _observe_query(query, node)
+
+def summarize_spans(spans: list[dict]) -> dict:
+    """
+    Sums the spans of one agent run per node, e.g. for attaching a breakdown to the run.
+
+    Returns:
+        dict: `nodes` maps each node to its calls, seconds, LLM tokens and query totals, in the order the
+        nodes first ran; `total` holds the same sums over the whole run.
+    """
+    def empty() -> dict:
+        return {
+            "calls": 0, "seconds": 0.0, "llm_input_tokens": 0, "llm_output_tokens": 0,
+            "queries": 0, "rows_returned": 0, "vm_steps": 0, "result_bytes": 0,
+        }
+
+    nodes: dict[str, dict] = {}
+    total = empty()
+    for span_data in spans:
+        node = nodes.setdefault(span_data.get("name", ""), empty())
+        counts = span_data.get("counts") or {}
+        queries = span_data.get("queries") or []
+        for summary in (node, total):
+            summary["calls"] += 1
+            summary["seconds"] += span_data.get("seconds", 0.0)
+            summary["llm_input_tokens"] += counts.get("llm_input_tokens", 0)
+            summary["llm_output_tokens"] += counts.get("llm_output_tokens", 0)
+            summary["queries"] += len(queries)
+            for key in ("rows_returned", "vm_steps", "result_bytes"):
+                summary[key] += sum(query.get(key) or 0 for query in queries)
+    for summary in (*nodes.values(), total):
+        summary["seconds"] = round(summary["seconds"], 6)
+    return {"nodes": nodes, "total": total}
+
+def traced(func: Callable[..., T]) -> Callable[..., T]:
+    """Records the wall time of every call of `func` under its name."""
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record_function(name, time.perf_counter() - start)
+
+    return wrapper
@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+# The agent's modules import each other as top-level modules, as the LangGraph server loads them.
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+for path in (PROJECT_ROOT, PROJECT_ROOT / "agent"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
@@ -0,0 +1,83 @@
+import sqlite3
+
+import pytest
+
+from data_handler.rollups import Rollup, _aggregate_sql, _create_rollup_table
+from utils.rollup_rewrite import rewrite_for_rollup
+
+ROWS = [
+    ("north", 2023, 10.0, 1),
+    ("north", 2023, 2.5, 4),
+    ("north", 2024, None, 7),
+    ("south", 2023, 4.0, None),
+    ("south", 2024, 8.0, 2),
+    ("south", 2024, 1.5, 9),
+    (None, 2024, 3.0, 5),
+]
+
+@pytest.fixture
+def db():
+    """A table and its rollup by region and year, with amount and qty as measures."""
+    conn = sqlite3.connect(":memory:")
+    conn.execute('CREATE TABLE sales ("region" TEXT, "year" INTEGER, "amount" REAL, "qty" INTEGER, "note" TEXT)')
+    conn.executemany("INSERT INTO sales VALUES (?, ?, ?, ?, 'x')", ROWS)
+    rollup = Rollup(
+        name="_datapal_rollup_sales__region__year", table_name="sales", dimensions=["region", "year"],
+        measures=["amount", "qty"], version=1, row_count=0, size_bytes=0, built_at="",
+    )
+    column_types = {"region": "TEXT", "year": "INTEGER", "amount": "REAL", "qty": "INTEGER"}
+    _create_rollup_table(conn, rollup.name, ("region", "year"), rollup.measures, column_types)
+    conn.execute(f'INSERT INTO "{rollup.name}" {_aggregate_sql("sales", ("region", "year"), rollup.measures, False)}')
+    yield conn, rollup
+    conn.close()
+
+def assert_same_answer(db, sql):
+    conn, rollup = db
+    rewritten = rewrite_for_rollup(sql, "sales", rollup)
+    assert rewritten is not None and rollup.name in rewritten
+    expected = conn.execute(sql).fetchall()
+    actual = conn.execute(rewritten).fetchall()
+    assert len(actual) == len(expected)
+    for actual_row, expected_row in zip(actual, expected):
+        assert actual_row == pytest.approx(expected_row)
+
+@pytest.mark.parametrize("sql", [
+    "SELECT region, AVG(amount) FROM sales GROUP BY region ORDER BY region",
+    "SELECT year, AVG(qty), AVG(year) FROM sales GROUP BY year ORDER BY year",
+    "SELECT AVG(amount) FROM sales WHERE region = 'south'",
+])
+def test_reaggregates_avg(db, sql):
+    assert_same_answer(db, sql)
+
+@pytest.mark.parametrize("sql", [
+    "SELECT region, COUNT(*) FROM sales GROUP BY region ORDER BY region",
+    "SELECT year, COUNT(amount), COUNT(qty), COUNT(region) FROM sales GROUP BY year ORDER BY year",
+    "SELECT COUNT(*) FROM sales WHERE year = 2024 AND region = 'north'",
+    "SELECT COUNT(DISTINCT region) FROM sales",
+])
+def test_reaggregates_count(db, sql):
+    assert_same_answer(db, sql)
+
+@pytest.mark.parametrize("sql", [
+    "SELECT region, MIN(amount), MAX(amount), MIN(qty), MAX(qty) FROM sales GROUP BY region ORDER BY region",
+    "SELECT MIN(year), MAX(year), SUM(qty), TOTAL(amount) FROM sales WHERE region = 'north'",
+])
+def test_reaggregates_min_max(db, sql):
+    assert_same_answer(db, sql)
+
+@pytest.mark.parametrize("sql", [
+    # Filters on columns that are not dimensions: the rollup no longer has their rows.
+    "SELECT region, SUM(qty) FROM sales WHERE amount > 3 GROUP BY region",
+    "SELECT COUNT(*) FROM sales WHERE qty = 4",
+    "SELECT region, COUNT(*) FROM sales WHERE note = 'x' GROUP BY region",
+    "SELECT region, SUM(amount) FROM sales GROUP BY region ORDER BY qty",
+    # COUNT(1) would count the rollup's groups, not the table's rows.
+    "SELECT region, COUNT(1) FROM sales GROUP BY region",
+    "SELECT group_concat(region) FROM sales",
+    "SELECT region, COUNT(*) FROM sales GROUP BY region HAVING COUNT(*) > 2",
+    "SELECT region, SUM(amount * qty) FROM sales GROUP BY region",
+    "SELECT region, amount FROM sales",
+])
+def test_refuses_what_the_rollup_cannot_answer(db, sql):
+    _, rollup = db
+    assert rewrite_for_rollup(sql, "sales", rollup) is None